@@ -1,32 +1,91 @@
+import uuid
 import streamlit as st
-from sqlalchemy import text
-from database.db_utils import get_duckdb_conn, sqlite_engine
-from database.schema_duckdb import create_duckdb_schema
-from database.populate_duckdb import populate_duckdb
-from database.schema_sqlite import create_sqlite_schema
-import pandas as pd
+from database.db_utils import duckdb_manager
+from database import data_version
+from database.table_browser import fetch_page, list_tables
+from database.conversation_store import PAGE_TURNS, append_turn, load_turns, update_row_count
+from database.result_handle import PAGE_ROWS
 # from setup_db import setup_all
 
 # setup_all()
 
+# Reopen the shared DuckDB instance if it was closed or became unusable
+duckdb_manager.ensure_healthy()
+
 st.set_page_config(page_title="Agentic ERP System", layout="wide")
 
 st.markdown("<h1 style='text-align: center;'>Agentic ERP System</h1>", unsafe_allow_html=True)
 
-# Horizontal tabs
-tab1, tab2, tab3 = st.tabs(["🗨️ Conversation", "🦆 DuckDB", "🗃️ SQLite"])
+# Horizontal view selector; unlike st.tabs, only the selected view's code runs on a rerun
+VIEWS = ["🗨️ Conversation", "🦆 DuckDB", "🗃️ SQLite"]
+view = st.radio("View", VIEWS, horizontal=True, label_visibility="collapsed")
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_tables(store: str, version: tuple) -> list:
+    return list_tables(store)
+
+
+@st.cache_data(ttl=60, max_entries=512, show_spinner=False)
+def cached_page(store: str, table: str, after: tuple | None, version: int):
+    # Keyed by the table's data version, so a write or reset never shows a stale page
+    return fetch_page(store, table, after)
+
+
+def table_browser(store: str) -> None:
+    # Only the selected table is read, one keyset page at a time
+    tables = cached_tables(store, data_version.snapshot(()))
+    if not tables:
+        st.info("No tables found.")
+        return
+
+    counts = dict(tables)
+    table = st.selectbox(
+        "Table", list(counts), key=f"{store}_table",
+        format_func=lambda name: f"{name} (≈{counts[name]:,} rows)" if counts[name] is not None else name,
+    )
+
+    # Start key of every page visited so far; page 0 starts at the beginning
+    cursors = st.session_state.setdefault("browser_cursors", {}).setdefault((store, table), [None])
+    pages = st.session_state.setdefault("browser_page", {})
+    page = pages.get((store, table), 0)
+
+    frame, next_after = cached_page(store, table, cursors[page], data_version.table_version(table))
+    if next_after is not None and len(cursors) == page + 1:
+        cursors.append(next_after)
+    st.dataframe(frame, use_container_width=True, hide_index=True)
+
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if st.button("◀ Previous", key=f"{store}_prev", disabled=page == 0, use_container_width=True):
+            pages[(store, table)] = page - 1
+            st.rerun()
+    with col2:
+        if st.button("Next ▶", key=f"{store}_next", disabled=next_after is None, use_container_width=True):
+            pages[(store, table)] = page + 1
+            st.rerun()
+    with col3:
+        st.caption(f"Page {page + 1}")
+
+
+def reset_browser() -> None:
+    # Page start keys are meaningless after a reset
+    st.session_state.pop("browser_cursors", None)
+    st.session_state.pop("browser_page", None)
+
+
+# --- Conversation ---
+# Turns held (and rendered) per session; older ones are paged in from the store on demand
+MAX_LOADED_TURNS = 2 * PAGE_TURNS
+# Scrollable chat height in px
+CHAT_HEIGHT = 560
 
-# --- Tab 1: Conversation ---
-with tab1:
+if view == VIEWS[0]:
     st.markdown("""
     <style>
-        .chat-area {
-            height: 65vh;
-            overflow-y: auto;
+        .chat-row {
             display: flex;
             flex-direction: column;
-            padding: 1rem;
-            margin-bottom: 1rem;
         }
         .chat-bubble {
             padding: 0.8rem 1.2rem;
@@ -81,106 +140,192 @@ with tab1:
 """, unsafe_allow_html=True)
 
 
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
+    def drop_turns(turns) -> None:
+        # Turns leaving memory release their open result cursors; the store keeps the records
+        for turn in turns:
+            if turn.get("result") is not None:
+                turn["result"].close()
 
-    chat_box = st.empty()
+    def load_latest() -> None:
+        drop_turns(st.session_state.get("chat_turns", []))
+        turns, has_earlier = load_turns(st.session_state.chat_session)
+        st.session_state.chat_turns = turns
+        st.session_state.chat_has_earlier = has_earlier
+        st.session_state.chat_has_later = False
 
-    def render_chat():
-        chat_html = "<div class='chat-area'>"
-        for msg in st.session_state.chat_history:
-            role_class = "user" if msg["role"] == "user" else "bot"
-            chat_html += f"<div class='chat-bubble {role_class}'>{msg['content']}</div>"
-        chat_html += "</div>"
-        chat_box.markdown(chat_html, unsafe_allow_html=True)
+    if "chat_session" not in st.session_state:
+        # The session id lives in the URL, so a reload or restart resumes the conversation
+        session_id = st.query_params.get("session") or uuid.uuid4().hex
+        st.query_params["session"] = session_id
+        st.session_state.chat_session = session_id
+        load_latest()
 
-    render_chat()
+    def turn_result(turn):
+        # Results are re-opened (usually from the result cache) only when their turn is shown
+        if "result" not in turn and turn["result_ref"]:
+            from llm.insight_agent import open_result
+            ref = turn["result_ref"]
+            try:
+                turn["result"] = open_result(ref["engine"], ref["sqls"]).first_page(max(turn["row_count"] or 0, PAGE_ROWS))
+            except Exception as e:
+                print(f"[WARN] Could not re-open result of turn {turn['turn_id']}: {e}")
+                turn["result"] = None
+        return turn.get("result")
+
+    def insight_html(turn) -> str:
+        # Only the rows fetched so far are rendered; more are pulled with "Load more"
+        bot_response_html = f"<strong>📊 {turn['summary']}</strong><br><br>"
+
+        if turn["sqls"]:
+            bot_response_html += "<strong>📄 Executed SQL:</strong><br>"
+            for db, sql in turn["sqls"].items():
+                bot_response_html += f"<em>{db}</em>:<br><pre><code>{sql}</code></pre>"
+
+        result = turn_result(turn)
+        if turn.get("pending"):
+            bot_response_html += "<div class='spinner'></div><em>Fetching the result...</em>"
+        elif result is None:
+            bot_response_html += "<em>The result is no longer available.</em>"
+        elif result.num_rows:
+            bot_response_html += "<strong>📈 Insight Result:</strong><br>"
+            bot_response_html += result.to_pandas().to_html(index=False, escape=False, border=0)
+            if result.has_more:
+                bot_response_html += f"<em>Showing the first {result.num_rows} rows.</em>"
+            elif result.truncated:
+                bot_response_html += f"<em>Result limited to {result.num_rows} rows.</em>"
+        else:
+            bot_response_html += "<em>No results found.</em>"
+        return bot_response_html
+
+    def bubble_html(turn) -> str:
+        # Built from the compact record when the turn is first shown, then cached on it
+        if "html" not in turn:
+            role_class = "user" if turn["role"] == "user" else "bot"
+            body = insight_html(turn) if turn["type"] == "insight" else turn["content"]
+            turn["html"] = f"<div class='chat-row'><div class='chat-bubble {role_class}'>{body}</div></div>"
+        return turn["html"]
+
+    def render_turn(turn, slot=None) -> None:
+        # One element per bubble, so a new or changed turn never re-renders the others
+        slot = slot or st.empty()
+        slot.markdown(bubble_html(turn), unsafe_allow_html=True)
+        # Insight results are paged: each click pulls the next page into this bubble only
+        result = turn.get("result")
+        if result is not None and result.has_more:
+            if st.button("Load more rows", key=f"load_more_{turn['turn_id']}"):
+                try:
+                    result.fetch()
+                    update_row_count(turn["turn_id"], result.num_rows)
+                except Exception as e:
+                    st.error(f"Could not load more rows: {e}")
+                turn.pop("html", None)
+                slot.markdown(bubble_html(turn), unsafe_allow_html=True)
+
+    session_id = st.session_state.chat_session
+    turns = st.session_state.chat_turns
+    chat_area = st.container(height=CHAT_HEIGHT)
+    with chat_area:
+        if st.session_state.chat_has_earlier and st.button("Show earlier messages", key="chat_earlier"):
+            earlier, st.session_state.chat_has_earlier = load_turns(session_id, before=turns[0]["turn_id"])
+            turns[:0] = earlier
+            if len(turns) > MAX_LOADED_TURNS:
+                # Keep memory bounded: the newest turns go back to the store
+                drop_turns(turns[MAX_LOADED_TURNS:])
+                del turns[MAX_LOADED_TURNS:]
+                st.session_state.chat_has_later = True
+            st.rerun()
+        for turn in turns:
+            render_turn(turn)
+        if st.session_state.chat_has_later and st.button("Show latest messages", key="chat_later"):
+            load_latest()
+            st.rerun()
 
     user_input = st.chat_input("Ask something like 'update quantity for latest order' or 'list top 5 sold products'")
 
     if user_input:
-        # 1. Add user message
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
+        if st.session_state.chat_has_later:
+            # Scrolled back: the new turn continues from the latest ones
+            load_latest()
+            turns = st.session_state.chat_turns
 
-        # 2. Add placeholder with spinner
-        thinking_index = len(st.session_state.chat_history)
-        st.session_state.chat_history.append({"role": "assistant", "content": "<div class='spinner'></div>Processing..."})
-        render_chat()
+        # 1. Store the user turn and append its bubble below the ones on screen
+        user_turn = append_turn(session_id, "user", "text", content=user_input)
+        turns.append(user_turn)
+        with chat_area:
+            render_turn(user_turn)
+            # 2. Placeholder with spinner, replaced in place by the response
+            reply_slot = st.empty()
+            reply_slot.markdown(bubble_html({"role": "assistant", "type": "text", "content": "<div class='spinner'></div>Processing..."}), unsafe_allow_html=True)
 
-        # 3. Run agent in blocking mode
-        from orchestrator_openai import unified_agent
-        agent_response = unified_agent(user_input)
+        # 3. Stream the agent's events from the shared event loop into the reply bubble
+        from llm.async_runtime import iterate_sync
+        from orchestrator_openai import unified_agent_stream
+        agent_response, streamed = None, ""
+        for event in iterate_sync(unified_agent_stream(user_input)):
+            if event["event"] == "delta":
+                streamed += event["text"]
+                reply_slot.markdown(bubble_html({"role": "assistant", "type": "text", "content": streamed + "▌"}), unsafe_allow_html=True)
+            elif event["event"] == "insight_plan":
+                # Summary and SQL are shown while the query is still running
+                preview = {"role": "assistant", "type": "insight", "summary": event["summary"],
+                           "sqls": event["executed_sql"], "result_ref": None, "pending": True}
+                reply_slot.markdown(bubble_html(preview), unsafe_allow_html=True)
+            elif event["event"] == "final":
+                agent_response = event["response"]
 
         if isinstance(agent_response, dict) and agent_response.get("type") == "insight":
-            summary = agent_response.get("summary", "Insight Result")
-            sqls = agent_response.get("executed_sql", {})
-            result_df = pd.DataFrame(agent_response.get("result_table", []))
-
-            # 4. Build response HTML (summary + SQL + Table)
-            bot_response_html = f"<strong>📊 {summary}</strong><br><br>"
-
-            if sqls:
-                bot_response_html += "<strong>📄 Executed SQL:</strong><br>"
-                for db, sql in sqls.items():
-                    bot_response_html += f"<em>{db}</em>:<br><pre><code>{sql}</code></pre>"
-
-            if not result_df.empty:
-                bot_response_html += "<strong>📈 Insight Result:</strong><br>"
-                bot_response_html += result_df.to_html(index=False, escape=False, border=0)
-            else:
-                bot_response_html += "<em>No results found.</em>"
-
-            # Replace spinner with formatted HTML
-            st.session_state.chat_history[thinking_index] = {"role": "assistant", "content": bot_response_html}
-            render_chat()
+            # 4. Store summary + SQL + a reference to the result; the open handle stays in memory
+            result = agent_response["result"]
+            turn = append_turn(
+                session_id, "assistant", "insight",
+                summary=agent_response.get("summary", "Insight Result"),
+                sqls=agent_response.get("executed_sql", {}),
+                result_ref=agent_response.get("result_ref"),
+                row_count=result.num_rows,
+            )
+            turn["result"] = result
         else:
             # Normal response
-            st.session_state.chat_history[thinking_index] = {"role": "assistant", "content": str(agent_response)}
-            render_chat()
+            turn = append_turn(session_id, "assistant", "text", content=str(agent_response))
+
+        turns.append(turn)
+        if len(turns) > MAX_LOADED_TURNS:
+            drop_turns(turns[:-MAX_LOADED_TURNS])
+            del turns[:-MAX_LOADED_TURNS]
+            st.session_state.chat_has_earlier = True
+        with chat_area:
+            render_turn(turn, slot=reply_slot)
 
-# --- Tab 2: DuckDB ---
-with tab2:
+# --- DuckDB ---
+elif view == VIEWS[1]:
     col1, col2 = st.columns([5, 1])
     with col1:
         st.title("🦆 DuckDB Tables")
     with col2:
         if st.button("🔄 Reset DuckDB", use_container_width=True):
-            from database.schema_duckdb import create_duckdb_schema
-            from database.populate_duckdb import populate_duckdb
-            create_duckdb_schema()
-            populate_duckdb()
+            from database.reset import reset_store
+            reset_store("duckdb")
+            reset_browser()
             st.success("✅ DuckDB reset and repopulated.")
 
     try:
-        with get_duckdb_conn() as duck_conn:
-            tables = duck_conn.execute("SHOW TABLES").fetchall()
-            for table in tables:
-                st.subheader(table[0])
-                df = duck_conn.execute(f"SELECT * FROM {table[0]}").fetchdf()
-                st.dataframe(df, use_container_width=True)
+        table_browser("duckdb")
     except Exception as e:
         st.error(f"DuckDB Error: {str(e)}")
 
-# --- Tab 3: SQLite ---
-with tab3:
+# --- SQLite ---
+else:
     col1, col2 = st.columns([5, 1])
     with col1:
         st.title("🗃️ SQLite Tables")
     with col2:
         if st.button("🔄 Reset SQLite", use_container_width=True):
-            from database.schema_sqlite import create_sqlite_schema
-            create_sqlite_schema()
+            from database.reset import reset_store
+            reset_store("sqlite")
+            reset_browser()
             st.success("✅ SQLite reset and repopulated.")
 
     try:
-        with sqlite_engine.connect() as conn:
-            result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))
-            tables = result.fetchall()
-            for (table_name,) in tables:
-                if table_name != "sqlite_sequence":
-                    st.subheader(table_name)
-                    df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-                    st.dataframe(df, use_container_width=True)
+        table_browser("sqlite")
     except Exception as e:
         st.error(f"SQLite Error: {str(e)}")
-
@@ -0,0 +1,145 @@
+# Admission control for LLM traffic, in two parts:
+# 1. The scheduler on a fake clock: a burst of batch requests followed by interactive
+#    ones, admitted at 60 requests/minute; interactive requests overtake the batch
+#    backlog and requests past the wait limit are shed as they arrive.
+# 2. Concurrent async calls against a local stand-in endpoint that answers 429 (with
+#    retry-after) beyond 300 requests/minute, with admission control off and on (set
+#    10% under the provider's limit, as it would be in production).
+# Usage: python -m benchmarks.bench_admission
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm.admission import AdmissionController, Busy, TokenBucket
+
+PROVIDER_RPM = 300
+LATENCY = 0.3
+SESSIONS = 60
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def fake_clock_run() -> None:
+    clock = FakeClock()
+    controller = AdmissionController(requests_per_minute=60, tokens_per_minute=1_000_000, burst_seconds=2,
+                                     max_queue=50, max_wait=8, clock=clock)
+    tickets, shed = [], []
+    arrivals = [("batch", f"b{i}") for i in range(12)] + [("interactive", f"i{i}") for i in range(8)]
+    for priority, name in arrivals:
+        try:
+            tickets.append((name, controller.enqueue(100, priority)))
+        except Busy:
+            shed.append(name)
+    order = [name for name, ticket in tickets if ticket.admitted]
+    while len(order) < len(tickets):
+        clock.now += 0.25
+        controller.poll()
+        order += [name for name, ticket in tickets if ticket.admitted and name not in order]
+    stats = controller.stats()
+    print("fake clock, 60 requests/min, burst of 2, 8s wait limit:")
+    print(f"  admission order: {' '.join(order)}")
+    print(f"  shed on arrival: {' '.join(shed) or '-'}")
+    print(f"  wait p95: interactive={stats['wait_p95']['interactive']:.2f}s batch={stats['wait_p95']['batch']:.2f}s")
+
+
+# --- stand-in endpoint ---
+
+provider_bucket = TokenBucket(PROVIDER_RPM, 1, time.monotonic())
+provider_lock = threading.Lock()
+rejected = 0
+
+
+class StandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        global rejected
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with provider_lock:
+            provider_bucket.refill(time.monotonic())
+            allowed = provider_bucket.level >= 1
+            if allowed:
+                provider_bucket.take(1)
+            else:
+                rejected += 1
+        if not allowed:
+            self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": "1"})
+            return
+        time.sleep(LATENCY)
+        self._reply(200, {
+            "id": "chatcmpl-standin", "object": "chat.completion", "created": int(time.time()), "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 20, "completion_tokens": 1, "total_tokens": 21},
+        })
+
+    def _reply(self, status: int, payload: dict, headers: dict | None = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in {"Content-Type": "application/json", "Content-Length": str(len(body)), **(headers or {})}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+os.environ.setdefault("OPENAI_API_KEY", "stand-in")
+
+from llm import llm_call
+from llm.llm_call import LLMBusy, LLMUnavailable
+
+REQUEST = {"messages": [{"role": "user", "content": "ping"}]}
+
+
+async def session() -> tuple[str, float]:
+    started = time.perf_counter()
+    try:
+        await llm_call.llm_call_async("chat", REQUEST)
+        outcome = "ok"
+    except LLMBusy:
+        outcome = "busy"
+    except LLMUnavailable:
+        outcome = "failed"
+    return outcome, time.perf_counter() - started
+
+
+async def stand_in_run(name: str, controller: AdmissionController) -> None:
+    global rejected
+    llm_call.admission_controller = controller
+    # A fresh provider window and stage state per run
+    await asyncio.sleep(1.5)
+    provider_bucket.level, rejected = provider_bucket.capacity, 0
+    llm_call._histograms.clear()
+    llm_call._breakers.clear()
+    results = await asyncio.gather(*(session() for _ in range(SESSIONS)))
+    line = f"  {name:24s} 429s={rejected:3d}"
+    for outcome in ("ok", "busy", "failed"):
+        seconds = sorted(s for o, s in results if o == outcome)
+        median = f"{seconds[len(seconds) // 2] * 1000:5.0f}ms" if seconds else "    -  "
+        line += f"  {outcome}={len(seconds):2d} (p50 {median})"
+    print(line)
+
+
+async def main() -> None:
+    fake_clock_run()
+    print(f"\n{SESSIONS} concurrent calls, stand-in allows {PROVIDER_RPM} requests/min (429 + retry-after beyond):")
+    await stand_in_run("admission off", AdmissionController(enabled=False))
+    for max_wait in (5, 15):
+        await stand_in_run(f"admission on, wait<={max_wait}s", AdmissionController(
+            requests_per_minute=PROVIDER_RPM * 0.9, burst_seconds=1, max_wait=max_wait))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
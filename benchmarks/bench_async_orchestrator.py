@@ -0,0 +1,82 @@
+# Concurrent conversations served by one process: the blocking orchestrator one request
+# at a time vs. the async one on the shared event loop. The OpenAI clients are replaced
+# by stubs with a fixed network latency, so only orchestration overhead is measured.
+# Usage: python -m benchmarks.bench_async_orchestrator
+import os
+import shutil
+import tempfile
+
+# Copies of the databases in a temp dir, no query log and no persisted SQL plans: the
+# stub's labels and plans must not reach data/, where they would feed the classifier's
+# retraining and be reused for real questions. Set before the project modules are imported.
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+tmp = tempfile.mkdtemp()
+for name in ("sales_data.db", "retail_data.duckdb"):
+    shutil.copy(os.path.join(DATA_DIR, name), os.path.join(tmp, name))
+os.environ["SQLITE_DB_PATH"] = os.path.join(tmp, "sales_data.db")
+os.environ["DUCKDB_DB_PATH"] = os.path.join(tmp, "retail_data.duckdb")
+os.environ["QUERY_LOG_PATH"] = os.path.join(tmp, "query_log.jsonl")
+os.environ["SQL_REUSE_INDEX_PATH"] = ""
+# The stub has no rate limit, so admission control (llm/admission.py) is off
+os.environ["LLM_ADMISSION_CONTROL"] = "0"
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from llm.llm_utils import async_client, client
+from llm.async_runtime import run_sync
+from orchestrator_openai import unified_agent, unified_agent_async
+
+LATENCY = 0.2
+QUERIES = [f"tell me something nice about day {i}" for i in range(50)]
+
+
+def _reply(messages) -> SimpleNamespace:
+    content = "other" if "classifier" in messages[0]["content"] else "Happy to help!"
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=None))])
+
+
+def fake_create(**request):
+    time.sleep(LATENCY)
+    return _reply(request["messages"])
+
+
+async def _chunks(text: str):
+    for token in text.split(" "):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token + " "))])
+
+
+async def fake_create_async(**request):
+    await asyncio.sleep(LATENCY)
+    reply = _reply(request["messages"])
+    if request.get("stream"):
+        return _chunks(reply.choices[0].message.content)
+    return reply
+
+
+async def serve_all() -> tuple[list, int]:
+    tasks = [asyncio.create_task(unified_agent_async(q)) for q in QUERIES]
+    await asyncio.sleep(LATENCY / 2)
+    # Threads alive while every conversation is in flight
+    threads = threading.active_count()
+    return await asyncio.gather(*tasks), threads
+
+
+if __name__ == "__main__":
+    client.chat.completions.create = fake_create
+    async_client.chat.completions.create = fake_create_async
+
+    t0 = time.perf_counter()
+    sync_replies = [unified_agent(q) for q in QUERIES]
+    sync_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    async_replies, threads = run_sync(serve_all())
+    async_seconds = time.perf_counter() - t0
+
+    assert sync_replies == async_replies
+    print(f"{len(QUERIES)} conversations, {LATENCY * 1000:.0f}ms per LLM call")
+    print(f"blocking: {sync_seconds:6.2f}s  ({len(QUERIES) / sync_seconds:6.1f} req/s)")
+    print(f"async:    {async_seconds:6.2f}s  ({len(QUERIES) / async_seconds:6.1f} req/s, {threads} threads in process)")
+    shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,97 @@
+# Orders per second: create_order/schedule_order one at a time vs. the batched
+# create_orders/schedule_orders, then concurrent create_order calls on one product, while
+# the sales mirror syncs and resets alongside them; committed_qty must grow by exactly the
+# number of successful orders. Runs against temporary copies of both databases.
+# Usage: python -m benchmarks.bench_bulk_orders [n_single] [n_bulk]
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+tmp = tempfile.mkdtemp()
+for name in ("sales_data.db", "retail_data.duckdb"):
+    shutil.copy(os.path.join(DATA_DIR, name), os.path.join(tmp, name))
+# Must be set before database.db_utils is imported
+os.environ["SQLITE_DB_PATH"] = os.path.join(tmp, "sales_data.db")
+os.environ["DUCKDB_DB_PATH"] = os.path.join(tmp, "retail_data.duckdb")
+
+from tools.create_order import create_order
+from tools.schedule_order import schedule_order
+from tools.bulk_orders import create_orders, schedule_orders
+from database.db_utils import duckdb_manager
+from database.sales_mirror import reset_sales_mirror, sync_sales_mirror
+
+PRODUCTS = (101, 102, 103)
+THREADS = 8
+ORDERS_PER_THREAD = 10
+
+
+def rate(label: str, n: int, fn) -> list:
+    t0 = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<28} n={n:<6} {elapsed * 1000:9.1f}ms  {n / elapsed:10.0f} orders/s")
+    return out
+
+
+def committed_qty(product_id: int) -> int:
+    with duckdb_manager.connection(read_only=True) as conn:
+        return conn.execute("SELECT committed_qty FROM inventory WHERE product_id = ?", [product_id]).fetchone()[0]
+
+
+def concurrent_creates(product_id: int) -> None:
+    before = committed_qty(product_id)
+
+    def worker(_):
+        return [create_order(product_id, 1) for _ in range(ORDERS_PER_THREAD)]
+
+    def mirror():
+        # The other DuckDB writers, which must not make an order fail
+        for i in range(ORDERS_PER_THREAD):
+            reset_sales_mirror() if i % 5 == 0 else sync_sales_mirror()
+
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(THREADS + 1) as pool:
+        mirroring = pool.submit(mirror)
+        results = [r for batch in pool.map(worker, range(THREADS)) for r in batch]
+        mirroring.result()
+    ok = sum(r["status"] == "success" for r in results)
+    errors = {r["message"] for r in results if r["status"] != "success"}
+    growth = committed_qty(product_id) - before
+    print(f"{THREADS} threads x {ORDERS_PER_THREAD} create_order({product_id}, 1): ok={ok} failed={len(results) - ok} "
+          f"committed_qty +{growth} -> {'consistent' if growth == ok == len(results) else 'INCONSISTENT'}")
+    for message in sorted(errors)[:3]:
+        print(f"  {message}")
+
+
+if __name__ == "__main__":
+    n_single = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_bulk = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    orders = [{"product_id": PRODUCTS[i % 3], "quantity": 1} for i in range(max(n_single, n_bulk))]
+
+    # The tools print debug output for every call; keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        created = [create_order(**orders[0])]  # warm up connections
+        t0 = time.perf_counter()
+        created = [create_order(**o) for o in orders[:n_single]]
+        single_create = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for r in created:
+            schedule_order(r["data"]["sale_id"])
+        single_schedule = time.perf_counter() - t0
+    print(f"{'create_order (loop)':<28} n={n_single:<6} {single_create * 1000:9.1f}ms  "
+          f"{n_single / single_create:10.0f} orders/s")
+    print(f"{'schedule_order (loop)':<28} n={n_single:<6} {single_schedule * 1000:9.1f}ms  "
+          f"{n_single / single_schedule:10.0f} orders/s")
+
+    result = rate("create_orders (batch)", n_bulk, lambda: create_orders(orders[:n_bulk]))
+    sale_ids = [r["sale_id"] for r in result["data"]["results"] if r["status"] == "success"]
+    rate("schedule_orders (batch)", len(sale_ids), lambda: schedule_orders(sale_ids))
+    concurrent_creates(PRODUCTS[0])
+
+    duckdb_manager.close()
+    shutil.rmtree(tmp, ignore_errors=True)
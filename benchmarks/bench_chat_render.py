@@ -0,0 +1,29 @@
+# Conversation view as the stored conversation grows: rerun time and the turns held in
+# session memory. Turns live in a scratch conversation store; only the latest page is
+# loaded and rendered, so both should stay flat.
+# Usage: python -m benchmarks.bench_chat_render
+import os
+import tempfile
+import time
+import uuid
+
+os.environ["CONVERSATION_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "conversations.db")
+
+from streamlit.testing.v1 import AppTest
+from database.conversation_store import append_turn
+
+if __name__ == "__main__":
+    for n in (20, 200, 2000):
+        session_id = uuid.uuid4().hex
+        for i in range(n):
+            append_turn(session_id, "user" if i % 2 == 0 else "assistant", "text", content=f"message {i} " * 50)
+        at = AppTest.from_file("app.py", default_timeout=60)
+        at.query_params["session"] = session_id
+        at.run()
+        timings = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            at.run()
+            timings.append((time.perf_counter() - t0) * 1000)
+        bubbles = sum(m.value.startswith("<div class='chat-row'>") for m in at.markdown)
+        print(f"{n:5d} stored turns  rerun={min(timings):6.1f}ms  turns in memory={len(at.session_state['chat_turns'])}  bubbles rendered={bubbles}")
@@ -0,0 +1,55 @@
+# Per-operation latency of an order-style DuckDB operation: duckdb.connect per call
+# (old get_duckdb_conn) vs. the shared DuckDBConnectionManager cursor.
+# Runs against a temporary copy of data/retail_data.duckdb.
+# Usage: python -m benchmarks.bench_duckdb_connections [iterations]
+import os
+import shutil
+import sys
+import tempfile
+import time
+import duckdb
+import numpy as np
+from database.db_utils import DATA_DIR, DuckDBConnectionManager
+
+
+def order_operation(conn) -> None:
+    # Same statement mix as create_order: price lookup, inventory read, inventory update
+    conn.execute("SELECT price FROM product WHERE product_id = ?", (101,)).fetchone()
+    conn.execute("SELECT total_qty, committed_qty FROM inventory WHERE product_id = ?", (101,)).fetchone()
+    conn.execute("UPDATE inventory SET committed_qty = committed_qty WHERE product_id = ?", (101,))
+
+
+def timed(fn, iterations: int) -> np.ndarray:
+    latencies = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return np.array(latencies)
+
+
+def report(name: str, lat: np.ndarray) -> None:
+    print(f"{name:<22} p50={np.percentile(lat, 50):8.3f}ms  p99={np.percentile(lat, 99):8.3f}ms  mean={lat.mean():8.3f}ms")
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "retail_data.duckdb")
+        shutil.copy(os.path.join(DATA_DIR, "retail_data.duckdb"), path)
+
+        def connect_per_call():
+            with duckdb.connect(database=path, read_only=False) as conn:
+                order_operation(conn)
+
+        report("connect per call", timed(connect_per_call, iterations))
+
+        manager = DuckDBConnectionManager(path)
+
+        def shared_cursor():
+            with manager.connection() as conn:
+                order_operation(conn)
+
+        shared_cursor()  # first call pays the one-time open
+        report("shared manager", timed(shared_cursor, iterations))
+        manager.close()
@@ -0,0 +1,68 @@
+# Accuracy and latency of the local intent classifier vs. the GPT-4 classifier.
+# Usage: python -m benchmarks.bench_intent_classifier [--llm]
+import json
+import os
+import sys
+import time
+import numpy as np
+from llm.intent_classifier import train_intent_classifier, CONFIDENCE_THRESHOLD
+
+EVAL_PATH = os.path.join(os.path.dirname(__file__), "intent_eval.jsonl")
+
+
+def load_eval_set() -> list[dict]:
+    with open(EVAL_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def report(name: str, latencies_ms: list[float], correct: int, total: int) -> None:
+    lat = np.array(latencies_ms)
+    print(
+        f"{name:<12} accuracy={correct / total:6.1%}  "
+        f"p50={np.percentile(lat, 50):9.3f}ms  p99={np.percentile(lat, 99):9.3f}ms  "
+        f"mean={lat.mean():9.3f}ms"
+    )
+
+
+def bench_local(examples: list[dict]) -> None:
+    start = time.perf_counter()
+    classifier = train_intent_classifier()
+    print(f"Training took {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    latencies, correct, confident, confident_correct = [], 0, 0, 0
+    for _ in range(20):  # repeat to get stable latency percentiles
+        for ex in examples:
+            t0 = time.perf_counter()
+            label, confidence = classifier.predict(ex["query"])
+            latencies.append((time.perf_counter() - t0) * 1000)
+            correct += label == ex["label"]
+            if confidence >= CONFIDENCE_THRESHOLD:
+                confident += 1
+                confident_correct += label == ex["label"]
+
+    total = 20 * len(examples)
+    report("local", latencies, correct, total)
+    print(
+        f"{'':<12} handled locally={confident / total:6.1%}  "
+        f"accuracy when confident={confident_correct / max(confident, 1):6.1%}"
+    )
+
+
+def bench_llm(examples: list[dict]) -> None:
+    from orchestrator_openai import classify_query_type
+
+    latencies, correct = [], 0
+    for ex in examples:
+        t0 = time.perf_counter()
+        label = classify_query_type(ex["query"])
+        latencies.append((time.perf_counter() - t0) * 1000)
+        correct += label == ex["label"]
+    report("llm (gpt-4)", latencies, correct, len(examples))
+
+
+if __name__ == "__main__":
+    examples = load_eval_set()
+    print(f"Evaluating {len(examples)} held-out queries")
+    bench_local(examples)
+    if "--llm" in sys.argv:
+        bench_llm(examples)
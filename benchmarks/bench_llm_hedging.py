@@ -0,0 +1,95 @@
+# Tail latency of llm_call_async with hedging off and on, and the circuit breaker under
+# injected failures. The async OpenAI client is a stub: most calls answer in 100-250ms,
+# a few stall for 3s (a slow replica), so p99 is set by the stragglers unless a hedged
+# second request is sent once a call runs past the stage's recent p95.
+# Usage: python -m benchmarks.bench_llm_hedging
+import os
+
+# The stub has no rate limit, so admission control (llm/admission.py) is off
+os.environ["LLM_ADMISSION_CONTROL"] = "0"
+
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+import httpx
+import openai
+from llm import llm_call
+from llm.llm_utils import async_client
+
+CALLS = 500
+CONCURRENCY = 25
+SLOW_SHARE = 0.03
+SLOW_SECONDS = 3.0
+REQUEST = {"messages": [{"role": "user", "content": "ping"}]}
+
+failing = False
+
+
+async def fake_create(**request):
+    if failing:
+        await asyncio.sleep(0.02)
+        raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    await asyncio.sleep(SLOW_SECONDS if random.random() < SLOW_SHARE else random.uniform(0.1, 0.25))
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="pong"))],
+        usage=SimpleNamespace(total_tokens=12),
+    )
+
+
+async def timed(stage: str) -> float:
+    started = time.perf_counter()
+    await llm_call.llm_call_async(stage, REQUEST)
+    return time.perf_counter() - started
+
+
+async def run(stage: str) -> list[float]:
+    # Warm the stage's histogram so the hedge delay is known before measuring
+    for _ in range(llm_call.HEDGE_MIN_SAMPLES):
+        await timed(stage)
+    latencies = []
+    for start in range(0, CALLS, CONCURRENCY):
+        latencies += await asyncio.gather(*(timed(stage) for _ in range(min(CONCURRENCY, CALLS - start))))
+    return sorted(latencies)
+
+
+def pct(latencies: list[float], q: float) -> float:
+    return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+
+async def breaker_demo() -> None:
+    global failing
+    llm_call.BREAKER_COOLDOWN_SECONDS = 1.0
+    failing = True
+    for i in range(llm_call.BREAKER_FAILURES + 2):
+        started = time.perf_counter()
+        try:
+            await llm_call.llm_call_async("breaker", REQUEST)
+        except llm_call.LLMUnavailable as e:
+            reason = str(e).split(": ", 1)[1]
+        state = llm_call.latency_stats()["breaker"]["breaker"]
+        print(f"  call {i + 1}: failed in {(time.perf_counter() - started) * 1000:6.0f}ms  ({reason}; breaker {state})")
+    failing = False
+    await asyncio.sleep(llm_call.BREAKER_COOLDOWN_SECONDS)
+    await llm_call.llm_call_async("breaker", REQUEST)
+    print(f"  after {llm_call.BREAKER_COOLDOWN_SECONDS:g}s cooldown: trial call ok, breaker {llm_call.latency_stats()['breaker']['breaker']}")
+
+
+async def main() -> None:
+    random.seed(7)
+    async_client.chat.completions.create = fake_create
+    print(f"{CALLS} calls, {CONCURRENCY} concurrent, {SLOW_SHARE:.0%} stall for {SLOW_SECONDS:g}s")
+    for hedging in (False, True):
+        llm_call.HEDGING = hedging
+        stage = f"hedging_{'on' if hedging else 'off'}"
+        latencies = await run(stage)
+        stats = llm_call.latency_stats()[stage]
+        print(f"hedging={'on ' if hedging else 'off'}  p50={pct(latencies, 0.5):5.0f}ms  p95={pct(latencies, 0.95):5.0f}ms  "
+              f"p99={pct(latencies, 0.99):5.0f}ms  max={latencies[-1] * 1000:5.0f}ms  "
+              f"hedged={stats['hedged']} hedge_wins={stats['hedge_wins']}")
+    print("circuit breaker with every call failing:")
+    await breaker_demo()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+# End-to-end latency of the sync orchestrator with every stage on one strong model (the
+# old hard-coded "gpt-4") versus the tiered policy in config/model_policy.json. The LLM
+# is a local stand-in server speaking the OpenAI chat completions API, reached through
+# OPENAI_BASE_URL, with a fixed latency per model. The fast model writes SQL with an
+# unknown column for some questions, which fails EXPLAIN and is escalated.
+# Usage: python -m benchmarks.bench_model_tiers
+import json
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODEL_LATENCY = {"gpt-4": 1.2, "gpt-4o": 0.7, "gpt-4o-mini": 0.25}
+# Share of questions the fast model gets wrong
+FAST_SQL_ERROR_SHARE = 0.2
+GOOD_SQL = "SELECT sale_id, product_id, quantity, order_status FROM sales WHERE quantity > 5"
+BAD_SQL = "SELECT sale_id, product_id, units_sold FROM sales WHERE units_sold > 5"
+QUERIES = [f"which sales had more than five units in batch {i}" for i in range(16)] + \
+          [f"good morning, how are things {i}" for i in range(4)]
+
+calls = Counter()
+
+
+def _answer(model: str, request: dict) -> str:
+    system = request["messages"][0]["content"]
+    question = request["messages"][-1]["content"]
+    if "classifier" in system:
+        return "other" if "good morning" in question else "insight"
+    if "SQL" in system:
+        fast = model == "gpt-4o-mini"
+        wrong = fast and zlib.crc32(question.encode()) % 100 < FAST_SQL_ERROR_SHARE * 100
+        return json.dumps({"dbs": ["sqlite"], "sqls": {"sqlite": BAD_SQL if wrong else GOOD_SQL}})
+    return "Good morning! How can I help with your orders today?"
+
+
+class StandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        model = request["model"]
+        calls[model] += 1
+        time.sleep(MODEL_LATENCY[model])
+        body = json.dumps({
+            "id": "chatcmpl-standin", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": _answer(model, request)},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Configure before the clients and models are created: every query goes to the LLM
+# classifier, and no SQL plan is reused between questions
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+os.environ.setdefault("OPENAI_API_KEY", "stand-in")
+os.environ["INTENT_CONFIDENCE_THRESHOLD"] = "1.01"
+os.environ["SQL_REUSE_THRESHOLD"] = "1.01"
+os.environ["SQL_REUSE_INDEX_PATH"] = ""
+os.environ["LLM_ADMISSION_CONTROL"] = "0"
+
+from llm.llm_call import latency_stats
+from llm.model_policy import MODEL_POLICY_PATH, ModelPolicy, set_model_policy
+from orchestrator_openai import unified_agent
+
+POLICIES = {
+    "single strong model": ModelPolicy({"tiers": {"strong": {"model": "gpt-4"}},
+                                        "default_stage": {"tiers": ["strong"], "deadline": 20}}),
+    "tiered policy": ModelPolicy.load(MODEL_POLICY_PATH),
+}
+
+
+def pct(latencies: list[float], q: float) -> float:
+    return sorted(latencies)[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+
+def main() -> None:
+    print(f"{len(QUERIES)} queries via stand-in at {os.environ['OPENAI_BASE_URL']}")
+    for name, policy in POLICIES.items():
+        set_model_policy(policy)
+        calls.clear()
+        failed, latencies = 0, []
+        for query in QUERIES:
+            started = time.perf_counter()
+            response = unified_agent(query)
+            latencies.append(time.perf_counter() - started)
+            failed += isinstance(response, dict) and response.get("type") == "error"
+        escalations = sum(stats["escalations"] for stats in latency_stats().values())
+        print(f"{name:20s} p50={pct(latencies, 0.5):5.0f}ms  p95={pct(latencies, 0.95):5.0f}ms  "
+              f"errors={failed}  escalations={escalations}  calls={dict(calls)}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Time to first rows and peak Python memory for insight results: the old path
+# (fetchdf -> to_dict(records) -> DataFrame -> to_html) vs. a paged ResultHandle that
+# renders only the first page. Uses synthetic sales rows in temp databases.
+# Usage: python -m benchmarks.bench_result_streaming
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+tmp = tempfile.mkdtemp()
+# Must be set before database.db_utils is imported
+os.environ["SQLITE_DB_PATH"] = os.path.join(tmp, "sales_data.db")
+os.environ["DUCKDB_DB_PATH"] = os.path.join(tmp, "retail_data.duckdb")
+
+import numpy as np
+import pandas as pd
+from database.db_utils import duckdb_manager, get_duckdb_conn, sqlite_engine
+from database.schema_sqlite import create_sqlite_schema
+from database.sales_mirror import sync_sales_mirror
+from llm.sql_guard import open_guarded_duckdb, open_guarded_sqlite
+
+SIZES = (1_000, 10_000, 100_000)
+
+
+def populate(n_rows: int) -> None:
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "product_id": rng.integers(100, 1100, n_rows),
+        "quantity": rng.integers(1, 10, n_rows),
+        "sale_date": "2025-01-01",
+        "revenue": rng.uniform(10, 2000, n_rows).round(2),
+        "order_status": rng.choice(["Committed", "Scheduled", "Complete", "Cancel"], n_rows),
+    })
+    with sqlite_engine.begin() as conn:
+        frame.to_sql("sales", conn, if_exists="append", index=False, chunksize=50_000)
+
+
+def old_path(engine: str, sql: str) -> None:
+    if engine == "duckdb":
+        with get_duckdb_conn(read_only=True) as conn:
+            df = conn.execute(sql).fetchdf()
+    else:
+        with sqlite_engine.connect() as conn:
+            df = pd.read_sql_query(sql, conn)
+    pd.DataFrame(df.to_dict(orient="records")).to_html(index=False)
+
+
+def paged_path(engine: str, sql: str, n_rows: int) -> None:
+    opener = open_guarded_duckdb if engine == "duckdb" else open_guarded_sqlite
+    handle = opener(sql, max_rows=n_rows).first_page()
+    handle.to_pandas().to_html(index=False)
+    handle.close()
+
+
+def measure(fn) -> tuple[float, float]:
+    # Timed without tracing (tracemalloc slows allocation-heavy code a lot), then traced once
+    elapsed = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = min(elapsed, (time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == "__main__":
+    create_sqlite_schema()
+    populate(max(SIZES))
+    sync_sales_mirror()
+
+    for engine in ("duckdb", "sqlite"):
+        for n_rows in SIZES:
+            sql = f"SELECT * FROM sales WHERE sale_id <= {n_rows}"
+            old_ms, old_mb = measure(lambda: old_path(engine, sql))
+            new_ms, new_mb = measure(lambda: paged_path(engine, sql, n_rows))
+            print(f"{engine:<7} {n_rows:>9} rows  old: {old_ms:8.1f}ms {old_mb:7.1f}MB   "
+                  f"first page: {new_ms:6.1f}ms {new_mb:5.1f}MB")
+
+    duckdb_manager.close()
+    shutil.rmtree(tmp, ignore_errors=True)
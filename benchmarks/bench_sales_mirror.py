@@ -0,0 +1,104 @@
+# Aggregation latency over sales: SQLite via pd.read_sql_query vs. the DuckDB sales
+# mirror, plus initial and incremental sync cost, and which SQLite queries are routed to
+# the mirror (each checked to give the same answer on both). Uses synthetic rows in temp
+# databases.
+# Usage: python -m benchmarks.bench_sales_mirror [n_rows]
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+tmp = tempfile.mkdtemp()
+# Must be set before database.db_utils is imported
+os.environ["SQLITE_DB_PATH"] = os.path.join(tmp, "sales_data.db")
+os.environ["DUCKDB_DB_PATH"] = os.path.join(tmp, "retail_data.duckdb")
+
+import pandas as pd
+from sqlalchemy import text
+from database.db_utils import get_duckdb_conn, sqlite_engine, duckdb_manager
+from database.schema_sqlite import create_sqlite_schema
+from database.sales_mirror import is_mirrorable_aggregate, sync_sales_mirror
+
+QUERIES = {
+    "revenue by product": "SELECT product_id, SUM(revenue) AS revenue, COUNT(*) AS orders FROM sales GROUP BY product_id",
+    "qty by status": "SELECT order_status, SUM(quantity) AS qty FROM sales GROUP BY order_status",
+    "top 5 products": "SELECT product_id, SUM(quantity) AS sold FROM sales GROUP BY product_id ORDER BY sold DESC LIMIT 5",
+}
+
+# Routed to the mirror only when both engines agree; the last three differ between them (LIKE case, integer division, CAST rounding)
+ROUTING = QUERIES | {
+    "completed orders": "SELECT COUNT(*) FROM sales WHERE order_status LIKE 'complete'",
+    "mean qty per order": "SELECT SUM(quantity) / COUNT(*) AS mean_qty FROM sales",
+    "largest order value": "SELECT CAST(MAX(revenue) AS INTEGER) FROM sales",
+}
+
+
+def populate(n_rows: int) -> None:
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "product_id": rng.integers(100, 1100, n_rows),
+        "quantity": rng.integers(1, 10, n_rows),
+        "sale_date": pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 365, n_rows), unit="D"),
+        "revenue": rng.uniform(10, 2000, n_rows).round(2),
+        "order_status": rng.choice(["Committed", "Scheduled", "Complete", "Cancel"], n_rows),
+    })
+    frame["sale_date"] = frame["sale_date"].dt.strftime("%Y-%m-%d")
+    with sqlite_engine.begin() as conn:
+        frame.to_sql("sales", conn, if_exists="append", index=False, chunksize=50_000)
+
+
+def answer(frame: pd.DataFrame) -> list:
+    # Row order of a GROUP BY without ORDER BY is up to the engine
+    return sorted(tuple(round(float(v), 6) if isinstance(v, (int, float)) else v for v in row)
+                  for row in frame.itertuples(index=False))
+
+
+def timed_ms(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return best
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    create_sqlite_schema()
+    populate(n_rows)
+    print(f"{n_rows} synthetic sales rows")
+
+    t0 = time.perf_counter()
+    sync_sales_mirror()
+    print(f"initial sync: {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    for name, sql in QUERIES.items():
+        def on_sqlite():
+            with sqlite_engine.connect() as conn:
+                pd.read_sql_query(sql, conn)
+
+        def on_mirror():
+            with get_duckdb_conn(read_only=True) as conn:
+                conn.execute(sql).fetchdf()
+
+        sqlite_ms, mirror_ms = timed_ms(on_sqlite), timed_ms(on_mirror)
+        print(f"{name:<20} sqlite={sqlite_ms:9.1f}ms  mirror={mirror_ms:9.1f}ms  speedup={sqlite_ms / mirror_ms:6.1f}x")
+
+    for name, sql in ROUTING.items():
+        with sqlite_engine.connect() as conn:
+            on_sqlite = pd.read_sql_query(sql, conn)
+        with get_duckdb_conn(read_only=True) as conn:
+            on_mirror = conn.execute(sql).fetchdf()
+        same = answer(on_sqlite) == answer(on_mirror)
+        print(f"{name:<20} mirrored={str(is_mirrorable_aggregate(sql)):<5}  same answer on both={same}")
+
+    with sqlite_engine.begin() as conn:
+        conn.execute(text("UPDATE sales SET order_status = 'Cancel' WHERE sale_id % 1000 = 0"))
+    t0 = time.perf_counter()
+    stats = sync_sales_mirror()
+    print(f"incremental sync ({stats['changed_rows']} changed rows): {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+    duckdb_manager.close()
+    shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,149 @@
+# A burst of identical insight questions (a dashboard refreshed in several tabs, a user
+# pressing enter twice) through the sync path on threads and the async path on one event
+# loop, with single-flight off and on: LLM SQL generations and query runs per burst.
+# Then one action resubmitted with the same idempotency key, which runs once. The LLM is
+# a local stand-in server reached through OPENAI_BASE_URL.
+# Usage: python -m benchmarks.bench_single_flight
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SQL_LATENCY = 0.6
+CALLERS = 12
+QUESTION = "Which sales orders are there, with their status?"
+SQL = "SELECT sale_id, product_id, quantity, order_status FROM sales"
+
+calls = Counter()
+
+
+class StandIn(BaseHTTPRequestHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        calls["llm"] += 1
+        time.sleep(SQL_LATENCY)
+        body = json.dumps({
+            "id": "chatcmpl-standin", "object": "chat.completion", "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant",
+                                                 "content": json.dumps({"dbs": ["sqlite"], "sqls": {"sqlite": SQL}})},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+
+# Every question generates its SQL: no plan is reused from the index
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+os.environ.setdefault("OPENAI_API_KEY", "stand-in")
+os.environ["SQL_REUSE_THRESHOLD"] = "1.01"
+os.environ["SQL_REUSE_INDEX_PATH"] = ""
+os.environ["LLM_ADMISSION_CONTROL"] = "0"
+
+import orchestrator_openai
+from database.result_cache import result_cache
+from llm import insight_agent
+from llm.single_flight import single_flight
+
+_run_insight_plan = insight_agent.run_insight_plan
+
+
+def counted_run(*args):
+    calls["query"] += 1
+    return _run_insight_plan(*args)
+
+
+insight_agent.run_insight_plan = counted_run
+
+
+def burst(name: str, fire) -> None:
+    # Nothing left over from the previous burst: no cached rows, no remembered flights
+    result_cache.clear()
+    calls.clear()
+    before = single_flight.stats()
+    started = time.perf_counter()
+    responses = fire()
+    elapsed = time.perf_counter() - started
+    rows = {r["result"].num_rows for r in responses if isinstance(r.get("result"), insight_agent.ResultHandle)}
+    handles = len({id(r["result"]) for r in responses if "result" in r})
+    coalesced = single_flight.stats()["coalesced"] - before["coalesced"]
+    print(f"  {name:22s} {elapsed * 1000:5.0f}ms  llm calls={calls['llm']:2d}  query runs={calls['query']:2d}  "
+          f"coalesced={coalesced:2d}  rows={sorted(rows)}  distinct handles={handles}")
+
+
+def sync_burst() -> list:
+    with ThreadPoolExecutor(CALLERS) as pool:
+        return list(pool.map(insight_agent.handle_insight_query, [QUESTION] * CALLERS))
+
+
+def async_burst() -> list:
+    async def fire():
+        # Spelled differently; normalization still puts them on one flight
+        questions = [QUESTION if i % 2 else QUESTION.lower().rstrip("?") + "  ?" for i in range(CALLERS)]
+        return await asyncio.gather(*(insight_agent.handle_insight_query_async(q) for q in questions))
+    return asyncio.run(fire())
+
+
+def mixed_burst() -> list:
+    # Half on threads and half on a loop, all at once
+    with ThreadPoolExecutor(CALLERS // 2) as pool:
+        futures = [pool.submit(insight_agent.handle_insight_query, QUESTION) for _ in range(CALLERS // 2)]
+
+        async def fire():
+            return await asyncio.gather(*(insight_agent.handle_insight_query_async(QUESTION)
+                                          for _ in range(CALLERS // 2)))
+        return asyncio.run(fire()) + [f.result() for f in futures]
+
+
+def idempotent_action() -> None:
+    executed = Counter()
+
+    def execute_tool(tool, parameters):
+        executed[tool] += 1
+        time.sleep(0.2)
+        return {"type": "cancel_order", "status": "success", "message": f"Order {parameters['sale_id']} cancelled."}
+
+    real_execute_tool = orchestrator_openai.execute_tool
+    orchestrator_openai.execute_tool = execute_tool
+    try:
+        with ThreadPoolExecutor(3) as pool:
+            # A double-submitted form, then a client retrying after a dropped connection
+            first = [pool.submit(orchestrator_openai.unified_agent, "cancel order 42", "req-42") for _ in range(2)]
+            replies = [f.result() for f in first]
+        replies.append(asyncio.run(orchestrator_openai.unified_agent_async("cancel order 42", "req-42")))
+        replies.append(orchestrator_openai.unified_agent("cancel order 42", "req-43"))
+    finally:
+        orchestrator_openai.execute_tool = real_execute_tool
+    print(f"\n4 submissions of 'cancel order 42', keys req-42 x3 and req-43: "
+          f"tool executions={executed['cancel_order']}  identical replies={len({json.dumps(r, default=str) for r in replies[:3]}) == 1}")
+
+
+def main() -> None:
+    print(f"{CALLERS} concurrent callers asking '{QUESTION}', SQL generation {SQL_LATENCY * 1000:.0f}ms:")
+    for enabled in (False, True):
+        single_flight.enabled = enabled
+        state = "on" if enabled else "off"
+        burst(f"sync, single-flight {state}", sync_burst)
+        burst(f"async, single-flight {state}", async_burst)
+        burst(f"mixed, single-flight {state}", mixed_burst)
+    idempotent_action()
+    print(f"single-flight stats: {single_flight.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
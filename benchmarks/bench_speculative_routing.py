@@ -0,0 +1,105 @@
+# End-to-end latency of LLM-routed queries with and without speculative planning, plus
+# the speculation metrics (branches used/cancelled, wasted tokens, latency saved). The
+# async OpenAI client is a stub with fixed per-stage latencies and token counts; every
+# query is forced through the LLM classifier. Traffic is mostly insight questions.
+# Usage: python -m benchmarks.bench_speculative_routing
+import os
+import shutil
+import tempfile
+
+# Copies of the databases in a temp dir, no query log and no persisted SQL plans: the
+# stub's labels and plans must not reach data/, where they would feed the classifier's
+# retraining and be reused for real questions. Set before the project modules are imported.
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+tmp = tempfile.mkdtemp()
+for name in ("sales_data.db", "retail_data.duckdb"):
+    shutil.copy(os.path.join(DATA_DIR, name), os.path.join(tmp, name))
+os.environ["SQLITE_DB_PATH"] = os.path.join(tmp, "sales_data.db")
+os.environ["DUCKDB_DB_PATH"] = os.path.join(tmp, "retail_data.duckdb")
+os.environ["QUERY_LOG_PATH"] = os.path.join(tmp, "query_log.jsonl")
+os.environ["SQL_REUSE_INDEX_PATH"] = ""
+os.environ["INTENT_CONFIDENCE_THRESHOLD"] = "1.01"
+os.environ["LLM_ADMISSION_CONTROL"] = "0"
+
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+from llm.llm_utils import async_client
+import orchestrator_openai
+from llm import erp_tool_agent
+from llm.speculation import speculation_stats
+
+LATENCY = {"classify": 0.3, "tool": 0.4, "sql": 0.5, "format": 0.3}
+TOKENS = {"classify": 120, "tool": 350, "sql": 900, "format": 250}
+TRAFFIC = [("insight", "how is stock looking {i}")] * 7 + [("action", "please sort out order {i}")] * 2 + \
+          [("other", "what a day {i}")]
+
+
+def _stage(request) -> str:
+    system = request["messages"][0]["content"]
+    if "classifier" in system:
+        return "classify"
+    if "SQL" in system:
+        return "sql"
+    if "helpful ERP assistant" in system:
+        return "tool"
+    return "format"
+
+
+async def fake_create(**request):
+    stage = _stage(request)
+    await asyncio.sleep(LATENCY[stage])
+    query = request["messages"][-1]["content"]
+    if stage == "classify":
+        content = "insight" if "stock" in query else "action" if "order" in query else "other"
+    elif stage == "sql":
+        content = json.dumps({"dbs": ["duckdb"], "sqls": {"duckdb": "SELECT product_id, available_qty FROM inventory"}})
+    elif stage == "tool":
+        content = '{"tool": "cancel_order", "parameters": {"sale_id": 999999}}'
+    else:
+        content = "Sure."
+    if request.get("stream"):
+        async def chunks():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+        return chunks()
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=None))],
+        usage=SimpleNamespace(total_tokens=TOKENS[stage]),
+    )
+
+
+async def run(queries: list[str]) -> list[float]:
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        await orchestrator_openai.unified_agent_async(query)
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+if __name__ == "__main__":
+    async_client.chat.completions.create = fake_create
+    # Every tool execution is counted: it must only happen for queries routed to "action"
+    executed = []
+    execute_tool = erp_tool_agent.execute_tool
+    erp_tool_agent.execute_tool = lambda tool, params: executed.append(tool) or execute_tool(tool, params)
+    rng = random.Random(0)
+    traffic = [rng.choice(TRAFFIC) for _ in range(40)]
+    queries = [template.format(i=i) for i, (_, template) in enumerate(traffic)]
+    actions = sum(route == "action" for route, _ in traffic)
+
+    for speculative in (False, True):
+        orchestrator_openai.SPECULATIVE_ROUTING = speculative
+        executed.clear()
+        before = speculation_stats.snapshot()
+        latencies = asyncio.run(run(queries))
+        after = speculation_stats.snapshot()
+        delta = {k: after[k] - before[k] for k in ("branches", "used", "cancelled", "wasted_tokens", "saved_seconds")}
+        print(
+            f"speculative={'on ' if speculative else 'off'}  mean={sum(latencies) / len(latencies) * 1000:5.0f}ms  "
+            f"tools run={len(executed)}/{actions}  branches={delta['branches']} used={delta['used']} "
+            f"cancelled={delta['cancelled']} wasted_tokens={delta['wasted_tokens']} saved={delta['saved_seconds']:.2f}s"
+        )
+    shutil.rmtree(tmp, ignore_errors=True)
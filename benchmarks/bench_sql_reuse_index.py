@@ -0,0 +1,60 @@
+# Lookup latency and hit rate of the SQL reuse index at 100k synthetic entries, plus
+# how often the clustered search finds the same nearest entry as a full scan.
+# Usage: python -m benchmarks.bench_sql_reuse_index [n_entries]
+import sys
+import time
+import numpy as np
+from llm.sql_reuse_index import SQLReuseIndex, embed, extract_slots
+
+METRICS = ["revenue", "quantity sold", "orders", "backorders", "returns", "cancellations", "committed stock", "available stock"]
+GROUPS = ["product", "category", "month", "week", "status", "customer", "region", "channel"]
+SHAPES = ["top {n} {group}s by {metric}", "total {metric} per {group} in {year}",
+          "average {metric} by {group} since {date}", "{group}s with {metric} above {n}",
+          "bottom {n} {group}s by {metric} in {year}", "how many {metric} per {group} last {n} days"]
+EXTRA = ["", " please", " for the dashboard", " in stores", " online", " excluding tests", " as a table", " sorted"]
+
+
+def question(rng, i: int) -> str:
+    shape = SHAPES[rng.integers(len(SHAPES))]
+    text = shape.format(
+        n=rng.integers(1, 50), group=GROUPS[rng.integers(len(GROUPS))], metric=METRICS[rng.integers(len(METRICS))],
+        year=rng.integers(2020, 2026), date=f"2025-0{rng.integers(1, 10)}-01",
+    )
+    # A unique tail so entries are distinct questions rather than repeats of a few hundred shapes
+    return f"{text}{EXTRA[rng.integers(len(EXTRA))]} v{i}"
+
+
+def percentiles(latencies: list[float]) -> str:
+    lat = np.array(latencies) * 1000
+    return f"p50={np.percentile(lat, 50):.3f}ms  p99={np.percentile(lat, 99):.3f}ms"
+
+
+if __name__ == "__main__":
+    n_entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = np.random.default_rng(0)
+    questions = [question(rng, i) for i in range(n_entries)]
+
+    index = SQLReuseIndex(path=None)
+    start = time.perf_counter()
+    for i, q in enumerate(questions):
+        index.add(q, {"dbs": ["sqlite"], "sqls": {"sqlite": f"SELECT {i} AS id LIMIT 1"}})
+    print(f"indexed {n_entries} entries in {time.perf_counter() - start:.1f}s")
+
+    stored = [questions[i] for i in rng.choice(n_entries, 1000, replace=False)]
+    novel = [question(rng, n_entries + i).replace(" v", " x") for i in range(1000)]
+
+    for name, batch in (("stored questions", stored), ("novel questions", novel)):
+        latencies = []
+        for q in batch:
+            t0 = time.perf_counter()
+            index.lookup(q)
+            latencies.append(time.perf_counter() - t0)
+        print(f"{name:<17} {percentiles(latencies)}")
+    print(index.stats())
+
+    # Clustered search vs. exact full scan on the same queries
+    agree = 0
+    for q in stored[:200]:
+        query = embed(extract_slots(q)[0])
+        agree += index._nearest(query)[0] == index._all.best(query)[0]
+    print(f"clustered search matches full scan on {agree / 200:.1%} of stored questions")
@@ -0,0 +1,74 @@
+# Time to first visible text vs. time to the complete reply for a chat answer and an
+# insight question, through unified_agent_stream. The async OpenAI client is replaced
+# by a stub that returns the first token after FIRST_TOKEN seconds and then one token
+# every TOKEN_INTERVAL seconds; the insight SQL runs on a copy of the local DuckDB file.
+# Usage: python -m benchmarks.bench_stream_latency
+import os
+import shutil
+import tempfile
+
+# Copies of the databases in a temp dir, no query log and no persisted SQL plans: the
+# stub's labels and plans must not reach data/, where they would feed the classifier's
+# retraining and be reused for real questions. Set before the project modules are imported.
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+tmp = tempfile.mkdtemp()
+for name in ("sales_data.db", "retail_data.duckdb"):
+    shutil.copy(os.path.join(DATA_DIR, name), os.path.join(tmp, name))
+os.environ["SQLITE_DB_PATH"] = os.path.join(tmp, "sales_data.db")
+os.environ["DUCKDB_DB_PATH"] = os.path.join(tmp, "retail_data.duckdb")
+os.environ["QUERY_LOG_PATH"] = os.path.join(tmp, "query_log.jsonl")
+os.environ["SQL_REUSE_INDEX_PATH"] = ""
+# The stub has no rate limit, so admission control (llm/admission.py) is off
+os.environ["LLM_ADMISSION_CONTROL"] = "0"
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from llm.llm_utils import async_client
+from orchestrator_openai import unified_agent_stream
+
+FIRST_TOKEN = 0.4
+TOKEN_INTERVAL = 0.02
+REPLY = " ".join(["word"] * 60)
+PLAN = json.dumps({"dbs": ["duckdb"], "sqls": {"duckdb": "SELECT product_id, available_qty FROM inventory"}})
+
+
+async def _chunks(text: str):
+    for token in text.split(" "):
+        await asyncio.sleep(TOKEN_INTERVAL)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token + " "))])
+
+
+async def fake_create(**request):
+    system = request["messages"][0]["content"]
+    if "classifier" in system:
+        content = "insight" if "stock" in request["messages"][1]["content"] else "other"
+    elif "SQL" in system:
+        content = PLAN
+    else:
+        content = REPLY
+    await asyncio.sleep(FIRST_TOKEN)
+    if request.get("stream"):
+        return _chunks(content)
+    # Non-streamed calls pay for the whole completion up front
+    await asyncio.sleep(TOKEN_INTERVAL * len(content.split(" ")))
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content, tool_calls=None))])
+
+
+async def measure(query: str) -> tuple[float, float]:
+    t0 = time.perf_counter()
+    first = None
+    async for event in unified_agent_stream(query):
+        if first is None and event["event"] in ("delta", "insight_plan"):
+            first = time.perf_counter() - t0
+    return first, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    async_client.chat.completions.create = fake_create
+    for label, query in (("chat", "tell me something nice about your day"),
+                         ("insight", "how much stock is available per product")):
+        first, total = asyncio.run(measure(query))
+        print(f"{label:8s} first visible={first * 1000:6.0f}ms  complete={total * 1000:6.0f}ms")
+    shutil.rmtree(tmp, ignore_errors=True)
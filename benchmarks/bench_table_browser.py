@@ -0,0 +1,69 @@
+# Cost of one table-browser render: the old "SELECT * of every table" vs. metadata
+# row counts plus one keyset page, for growing sales tables in temp databases.
+# Usage: python -m benchmarks.bench_table_browser
+import os
+import shutil
+import tempfile
+import time
+
+tmp = tempfile.mkdtemp()
+# Must be set before database.db_utils is imported
+os.environ["SQLITE_DB_PATH"] = os.path.join(tmp, "sales_data.db")
+os.environ["DUCKDB_DB_PATH"] = os.path.join(tmp, "retail_data.duckdb")
+
+import numpy as np
+import pandas as pd
+from database.db_utils import duckdb_manager, sqlite_engine
+from database.schema_sqlite import create_sqlite_schema
+from database.table_browser import fetch_page, list_tables
+
+SIZES = (10_000, 100_000, 1_000_000)
+
+
+def add_rows(n_rows: int) -> None:
+    rng = np.random.default_rng(n_rows)
+    frame = pd.DataFrame({
+        "product_id": rng.integers(100, 1100, n_rows),
+        "quantity": rng.integers(1, 10, n_rows),
+        "sale_date": "2025-01-01",
+        "revenue": rng.uniform(10, 2000, n_rows).round(2),
+        "order_status": rng.choice(["Committed", "Scheduled", "Complete", "Cancel"], n_rows),
+    })
+    with sqlite_engine.begin() as conn:
+        frame.to_sql("sales", conn, if_exists="append", index=False, chunksize=50_000)
+
+
+def old_render() -> None:
+    with sqlite_engine.connect() as conn:
+        for (name,) in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='table'"):
+            if name != "sqlite_sequence":
+                pd.read_sql_query(f"SELECT * FROM {name}", conn)
+
+
+def new_render(after) -> None:
+    list_tables("sqlite")
+    fetch_page("sqlite", "sales", after)
+
+
+def timed_ms(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return best
+
+
+if __name__ == "__main__":
+    create_sqlite_schema()
+    total = 0
+    for n_rows in SIZES:
+        add_rows(n_rows - total)
+        total = n_rows
+        deep = (n_rows - 500,)
+        print(f"{n_rows:>9} sales rows  old={timed_ms(old_render):9.1f}ms  "
+              f"first page={timed_ms(lambda: new_render(None)):6.2f}ms  "
+              f"deep page={timed_ms(lambda: new_render(deep)):6.2f}ms")
+
+    duckdb_manager.close()
+    shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,97 @@
+# conversation_store.py
+# Chat turns persisted as compact records (role, type, text/summary, SQL and a reference
+# to the result, never rendered HTML) in a local SQLite database, one conversation per
+# session id. The app keeps only a window of turns in memory and pages older ones in.
+import json
+import os
+import threading
+from sqlalchemy import create_engine
+from database.db_utils import DATA_DIR
+
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", os.path.join(DATA_DIR, "conversations.db"))
+# Turns loaded per page when scrolling back
+PAGE_TURNS = int(os.getenv("CONVERSATION_PAGE_TURNS", "30"))
+
+conversation_engine = create_engine(f"sqlite:///{CONVERSATION_DB_PATH}")
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def _ensure_schema() -> None:
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with conversation_engine.begin() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+            conn.exec_driver_sql("""
+                CREATE TABLE IF NOT EXISTS conversation_turns (
+                    turn_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    content TEXT,
+                    summary TEXT,
+                    sqls TEXT,
+                    result_ref TEXT,
+                    row_count INTEGER,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS idx_conversation_turns_session ON conversation_turns (session_id, turn_id)"
+            )
+        _schema_ready = True
+
+
+def append_turn(session_id: str, role: str, type: str, content: str | None = None,
+                summary: str | None = None, sqls: dict | None = None,
+                result_ref: dict | None = None, row_count: int | None = None) -> dict:
+    """Store one turn; returns it as a record (see load_turns) with its turn_id."""
+    _ensure_schema()
+    with conversation_engine.begin() as conn:
+        turn_id = conn.exec_driver_sql(
+            "INSERT INTO conversation_turns (session_id, role, type, content, summary, sqls, result_ref, row_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (session_id, role, type, content, summary,
+             json.dumps(sqls) if sqls else None, json.dumps(result_ref) if result_ref else None, row_count),
+        ).lastrowid
+    return {
+        "turn_id": turn_id, "role": role, "type": type, "content": content, "summary": summary,
+        "sqls": sqls or {}, "result_ref": result_ref, "row_count": row_count,
+    }
+
+
+def update_row_count(turn_id: int, row_count: int) -> None:
+    # Rows fetched so far, kept current as more pages of the result are loaded
+    _ensure_schema()
+    with conversation_engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE conversation_turns SET row_count = ? WHERE turn_id = ?", (row_count, turn_id))
+
+
+def load_turns(session_id: str, before: int | None = None, limit: int = PAGE_TURNS) -> tuple[list[dict], bool]:
+    """The latest `limit` turns before turn `before` (or the newest), oldest first,
+    and whether earlier turns exist."""
+    _ensure_schema()
+    where = "session_id = ?" + (" AND turn_id < ?" if before is not None else "")
+    params = (session_id,) + ((before,) if before is not None else ())
+    with conversation_engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT turn_id, role, type, content, summary, sqls, result_ref, row_count "
+            f"FROM conversation_turns WHERE {where} ORDER BY turn_id DESC LIMIT {limit + 1}",
+            params,
+        ).fetchall()
+    turns = [
+        {
+            "turn_id": row[0], "role": row[1], "type": row[2], "content": row[3], "summary": row[4],
+            "sqls": json.loads(row[5]) if row[5] else {},
+            "result_ref": json.loads(row[6]) if row[6] else None,
+            "row_count": row[7],
+        }
+        for row in rows[:limit]
+    ]
+    return turns[::-1], len(rows) > limit
+
@@ -0,0 +1,39 @@
+# data_version.py
+# Process-wide per-table data versions. Every write path bumps the tables it touched,
+# so anything cached against an older version can never be served again.
+import threading
+
+_versions: dict[str, int] = {}
+_resets = 0
+_global_version = 0
+_lock = threading.Lock()
+
+
+def bump(*tables: str) -> None:
+    global _global_version
+    with _lock:
+        _global_version += 1
+        for table in tables:
+            table = table.lower()
+            _versions[table] = _versions.get(table, 0) + 1
+
+
+def bump_all() -> None:
+    # Schema resets: invalidates every table, including ones not seen yet
+    global _global_version, _resets
+    with _lock:
+        _global_version += 1
+        _resets += 1
+
+
+def table_version(table: str) -> int:
+    with _lock:
+        return _versions.get(table.lower(), 0) + _resets
+
+
+def snapshot(tables) -> tuple:
+    """Version key for a set of tables; an empty set falls back to the global version."""
+    with _lock:
+        if not tables:
+            return (("*", _global_version),)
+        return tuple((t, _versions.get(t, 0) + _resets) for t in sorted({t.lower() for t in tables}))
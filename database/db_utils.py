@@ -1,10 +1,13 @@
 from sqlalchemy import create_engine
+from contextlib import contextmanager
+import atexit
+import threading
 import duckdb
 import os
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
-SQLITE_DB_PATH = os.path.join(DATA_DIR, "sales_data.db")
-DUCKDB_DB_PATH = os.path.join(DATA_DIR, "retail_data.duckdb")
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", os.path.join(DATA_DIR, "sales_data.db"))
+DUCKDB_DB_PATH = os.getenv("DUCKDB_DB_PATH", os.path.join(DATA_DIR, "retail_data.duckdb"))
 
 # Create SQLite engine globally (safe to reuse)
 sqlite_engine = create_engine(f"sqlite:///{SQLITE_DB_PATH}")
@@ -13,5 +16,99 @@ def get_sqlite_connection():
     # Context manager usage recommended
     return sqlite_engine.connect()
 
+
+class DuckDBConnectionManager:
+    """Holds one DuckDB database instance per process and hands out per-thread cursors.
+
+    Opening the file is paid once (catalog load, WAL replay); each thread then reuses
+    its own cursor. Read-only access runs inside a READ ONLY transaction on a separate
+    cursor so it can never write, even when nested inside a read-write block.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _database(self) -> tuple[duckdb.DuckDBPyConnection, int]:
+        with self._lock:
+            if self._db is None:
+                self._db = duckdb.connect(database=self.path, read_only=False)
+                self._generation += 1
+            return self._db, self._generation
+
+    def _thread_cursor(self, read_only: bool) -> duckdb.DuckDBPyConnection:
+        db, generation = self._database()
+        if getattr(self._local, "generation", None) != generation:
+            # First use on this thread, or the database was reopened since
+            self._local.generation = generation
+            self._local.cursors = {}
+            self._local.depth = {False: 0, True: 0}
+        cursor = self._local.cursors.get(read_only)
+        if cursor is None:
+            cursor = db.cursor()
+            self._local.cursors[read_only] = cursor
+        return cursor
+
+    @contextmanager
+    def connection(self, read_only: bool = False):
+        cursor = self._thread_cursor(read_only)
+        depth = self._local.depth
+        outermost = depth[read_only] == 0
+
+        if read_only and outermost:
+            cursor.execute("BEGIN TRANSACTION READ ONLY")
+        depth[read_only] += 1
+        try:
+            yield cursor
+        finally:
+            depth[read_only] -= 1
+            if read_only and outermost:
+                # Nothing to persist; rollback also clears an aborted transaction
+                cursor.execute("ROLLBACK")
+
+    def snapshot_cursor(self) -> duckdb.DuckDBPyConnection:
+        # Dedicated cursor in its own READ ONLY transaction, for results read page by page
+        # (possibly from other threads); the caller rolls back and closes it
+        db, _ = self._database()
+        cursor = db.cursor()
+        cursor.execute("BEGIN TRANSACTION READ ONLY")
+        return cursor
+
+    def is_healthy(self) -> bool:
+        try:
+            with self.connection(read_only=True) as conn:
+                return conn.execute("SELECT 1").fetchone() == (1,)
+        except duckdb.Error:
+            return False
+
+    def ensure_healthy(self) -> None:
+        # Reopen the database if the shared instance was closed or is unusable
+        if not self.is_healthy():
+            self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                try:
+                    self._db.close()
+                except duckdb.Error:
+                    pass
+                self._db = None
+
+
+duckdb_manager = DuckDBConnectionManager(DUCKDB_DB_PATH)
+atexit.register(duckdb_manager.close)
+
+# DuckDB aborts a transaction that updates a row another transaction changed after it
+# began, and the abort cannot be retried statement by statement. Every DuckDB write in
+# this process therefore holds this lock from its BEGIN to its COMMIT: units of work
+# (from their first write or DuckDB statement), the sales mirror sync and the resets.
+# It is always taken before any other lock, SQLite's write lock included.
+writer_lock = threading.RLock()
+
 def get_duckdb_conn(read_only=False):
-    return duckdb.connect(database=DUCKDB_DB_PATH, read_only=read_only)
+    # Per-thread cursor on the shared database; not closed on exit of the with-block
+    return duckdb_manager.connection(read_only=read_only)
@@ -0,0 +1,143 @@
+# inventory.py
+# Shared inventory-mutation layer. Each order transition is a single arithmetic
+# UPDATE ... RETURNING on the inventory row, so the business rule runs inside DuckDB
+# (no read-modify-write in Python, no lost updates between concurrent orders).
+from database.db_utils import writer_lock
+from database.unit_of_work import wrote
+
+# Transition name -> (SET clause, extra WHERE condition, RETURNING columns).
+# {qty} is the quantity for the row: a bound parameter for single updates, or the
+# aggregated per-product column of the VALUES list for batch updates.
+TRANSITIONS = {
+    # create_order: commit stock; anything above total_qty becomes backorder
+    "commit": (
+        """committed_qty = committed_qty + {qty},
+        available_qty = GREATEST(0, total_qty - (committed_qty + {qty})),
+        backorder_qty = GREATEST(0, committed_qty + {qty} - total_qty)""",
+        None,
+        "committed_qty, available_qty, backorder_qty",
+    ),
+    # schedule_order: only if enough committed quantity is still unscheduled
+    "schedule": (
+        "scheduled_qty = scheduled_qty + {qty}",
+        "committed_qty - scheduled_qty >= {qty}",
+        "committed_qty, scheduled_qty, committed_qty - scheduled_qty AS remaining_schedulable",
+    ),
+    # complete_order: stock leaves the warehouse
+    "complete": (
+        """total_qty = GREATEST(0, total_qty - {qty}),
+        committed_qty = GREATEST(0, committed_qty - {qty}),
+        scheduled_qty = GREATEST(0, scheduled_qty - {qty})""",
+        None,
+        "total_qty, committed_qty, scheduled_qty",
+    ),
+    # cancel_order: reverse the allocations of the cancelled sale
+    "release": (
+        """committed_qty = GREATEST(0, committed_qty - {qty}),
+        scheduled_qty = GREATEST(0, scheduled_qty - {qty}),
+        available_qty = available_qty + {qty},
+        backorder_qty = GREATEST(0, backorder_qty - {qty})""",
+        None,
+        "committed_qty, scheduled_qty, available_qty, backorder_qty",
+    ),
+    # return_order: returned units go back on the shelf
+    "restock": (
+        """total_qty = total_qty + {qty},
+        available_qty = available_qty + {qty}""",
+        None,
+        "total_qty, available_qty",
+    ),
+    # change_order: shift commitment by the quantity delta
+    "adjust": (
+        """committed_qty = committed_qty + {qty},
+        available_qty = GREATEST(0, available_qty - {qty}),
+        backorder_qty = GREATEST(0, committed_qty + {qty} - GREATEST(0, available_qty - {qty}))""",
+        None,
+        "committed_qty, available_qty, backorder_qty",
+    ),
+}
+
+
+def _single_sql(transition: str) -> str:
+    set_clause, condition, returning = TRANSITIONS[transition]
+    where = "product_id = $product_id"
+    if condition:
+        where += " AND " + condition.format(qty="$qty")
+    return (
+        f"UPDATE inventory SET {set_clause.format(qty='$qty')} "
+        f"WHERE {where} RETURNING {returning}"
+    )
+
+
+def _batch_sql(transition: str, n_rows: int) -> str:
+    set_clause, condition, returning = TRANSITIONS[transition]
+    values = ", ".join(["(?, ?)"] * n_rows)
+    where = "inventory.product_id = d.product_id"
+    if condition:
+        where += " AND " + condition.format(qty="d.qty")
+    return (
+        f"UPDATE inventory SET {set_clause.format(qty='d.qty')} "
+        f"FROM (VALUES {values}) AS d(product_id, qty) "
+        f"WHERE {where} RETURNING inventory.product_id, {returning}"
+    )
+
+
+SINGLE_SQL = {name: _single_sql(name) for name in TRANSITIONS}
+
+
+def _execute(conn, sql: str, params):
+    # Already held inside a unit of work; a write outside one holds it for the statement
+    with writer_lock:
+        cursor = conn.execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        rows = cursor.fetchall()
+    # RETURNING gives back exactly the rows updated
+    if rows:
+        wrote("inventory")
+    return columns, rows
+
+
+def _apply(conn, transition: str, product_id: int, quantity: int) -> dict | None:
+    """Run one transition; returns the new inventory values, or None if no row matched."""
+    columns, rows = _execute(
+        conn, SINGLE_SQL[transition], {"product_id": product_id, "qty": quantity}
+    )
+    return dict(zip(columns, rows[0])) if rows else None
+
+
+def apply_batch(conn, transition: str, quantities: dict[int, int]) -> dict[int, dict]:
+    """Apply one transition to many products in a single UPDATE ... FROM (VALUES ...).
+
+    quantities maps product_id -> aggregated quantity. Returns product_id -> new
+    inventory values for every row that was updated.
+    """
+    if not quantities:
+        return {}
+    params = [v for item in quantities.items() for v in (int(item[0]), int(item[1]))]
+    columns, rows = _execute(conn, _batch_sql(transition, len(quantities)), params)
+    return {row[0]: dict(zip(columns[1:], row[1:])) for row in rows}
+
+
+def commit_stock(conn, product_id: int, quantity: int) -> dict | None:
+    return _apply(conn, "commit", product_id, quantity)
+
+
+def schedule_stock(conn, product_id: int, quantity: int) -> dict | None:
+    # None means either no inventory row or not enough unscheduled committed stock
+    return _apply(conn, "schedule", product_id, quantity)
+
+
+def complete_stock(conn, product_id: int, quantity: int) -> dict | None:
+    return _apply(conn, "complete", product_id, quantity)
+
+
+def release_stock(conn, product_id: int, quantity: int) -> dict | None:
+    return _apply(conn, "release", product_id, quantity)
+
+
+def restock_returned(conn, product_id: int, quantity: int) -> dict | None:
+    return _apply(conn, "restock", product_id, quantity)
+
+
+def adjust_commitment(conn, product_id: int, delta_qty: int) -> dict | None:
+    return _apply(conn, "adjust", product_id, delta_qty)
@@ -0,0 +1,27 @@
+# reset.py
+# What the Reset buttons run: recreate one store, then reset everything derived from
+# the data (sales mirror, data versions, schema catalog) the same way whichever store
+# it was.
+from database.db_utils import writer_lock
+from database.populate_duckdb import populate_duckdb
+from database.sales_mirror import reset_sales_mirror
+from database.schema_catalog import refresh_schema_catalog
+from database.schema_duckdb import create_duckdb_schema
+from database.schema_sqlite import create_sqlite_schema
+from database import data_version
+
+
+def reset_store(store: str) -> None:
+    """Recreate `store` ("duckdb" or "sqlite") and reset every derived state. Runs under
+    writer_lock, so no unit of work or mirror sync sees a half-built store."""
+    with writer_lock:
+        if store == "duckdb":
+            create_duckdb_schema()
+            populate_duckdb()
+        elif store == "sqlite":
+            create_sqlite_schema()
+        else:
+            raise ValueError(f"Unknown store '{store}'")
+        reset_sales_mirror()
+        data_version.bump_all()
+        refresh_schema_catalog()
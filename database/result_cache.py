@@ -0,0 +1,98 @@
+# result_cache.py
+# Process-wide cache of insight query results, keyed by normalized SQL plus the global
+# data version, which every write bumps. Results are kept as Arrow tables (compact,
+# columnar) and evicted LRU by entry count and total bytes. A streamed result is
+# cached once it has been read to the end.
+from collections import OrderedDict
+import os
+import re
+import threading
+import pyarrow as pa
+from database import data_version
+from database.result_handle import ResultHandle
+
+MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_LITERAL_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def normalize_sql(sql: str) -> str:
+    # Case/whitespace-insensitive outside of quoted literals and identifiers
+    parts = _LITERAL_RE.split(sql.strip().rstrip(";"))
+    return "".join(
+        part if i % 2 else re.sub(r"\s+", " ", part.lower())
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, engine: str, *sqls: str) -> tuple:
+        # Not per table: the tables a query reads cannot be told reliably from its text
+        # (comma joins, schema-qualified names, views), and a missed table would serve
+        # stale rows. Tool writes touch sales and inventory together anyway.
+        return (engine, tuple(normalize_sql(sql) for sql in sqls), data_version.snapshot(()))
+
+    def get(self, key: tuple) -> tuple[pa.Table, bool] | None:
+        """(table, truncated) for a cached result, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def put(self, key: tuple, table: pa.Table, truncated: bool = False) -> None:
+        if table.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0].nbytes
+            self._entries[key] = (table, truncated)
+            self._bytes += table.nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def get_or_open(self, engine: str, sqls: tuple[str, ...], open_handle) -> ResultHandle:
+        """Serve from cache, or call open_handle() and cache the result once fully read."""
+        # Keyed on the versions seen before the query starts, so rows read after a
+        # concurrent write are filed under the old version and never served again
+        key = self.key(engine, *sqls)
+        entry = self.get(key)
+        if entry is not None:
+            return ResultHandle.from_table(*entry)
+        handle = open_handle()
+        handle.on_complete = lambda h: self.put(key, h.table(), h.truncated)
+        return handle
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+result_cache = ResultCache()
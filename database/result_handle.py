@@ -0,0 +1,153 @@
+# result_handle.py
+# Cursor-backed query results. A handle pulls Arrow record batches from its source
+# only as pages are requested, so the first rows can be shown without reading the
+# whole result, and only the rows paged through so far are held in memory.
+import os
+import threading
+from collections import OrderedDict
+import pyarrow as pa
+
+PAGE_ROWS = int(os.getenv("RESULT_PAGE_ROWS", "50"))
+# Open cursors are capped; the least recently used handle is closed and, if more of it
+# is requested later, re-opened past the rows it already has
+MAX_OPEN_HANDLES = int(os.getenv("RESULT_MAX_OPEN_HANDLES", "8"))
+
+_open_handles: OrderedDict = OrderedDict()
+_open_lock = threading.Lock()
+
+
+def _skip_rows(batches, rows: int):
+    for batch in batches:
+        if rows >= batch.num_rows:
+            rows -= batch.num_rows
+            continue
+        yield batch.slice(rows)
+        rows = 0
+
+
+class ResultHandle:
+    """Paged access to a query result.
+
+    opener() starts the query and returns (iterator of pa.RecordBatch, close callable).
+    on_complete(handle) is called once the source is exhausted, e.g. to cache the rows.
+    """
+
+    def __init__(self, opener, max_rows: int | None = None, on_complete=None):
+        self._opener = opener
+        self.max_rows = max_rows
+        self.on_complete = on_complete
+        self._batches: list[pa.RecordBatch] = []
+        self._source = None
+        self.num_rows = 0
+        self.exhausted = False
+        self.truncated = False
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_table(cls, table: pa.Table, truncated: bool = False) -> "ResultHandle":
+        handle = cls(opener=None)
+        handle._batches = table.to_batches() or [pa.RecordBatch.from_pylist([], schema=table.schema)]
+        handle.num_rows = table.num_rows
+        handle.exhausted = True
+        handle.truncated = truncated
+        return handle
+
+    def fork(self) -> "ResultHandle":
+        """An independent handle with the rows fetched so far, e.g. for another caller of a
+        shared query; its further pages re-open the source past those rows."""
+        with self._lock:
+            handle = ResultHandle(self._opener, max_rows=self.max_rows, on_complete=self.on_complete)
+            handle._batches = list(self._batches)
+            handle.num_rows = self.num_rows
+            handle.exhausted = self.exhausted
+            handle.truncated = self.truncated
+        return handle
+
+    @property
+    def has_more(self) -> bool:
+        return not self.exhausted
+
+    def fetch(self, rows: int = PAGE_ROWS) -> int:
+        """Pull at least `rows` more rows (whole batches) from the source; returns rows added."""
+        with self._lock:
+            added = 0
+            while added < rows and not self.exhausted:
+                batch = self._next_batch()
+                if batch is None:
+                    self._finish()
+                    break
+                if self.max_rows is not None and self.num_rows + batch.num_rows > self.max_rows:
+                    # Sources fetch one row past max_rows so a cut result can be reported
+                    batch = batch.slice(0, self.max_rows - self.num_rows)
+                    self.truncated = True
+                self._batches.append(batch)
+                self.num_rows += batch.num_rows
+                added += batch.num_rows
+                if self.truncated:
+                    self._finish()
+            return added
+
+    def first_page(self, rows: int = PAGE_ROWS) -> "ResultHandle":
+        if self.num_rows < rows and not self.exhausted:
+            self.fetch(rows - self.num_rows)
+        return self
+
+    def table(self) -> pa.Table:
+        """Rows fetched so far."""
+        if not self._batches:
+            return pa.table({})
+        # SQLite chunks are typed per chunk (e.g. all-NULL first chunk), so unify on concat
+        return pa.concat_tables(
+            [pa.Table.from_batches([b]) for b in self._batches], promote_options="permissive"
+        )
+
+    def to_pandas(self):
+        return self.table().to_pandas()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_source()
+
+    def _next_batch(self) -> pa.RecordBatch | None:
+        if self._source is None:
+            batches, close = self._opener()
+            self._source = (_skip_rows(batches, self.num_rows), close)
+            _register(self)
+        try:
+            return next(self._source[0])
+        except StopIteration:
+            return None
+
+    def _finish(self) -> None:
+        self.exhausted = True
+        self._close_source()
+        if self.on_complete is not None:
+            self.on_complete(self)
+
+    def _close_source(self) -> None:
+        if self._source is not None:
+            source, self._source = self._source, None
+            with _open_lock:
+                _open_handles.pop(id(self), None)
+            try:
+                source[1]()
+            except Exception as e:
+                print(f"[WARN] Could not close result cursor: {e}")
+
+    def __repr__(self) -> str:
+        state = "exhausted" if self.exhausted else "open"
+        return f"<ResultHandle rows={self.num_rows} {state}{' truncated' if self.truncated else ''}>"
+
+
+def _register(handle: ResultHandle) -> None:
+    with _open_lock:
+        _open_handles[id(handle)] = handle
+        candidates = [h for h in _open_handles.values() if h is not handle]
+        overflow = len(_open_handles) - MAX_OPEN_HANDLES
+    # Close outside the registry lock; a handle busy fetching on another thread is skipped
+    for oldest in candidates[:max(overflow, 0)]:
+        if oldest._lock.acquire(blocking=False):
+            try:
+                oldest._close_source()
+            finally:
+                oldest._lock.release()
@@ -0,0 +1,194 @@
+# sales_mirror.py
+# Incremental replication of the SQLite sales table into a columnar DuckDB copy
+# (retail_data.duckdb: sales) so aggregate insight queries run on DuckDB.
+#
+# New orders are picked up by a high-water mark on sale_id; status/quantity updates
+# are picked up from the sales_changes log, which a SQLite trigger fills on every
+# UPDATE the tools make to sales. Log rows are deleted once the mirror has them.
+import os
+import re
+import threading
+import time
+import pandas as pd
+from sqlalchemy import text
+from database.db_utils import get_duckdb_conn, sqlite_engine, writer_lock
+from database.schema_sqlite import create_sales_change_log
+from database import data_version
+
+# Aggregates may be served from a mirror at most this many seconds behind SQLite
+MAX_STALENESS_SECONDS = float(os.getenv("SALES_MIRROR_MAX_STALENESS", "5"))
+SYNC_CHUNK_ROWS = 100_000
+
+SALES_COLUMNS = ["sale_id", "product_id", "quantity", "sale_date", "revenue", "order_status"]
+
+_sync_lock = threading.Lock()
+_last_sync = 0.0
+_synced_version = None
+_schema_ready = False
+
+
+def ensure_change_log() -> None:
+    # Databases created before the change log existed get it on first sync
+    with sqlite_engine.begin() as conn:
+        create_sales_change_log(conn)
+
+
+def ensure_mirror_schema() -> None:
+    with get_duckdb_conn() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sales (
+                sale_id INTEGER PRIMARY KEY,
+                product_id INTEGER,
+                quantity INTEGER,
+                sale_date VARCHAR,
+                revenue DOUBLE,
+                order_status VARCHAR
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sales_mirror_state (
+                last_sale_id BIGINT,
+                last_change_id BIGINT,
+                synced_at TIMESTAMP
+            )
+        """)
+
+
+def _copy_sales(sqlite_conn, duck_conn, query: str, params: dict, replace: bool) -> int:
+    # Plain appends for new rows; INSERT OR REPLACE (slower, index lookups) only for changed rows
+    statement = "INSERT OR REPLACE INTO sales" if replace else "INSERT INTO sales"
+    copied = 0
+    for chunk in pd.read_sql_query(text(query), sqlite_conn, params=params, chunksize=SYNC_CHUNK_ROWS):
+        duck_conn.register("sales_batch", chunk[SALES_COLUMNS])
+        try:
+            duck_conn.execute(f"{statement} SELECT * FROM sales_batch")
+        finally:
+            duck_conn.unregister("sales_batch")
+        copied += len(chunk)
+    return copied
+
+
+def sync_sales_mirror() -> dict:
+    """Bring the DuckDB sales mirror up to date; returns counts of copied rows."""
+    global _last_sync, _synced_version, _schema_ready
+    # writer_lock before _sync_lock, the order every DuckDB writer takes them in
+    with writer_lock, _sync_lock:
+        # Taken before reading, so writes that race with this sync force another one
+        version = data_version.table_version("sales")
+        if not _schema_ready:
+            ensure_change_log()
+            ensure_mirror_schema()
+            _schema_ready = True
+
+        with sqlite_engine.connect() as sqlite_conn, get_duckdb_conn() as duck_conn:
+            state = duck_conn.execute(
+                "SELECT last_sale_id, last_change_id FROM sales_mirror_state"
+            ).fetchone()
+            last_sale_id, last_change_id = state if state else (0, 0)
+
+            # Read the change-log mark first so updates racing with this sync land next time.
+            # AUTOINCREMENT's counter, not MAX(change_id): the log is pruned, the counter
+            # only goes back to 0 when the table is dropped
+            change_mark = sqlite_conn.execute(
+                text("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'sales_changes'")
+            ).scalar()
+            sale_mark = sqlite_conn.execute(text("SELECT COALESCE(MAX(sale_id), 0) FROM sales")).scalar()
+
+            duck_conn.execute("BEGIN TRANSACTION")
+            try:
+                full_rebuild = sale_mark < last_sale_id or change_mark < last_change_id
+                if full_rebuild:
+                    # The SQLite table was reset underneath us; start over
+                    duck_conn.execute("DELETE FROM sales")
+                    last_sale_id, last_change_id = 0, 0
+
+                new_rows = _copy_sales(
+                    sqlite_conn, duck_conn,
+                    "SELECT * FROM sales WHERE sale_id > :last AND sale_id <= :mark ORDER BY sale_id",
+                    {"last": last_sale_id, "mark": sale_mark}, replace=False
+                )
+                changed_rows = _copy_sales(
+                    sqlite_conn, duck_conn,
+                    """
+                    SELECT * FROM sales WHERE sale_id <= :last_sale AND sale_id IN (
+                        SELECT sale_id FROM sales_changes WHERE change_id > :last_change AND change_id <= :mark
+                    )
+                    """,
+                    {"last_sale": last_sale_id, "last_change": last_change_id, "mark": change_mark},
+                    replace=True
+                )
+
+                duck_conn.execute("DELETE FROM sales_mirror_state")
+                duck_conn.execute(
+                    "INSERT INTO sales_mirror_state VALUES (?, ?, now())",
+                    (sale_mark, change_mark)
+                )
+                duck_conn.execute("COMMIT")
+            except Exception:
+                duck_conn.execute("ROLLBACK")
+                raise
+
+        _prune_change_log(change_mark)
+        _last_sync = time.monotonic()
+        _synced_version = version
+        return {"new_rows": new_rows, "changed_rows": changed_rows, "full_rebuild": full_rebuild}
+
+
+def _prune_change_log(change_mark: int) -> None:
+    # The mirror has committed every change up to the mark; they are never read again
+    try:
+        with sqlite_engine.begin() as conn:
+            conn.execute(text("DELETE FROM sales_changes WHERE change_id <= :mark"), {"mark": change_mark})
+    except Exception as e:
+        # Left for the next sync to delete
+        print(f"[WARN] Could not prune the sales change log: {e}")
+
+
+_AGGREGATE_RE = re.compile(r"\b(?:sum|count|avg|min|max|total)\s*\(|\bgroup\s+by\b", re.IGNORECASE)
+_TABLE_RE = re.compile(r"\b(?:from|join)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_CALL_RE = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+
+# The SQL is written for SQLite and the mirror runs it unchanged, so it may only use what
+# gives the same answer on both engines over sales (all of whose columns are NOT NULL).
+# Anything else stays on SQLite: LIKE is case-insensitive there only, / divides integers
+# there only, CAST truncates there but rounds on DuckDB, and the date functions take
+# their arguments in a different order. CASE is left out as it can produce NULLs, which
+# the engines sort differently.
+SAME_ON_BOTH_FUNCTIONS = {"sum", "count", "avg", "min", "max", "abs", "coalesce", "round"}
+_KEYWORDS_BEFORE_PAREN = {
+    "in", "exists", "from", "join", "as", "and", "or", "not", "on", "select", "where", "having", "when",
+    "then", "else", "distinct", "by",
+}
+_DIFFERENT_RE = re.compile(r"/|%|::|\b(?:like|glob|regexp|match|cast|collate|case)\b", re.IGNORECASE)
+
+
+def is_mirrorable_aggregate(sql: str) -> bool:
+    """True for aggregate queries that only read the sales table and only use functions
+    and operators that behave the same on SQLite and DuckDB."""
+    tables = {t.lower() for t in _TABLE_RE.findall(sql)}
+    if tables != {"sales"} or _AGGREGATE_RE.search(sql) is None:
+        return False
+    # Literals may contain anything, e.g. '%' in a LIKE pattern or '/' in a date
+    code = _LITERAL_RE.sub("''", sql)
+    calls = {name.lower() for name in _CALL_RE.findall(code)} - _KEYWORDS_BEFORE_PAREN
+    return calls <= SAME_ON_BOTH_FUNCTIONS and _DIFFERENT_RE.search(code) is None
+
+
+def ensure_fresh(max_staleness: float = MAX_STALENESS_SECONDS) -> None:
+    # Writes made by this process are always replicated before a read; the staleness
+    # bound only applies to writes from other processes
+    if _synced_version != data_version.table_version("sales") or time.monotonic() - _last_sync > max_staleness:
+        sync_sales_mirror()
+
+
+def reset_sales_mirror() -> None:
+    """Drop mirrored rows after the SQLite sales table is recreated."""
+    global _last_sync, _synced_version
+    with writer_lock, _sync_lock:
+        ensure_mirror_schema()
+        with get_duckdb_conn() as conn:
+            conn.execute("DELETE FROM sales")
+            conn.execute("DELETE FROM sales_mirror_state")
+        _last_sync = 0.0
+        _synced_version = None
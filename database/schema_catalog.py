@@ -0,0 +1,194 @@
+# schema_catalog.py
+# Introspected schemas of both stores, used to build the schema section of the
+# NL-to-SQL prompt. Introspection runs once per process (refresh_schema_catalog()
+# after a reset); each question then gets only the tables/columns a lexical ranker
+# finds relevant, so the prompt stays the same size as the schema grows.
+import hashlib
+import json
+import math
+import re
+import threading
+from sqlalchemy import text
+from database.db_utils import get_duckdb_conn, sqlite_engine
+
+# Bookkeeping tables that are never offered to the LLM (the DuckDB sales table is the
+# columnar mirror of SQLite sales; questions about sales target SQLite)
+INTERNAL_TABLES = {
+    "duckdb": {"sales", "sales_mirror_state"},
+    "sqlite": {"sales_changes"},
+}
+
+MAX_TABLES = 6
+# Tables scoring below this fraction of the best match are left out
+MIN_RELATIVE_SCORE = 0.3
+# Tables up to this width are always shown whole; wider ones keep keys + matching columns
+MAX_FULL_COLUMNS = 12
+
+# Domain words that do not share a token with the table/column they refer to
+SYNONYMS = {
+    "sold": "sale quantity", "sell": "sale", "selling": "sale", "bought": "sale",
+    "order": "sale order_status", "revenue": "sale revenue", "earned": "revenue",
+    "stock": "inventory qty", "backorder": "inventory backorder_qty",
+    "available": "inventory available_qty", "item": "product", "cost": "price",
+}
+
+_TYPE_NAMES = {
+    "INTEGER": "int", "BIGINT": "int", "SMALLINT": "int", "HUGEINT": "int",
+    "DOUBLE": "float", "REAL": "float", "FLOAT": "float", "DECIMAL": "float",
+    "VARCHAR": "text", "TEXT": "text", "BOOLEAN": "bool", "DATE": "date", "TIMESTAMP": "timestamp",
+}
+
+
+def _short_type(data_type: str) -> str:
+    return _TYPE_NAMES.get(data_type.upper().split("(")[0].strip(), data_type.lower())
+
+
+def _stem(token: str) -> str:
+    return token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+
+
+def tokenize(value: str) -> list[str]:
+    return [_stem(t) for t in re.findall(r"[a-z]+", value.lower())]
+
+
+def _question_tokens(question: str) -> list[str]:
+    tokens = []
+    for token in re.findall(r"[a-z_]+", question.lower()):
+        tokens += tokenize(token) + tokenize(SYNONYMS.get(token, SYNONYMS.get(_stem(token), "")))
+    return tokens
+
+
+def introspect_duckdb() -> list[dict]:
+    with get_duckdb_conn(read_only=True) as conn:
+        rows = conn.execute("""
+            SELECT table_name, column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = 'main'
+            ORDER BY table_name, ordinal_position
+        """).fetchall()
+    tables: dict[str, list] = {}
+    for table, column, data_type in rows:
+        tables.setdefault(table, []).append((column, _short_type(data_type)))
+    return [{"store": "duckdb", "name": name, "columns": columns} for name, columns in tables.items()]
+
+
+def introspect_sqlite() -> list[dict]:
+    with sqlite_engine.connect() as conn:
+        names = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )).scalars().all()
+        return [
+            {
+                "store": "sqlite",
+                "name": name,
+                "columns": [(row[1], _short_type(row[2] or "")) for row in conn.execute(text(f'PRAGMA table_info("{name}")'))],
+            }
+            for name in names
+        ]
+
+
+def serialize_table(table: dict, columns: list[tuple[str, str]] | None = None) -> str:
+    columns = table["columns"] if columns is None else columns
+    return f"- {table['name']}({', '.join(f'{c} {t}' for c, t in columns)})"
+
+
+class SchemaCatalog:
+    def __init__(self, tables: list[dict]):
+        self.tables = [t for t in tables if t["name"] not in INTERNAL_TABLES.get(t["store"], set())]
+        self.version = hashlib.sha1(
+            json.dumps([[t["store"], t["name"], t["columns"]] for t in self.tables]).encode("utf-8")
+        ).hexdigest()[:12]
+
+        # Per-table token bags and IDF over tables, built once per catalog
+        self._table_tokens = [set(tokenize(t["name"])) for t in self.tables]
+        self._column_tokens = [[set(tokenize(c)) for c, _ in t["columns"]] for t in self.tables]
+        documents = [
+            names | set().union(*columns) if columns else names
+            for names, columns in zip(self._table_tokens, self._column_tokens)
+        ]
+        counts: dict[str, int] = {}
+        for document in documents:
+            for token in document:
+                counts[token] = counts.get(token, 0) + 1
+        self._idf = {t: math.log(1 + len(documents) / c) for t, c in counts.items()}
+        self._documents = documents
+        self._by_name = {_stem(t["name"].lower()): i for i, t in enumerate(self.tables)}
+
+    @classmethod
+    def introspect(cls) -> "SchemaCatalog":
+        return cls(introspect_duckdb() + introspect_sqlite())
+
+    def rank(self, question: str, max_tables: int = MAX_TABLES) -> list[tuple[int, float]]:
+        """(table index, score) of the best-matching tables, best first."""
+        tokens = set(_question_tokens(question))
+        scored = []
+        for i, document in enumerate(self._documents):
+            # Table-name matches count double; column matches once
+            score = sum(self._idf[t] for t in tokens & document) + sum(self._idf[t] for t in tokens & self._table_tokens[i])
+            if score > 0:
+                scored.append((i, score))
+        scored.sort(key=lambda r: -r[1])
+        return [(i, score) for i, score in scored[:max_tables] if score >= MIN_RELATIVE_SCORE * scored[0][1]]
+
+    def with_key_tables(self, ranked: list[tuple[int, float]], max_tables: int = MAX_TABLES) -> list[tuple[int, float]]:
+        """Ranked tables plus the tables their keys point at (product_id -> product), so
+        e.g. product names stay available when only sales matched the question."""
+        chosen = list(ranked)
+        for i, _ in ranked:
+            for column, _ in self.tables[i]["columns"]:
+                owner = self._by_name.get(_stem(column[:-3])) if column.endswith("_id") else None
+                if owner is not None and len(chosen) < max_tables and all(owner != j for j, _ in chosen):
+                    chosen.append((owner, 0.0))
+        return chosen
+
+    def _columns_for(self, i: int, tokens: set[str]) -> list[tuple[str, str]]:
+        columns = self.tables[i]["columns"]
+        if len(columns) <= MAX_FULL_COLUMNS:
+            return columns
+        return [
+            column for column, column_tokens in zip(columns, self._column_tokens[i])
+            if column[0].endswith("_id") or column[0] == "id" or tokens & column_tokens
+        ]
+
+    def prompt_for(self, question: str, max_tables: int = MAX_TABLES) -> str:
+        """Compact schema section for the NL-to-SQL prompt, pruned to this question."""
+        ranked = self.with_key_tables(self.rank(question, max_tables), max_tables)
+        if not ranked:
+            # Nothing matched: a small schema is shown whole, a large one only up to max_tables
+            ranked = [(i, 0.0) for i in range(min(len(self.tables), max_tables))]
+
+        tokens = set(_question_tokens(question))
+        sections = []
+        for store, title in (("duckdb", "DuckDB Tables:"), ("sqlite", "SQLite Tables:")):
+            lines = [
+                serialize_table(self.tables[i], self._columns_for(i, tokens))
+                for i, _ in ranked if self.tables[i]["store"] == store
+            ]
+            if lines:
+                sections.append("\n".join([title] + lines))
+        return "\n\n".join(sections)
+
+    def full_prompt(self) -> str:
+        return "\n".join(serialize_table(t) for t in self.tables)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_schema_catalog() -> SchemaCatalog:
+    # Introspected on first use, then cached for the process
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = SchemaCatalog.introspect()
+    return _catalog
+
+
+def refresh_schema_catalog() -> SchemaCatalog:
+    """Re-introspect after a schema change; returns the new catalog (see .version)."""
+    global _catalog
+    with _catalog_lock:
+        _catalog = SchemaCatalog.introspect()
+    return _catalog
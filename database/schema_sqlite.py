@@ -1,10 +1,27 @@
 from database.db_utils import sqlite_engine
 from sqlalchemy import text
 
+def create_sales_change_log(conn):
+    # Every update to a sale is logged so the DuckDB sales mirror can replicate it
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS sales_changes (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sale_id INTEGER NOT NULL
+        )
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS sales_change_log
+        AFTER UPDATE OF quantity, revenue, order_status ON sales
+        BEGIN
+            INSERT INTO sales_changes (sale_id) VALUES (NEW.sale_id);
+        END
+    """))
+
 def create_sqlite_schema():
     engine = sqlite_engine
     with engine.begin() as conn:
         conn.execute(text("DROP TABLE IF EXISTS sales"))
+        conn.execute(text("DROP TABLE IF EXISTS sales_changes"))
         
         conn.execute(text("""
             CREATE TABLE IF NOT EXISTS sales (
@@ -16,6 +33,7 @@ def create_sqlite_schema():
                 order_status TEXT NOT NULL
             )
         """))
+        create_sales_change_log(conn)
     print("SQLite schema created.")
 
 if __name__ == "__main__":
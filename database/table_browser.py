@@ -0,0 +1,94 @@
+# table_browser.py
+# Read-only, paged access to both stores for the app's table browser. Pages are
+# fetched by keyset (WHERE key > last key ORDER BY key LIMIT n), so every page costs
+# one index seek whatever the table size, and row counts come from metadata.
+import os
+import pandas as pd
+from database.db_utils import get_duckdb_conn, sqlite_engine
+
+PAGE_ROWS = int(os.getenv("TABLE_BROWSER_PAGE_ROWS", "100"))
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def list_tables(store: str) -> list[tuple[str, int | None]]:
+    """(table, approximate row count) for every user table in the store."""
+    if store == "duckdb":
+        with get_duckdb_conn(read_only=True) as conn:
+            return conn.execute(
+                "SELECT table_name, estimated_size FROM duckdb_tables() WHERE schema_name = 'main' ORDER BY table_name"
+            ).fetchall()
+
+    with sqlite_engine.connect() as conn:
+        names = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        ).scalars().all()
+        has_stats = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).scalar() is not None
+        tables = []
+        for name in names:
+            # ANALYZE statistics when present, else the rowid high-water mark (a b-tree seek)
+            rows = None
+            if has_stats:
+                stat = conn.exec_driver_sql("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (name,)).scalar()
+                rows = int(stat.split()[0]) if stat else None
+            if rows is None:
+                try:
+                    rows = conn.exec_driver_sql(f"SELECT COALESCE(MAX(rowid), 0) FROM {_quote(name)}").scalar()
+                except Exception:
+                    rows = None
+            tables.append((name, rows))
+        return tables
+
+
+def key_columns(store: str, table: str) -> list[str]:
+    """Primary key columns, or the engine's rowid for tables without one."""
+    if store == "duckdb":
+        with get_duckdb_conn(read_only=True) as conn:
+            row = conn.execute(
+                "SELECT constraint_column_names FROM duckdb_constraints() "
+                "WHERE table_name = ? AND constraint_type = 'PRIMARY KEY'", [table]
+            ).fetchone()
+        return list(row[0]) if row else ["rowid"]
+
+    with sqlite_engine.connect() as conn:
+        info = conn.exec_driver_sql(f"PRAGMA table_info({_quote(table)})").fetchall()
+    keys = [row[1] for row in sorted(info, key=lambda r: r[5]) if row[5] > 0]
+    return keys or ["rowid"]
+
+
+def fetch_page(store: str, table: str, after: tuple | None = None,
+               limit: int = PAGE_ROWS) -> tuple[pd.DataFrame, tuple | None]:
+    """One page of rows ordered by key, starting after the `after` key.
+
+    Returns (rows, key to pass as `after` for the next page, or None on the last page).
+    """
+    keys = key_columns(store, table)
+    key_select = ", ".join(f"{k if k == 'rowid' else _quote(k)} AS __key{i}" for i, k in enumerate(keys))
+    key_list = ", ".join(f"__key{i}" for i in range(len(keys)))
+    where = ""
+    if after is not None:
+        # Row-value comparison handles composite keys in both engines
+        where = f"WHERE ({', '.join(k if k == 'rowid' else _quote(k) for k in keys)}) > ({', '.join('?' for _ in keys)})"
+    # One row past the page tells whether there is a next page
+    sql = f"SELECT {key_select}, * FROM {_quote(table)} {where} ORDER BY {key_list} LIMIT {limit + 1}"
+    params = list(after) if after is not None else []
+
+    if store == "duckdb":
+        with get_duckdb_conn(read_only=True) as conn:
+            frame = conn.execute(sql, params).fetchdf()
+    else:
+        with sqlite_engine.connect() as conn:
+            frame = pd.read_sql_query(sql, conn, params=tuple(params))
+
+    key_names = [f"__key{i}" for i in range(len(keys))]
+    next_after = None
+    if len(frame) > limit:
+        frame = frame.iloc[:limit]
+        last = frame.iloc[-1]
+        # Plain Python values so the key can be cached and bound as a parameter again
+        next_after = tuple(v.item() if hasattr(v, "item") else v for v in last[key_names])
+    return frame.drop(columns=key_names).reset_index(drop=True), next_after
@@ -0,0 +1,143 @@
+# unit_of_work.py
+# One SQLite transaction + one DuckDB transaction per tool call, committed one after the
+# other. There is no two-phase commit across the stores: if DuckDB fails to commit after
+# SQLite has, the sale is saved while its inventory change is lost, and the two stores
+# are out of sync until someone reconciles them. That case raises StoresOutOfSync and
+# logs the SQLite writes involved.
+from contextlib import ExitStack, contextmanager
+import re
+import threading
+from sqlalchemy import event
+from database.db_utils import get_duckdb_conn, sqlite_engine, writer_lock
+from database import data_version
+
+_active = threading.local()
+
+# A write statement and the table it writes
+_SQLITE_WRITE_RE = re.compile(
+    r"\s*(?:insert\s+(?:or\s+\w+\s+)?into|replace\s+into|update(?:\s+or\s+\w+)?|delete\s+from)\s+[\"`\[]?(\w+)",
+    re.IGNORECASE,
+)
+
+
+class StoresOutOfSync(Exception):
+    """SQLite committed a unit whose DuckDB side failed to commit."""
+
+
+class UnitOfWork:
+    def __init__(self, sqlite_conn, scope: ExitStack):
+        self.sqlite = sqlite_conn
+        self._scope = scope
+        self._locked = False
+        self._duckdb = None
+        self._rollback_only = False
+        # (statement, parameters) of every SQLite write, for the out-of-sync report
+        self.sqlite_writes = []
+        # Tables that rows were written to; only their data versions are bumped on commit
+        self.written = set()
+        event.listen(sqlite_conn, "before_cursor_execute", self._before_sqlite_statement)
+        event.listen(sqlite_conn, "after_cursor_execute", self._after_sqlite_statement)
+
+    def _hold_writer_lock(self) -> None:
+        # Held from the unit's first write (or first DuckDB use) until it has committed.
+        # Reads before that run without it; taking it no later than the first SQLite
+        # write keeps the order writer_lock -> SQLite write lock the same in every unit.
+        if not self._locked:
+            self._scope.enter_context(writer_lock)
+            self._locked = True
+
+    def _before_sqlite_statement(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if _SQLITE_WRITE_RE.match(statement):
+            self._hold_writer_lock()
+            self.sqlite_writes.append((" ".join(statement.split()), parameters))
+
+    def _after_sqlite_statement(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        match = _SQLITE_WRITE_RE.match(statement)
+        if match and cursor.rowcount > 0:
+            self.written.add(match.group(1))
+
+    @property
+    def duckdb(self):
+        # The DuckDB transaction starts on first use, under writer_lock: its snapshot must
+        # not predate another writer's commit
+        if self._duckdb is None:
+            self._hold_writer_lock()
+            conn = self._scope.enter_context(get_duckdb_conn())
+            conn.execute("BEGIN TRANSACTION")
+            self._duckdb = conn
+        return self._duckdb
+
+    def _finish_duckdb(self, statement: str) -> None:
+        if self._duckdb is not None:
+            self._duckdb.execute(statement)
+
+    def rollback(self) -> None:
+        """Discard everything written in this unit when the block exits."""
+        self._rollback_only = True
+
+
+@contextmanager
+def unit_of_work():
+    # Nested calls on the same thread join the outer unit instead of opening a second one
+    current = getattr(_active, "uow", None)
+    if current is not None:
+        yield current
+        return
+
+    with ExitStack() as scope, sqlite_engine.connect() as sqlite_conn:
+        sqlite_tx = sqlite_conn.begin()
+        uow = UnitOfWork(sqlite_conn, scope)
+        _active.uow = uow
+        try:
+            yield uow
+        except BaseException:
+            sqlite_tx.rollback()
+            uow._finish_duckdb("ROLLBACK")
+            raise
+        else:
+            if uow._rollback_only:
+                sqlite_tx.rollback()
+                uow._finish_duckdb("ROLLBACK")
+            else:
+                # SQLite first: a busy/locked failure there still lets DuckDB roll back
+                try:
+                    sqlite_tx.commit()
+                except BaseException:
+                    uow._finish_duckdb("ROLLBACK")
+                    raise
+                try:
+                    uow._finish_duckdb("COMMIT")
+                except Exception as e:
+                    _out_of_sync(uow, e)
+                # Only after both commits, so a cached read can never pair new versions with old data
+                if uow.written:
+                    data_version.bump(*uow.written)
+        finally:
+            _active.uow = None
+
+
+def _out_of_sync(uow: UnitOfWork, error: Exception) -> None:
+    # SQLite has committed and cannot be undone from here: flag it loudly with what was
+    # written, and drop cached reads of the SQLite side, which did change
+    try:
+        uow.duckdb.execute("ROLLBACK")
+    except Exception:
+        pass
+    if uow.written:
+        data_version.bump(*uow.written)
+    print(f"[WARN] DuckDB commit failed after SQLite committed ({error}); SQLite and DuckDB are "
+          f"out of sync. SQLite writes to reconcile: {uow.sqlite_writes}")
+    raise StoresOutOfSync(
+        f"saved in SQLite, but the inventory change failed to commit ({error}); "
+        "sales and inventory are out of sync"
+    ) from error
+
+
+def wrote(*tables: str) -> None:
+    """Record a write to `tables` on this thread: bumped when the unit of work commits,
+    or right away outside one."""
+    uow = getattr(_active, "uow", None)
+    if uow is None:
+        data_version.bump(*tables)
+    else:
+        uow.written.update(tables)
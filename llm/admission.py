@@ -0,0 +1,264 @@
+# admission.py
+# Process-wide admission control for LLM requests. Before it is sent, every request
+# (retries and hedges included) takes one unit from a requests-per-minute bucket and its
+# token budget (estimated prompt + max_tokens) from a tokens-per-minute bucket. Requests
+# the buckets cannot cover yet wait in one priority queue, interactive ahead of batch and
+# first come first served within a priority. When the queue is full or the expected wait
+# is over the limit, a request is shed at once with Busy rather than piling onto the
+# provider, and a 429 pauses admission for the provider's retry-after.
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+ADMISSION_CONTROL = os.getenv("LLM_ADMISSION_CONTROL", "1") == "1"
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+# Providers enforce per-minute limits over shorter windows, so a bucket holds at most
+# this many seconds' worth of its per-minute allowance
+BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", "10"))
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))
+MAX_WAIT_SECONDS = float(os.getenv("LLM_MAX_WAIT_SECONDS", "5"))
+# Lower rank goes first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+_priority = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+class Busy(Exception):
+    """Shed by admission control; the request was never sent."""
+
+
+def set_priority(priority: str) -> None:
+    """Priority of the LLM requests made in the current context (thread or task)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    _priority.set(priority)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float, now: float):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1)
+        self.level = self.capacity
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        return max(amount - self.level, 0) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+
+class Ticket:
+    __slots__ = ("priority", "tokens", "enqueued_at", "admitted", "cancelled", "wake")
+
+    def __init__(self, priority: str, tokens: int, enqueued_at: float, wake=None):
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued_at = enqueued_at
+        self.admitted = False
+        self.cancelled = False
+        self.wake = wake
+
+
+class AdmissionController:
+    """Token buckets and the priority queue in front of the LLM clients.
+
+    enqueue() and poll() never block and take time from `clock`, so the scheduling can
+    be driven by a fake clock; admit() and admit_async() wait on top of them.
+    """
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = TOKENS_PER_MINUTE, burst_seconds: float = BURST_SECONDS,
+                 max_queue: int = MAX_QUEUE, max_wait: float = MAX_WAIT_SECONDS, clock=time.monotonic,
+                 enabled: bool = True):
+        self.clock = clock
+        self.enabled = enabled
+        self.requests = TokenBucket(requests_per_minute, burst_seconds, clock())
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds, clock())
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.paused_until = 0.0
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.shed = dict.fromkeys(PRIORITIES, 0)
+        self._waits = {priority: deque(maxlen=500) for priority in PRIORITIES}
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+    def _wait_time(self, requests: int, tokens: int, now: float) -> float:
+        return max(self.paused_until - now, self.requests.wait_time(requests), self.tokens.wait_time(tokens))
+
+    def _shed(self, priority: str, reason: str):
+        self.shed[priority] += 1
+        return Busy(reason)
+
+    def enqueue(self, tokens: int, priority: str | None = None, wake=None) -> Ticket:
+        """Queue a request; raises Busy when it should be shed instead."""
+        priority = priority or _priority.get()
+        rank = PRIORITIES[priority]
+        with self._lock:
+            # A request larger than the whole bucket goes once the bucket is full
+            tokens = min(tokens, self.tokens.capacity)
+            now = self.clock()
+            self._refill(now)
+            ahead = [t for _, _, t in self._queue if not t.cancelled and PRIORITIES[t.priority] <= rank]
+            if len(self._queue) >= self.max_queue:
+                raise self._shed(priority, "the LLM request queue is full")
+            # Time for the buckets to cover everything queued ahead plus this request
+            expected = self._wait_time(len(ahead) + 1, sum(t.tokens for t in ahead) + tokens, now)
+            if expected > self.max_wait:
+                raise self._shed(priority, f"the expected wait ({expected:.1f}s) is over {self.max_wait:g}s")
+            ticket = Ticket(priority, tokens, now, wake)
+            heapq.heappush(self._queue, (rank, next(self._seq), ticket))
+        self.poll()
+        return ticket
+
+    def poll(self) -> float | None:
+        """Admit queued requests the buckets cover now, in priority order; returns the
+        seconds until the next one can go, or None when the queue is empty."""
+        woken = []
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            wait = None
+            while self._queue:
+                ticket = self._queue[0][2]
+                if ticket.cancelled:
+                    heapq.heappop(self._queue)
+                    continue
+                wait = self._wait_time(1, ticket.tokens, now)
+                if wait > 0:
+                    break
+                heapq.heappop(self._queue)
+                self.requests.take(1)
+                self.tokens.take(ticket.tokens)
+                ticket.admitted = True
+                self.admitted[ticket.priority] += 1
+                self._waits[ticket.priority].append(now - ticket.enqueued_at)
+                woken.append(ticket)
+                wait = None
+        for ticket in woken:
+            if ticket.wake is not None:
+                ticket.wake()
+        return wait
+
+    def _give_up(self, ticket: Ticket) -> None:
+        with self._lock:
+            if ticket.admitted:
+                return
+            ticket.cancelled = True
+            raise self._shed(ticket.priority, f"no capacity within {self.clock() - ticket.enqueued_at:.1f}s")
+
+    def _cancel(self, ticket: Ticket) -> None:
+        with self._lock:
+            ticket.cancelled = not ticket.admitted
+
+    def admit(self, tokens: int, priority: str | None = None, timeout: float | None = None) -> None:
+        """Block until the request may be sent; raises Busy if it is shed."""
+        if not self.enabled:
+            return
+        event = threading.Event()
+        ticket = self.enqueue(tokens, priority, wake=event.set)
+        give_up_at = ticket.enqueued_at + min(self.max_wait, timeout if timeout is not None else self.max_wait)
+        while True:
+            delay = self.poll()
+            if ticket.admitted:
+                return
+            remaining = give_up_at - self.clock()
+            if remaining <= 0:
+                self._give_up(ticket)
+                return
+            event.wait(min(delay if delay is not None else remaining, remaining))
+            event.clear()
+
+    async def admit_async(self, tokens: int, priority: str | None = None, timeout: float | None = None) -> None:
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        # Admission may happen on a thread that is polling for its own request
+        ticket = self.enqueue(tokens, priority, wake=lambda: loop.call_soon_threadsafe(event.set))
+        give_up_at = ticket.enqueued_at + min(self.max_wait, timeout if timeout is not None else self.max_wait)
+        try:
+            while True:
+                delay = self.poll()
+                if ticket.admitted:
+                    return
+                remaining = give_up_at - self.clock()
+                if remaining <= 0:
+                    self._give_up(ticket)
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), min(delay if delay is not None else remaining, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+
+    def try_admit(self, tokens: int, priority: str | None = None) -> bool:
+        """Admit only if nothing is queued and the buckets cover the request now (e.g. a
+        hedge, which is not worth waiting for)."""
+        if not self.enabled:
+            return True
+        priority = priority or _priority.get()
+        with self._lock:
+            tokens = min(tokens, self.tokens.capacity)
+            now = self.clock()
+            self._refill(now)
+            if any(not t.cancelled for _, _, t in self._queue) or self._wait_time(1, tokens, now) > 0:
+                return False
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.admitted[priority] += 1
+            self._waits[priority].append(0.0)
+            return True
+
+    def pause(self, seconds: float) -> None:
+        # The provider rate-limited us: nothing is admitted until it says to come back
+        with self._lock:
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def stats(self) -> dict:
+        """Queue depth, admitted/shed counts and wait-time percentiles per priority."""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            depth = dict.fromkeys(PRIORITIES, 0)
+            for _, _, ticket in self._queue:
+                if not ticket.cancelled:
+                    depth[ticket.priority] += 1
+            waits = {priority: sorted(recent) for priority, recent in self._waits.items()}
+            stats = {
+                "queue_depth": depth, "admitted": dict(self.admitted), "shed": dict(self.shed),
+                "requests_available": round(self.requests.level, 1), "tokens_available": round(self.tokens.level),
+                "paused_for": round(max(self.paused_until - now, 0), 2),
+            }
+        for name, q in (("wait_p50", 0.5), ("wait_p95", 0.95)):
+            stats[name] = {
+                priority: recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+                for priority, recent in waits.items()
+            }
+        return stats
+
+
+admission_controller = AdmissionController(enabled=ADMISSION_CONTROL)
+
+
+def admission_stats() -> dict:
+    return admission_controller.stats()
@@ -0,0 +1,75 @@
+# async_runtime.py
+# Runtime for the async orchestrator. LLM calls of every conversation are awaited on
+# one event loop; blocking database and tool work is handed to a bounded thread pool
+# so it never stalls the loop. A server with its own event loop awaits the *_async
+# agents directly; synchronous callers (Streamlit) submit them to a background loop.
+import asyncio
+import atexit
+import functools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DB_POOL_WORKERS = int(os.getenv("DB_POOL_WORKERS", "4"))
+
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_WORKERS, thread_name_prefix="erp-db")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking database/tool call on the shared pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, functools.partial(fn, *args, **kwargs))
+
+
+class BackgroundLoop:
+    """One event loop on a daemon thread, shared by all synchronous callers."""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="erp-event-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop())
+
+    def run(self, coro, timeout: float | None = None):
+        # Blocks only the calling thread; the loop keeps serving other conversations
+        return self.submit(coro).result(timeout)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join(timeout=5)
+                self._loop.close()
+            self._loop = None
+
+
+background_loop = BackgroundLoop()
+atexit.register(background_loop.stop)
+
+
+def run_sync(coro, timeout: float | None = None):
+    """Run a coroutine on the background loop from synchronous code."""
+    return background_loop.run(coro, timeout)
+
+
+def iterate_sync(agen, timeout: float | None = None):
+    """Iterate an async generator from synchronous code; each item is produced on the
+    background loop, so a caller can render it as soon as it arrives."""
+    try:
+        while True:
+            try:
+                yield run_sync(agen.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(agen.aclose())
@@ -0,0 +1,82 @@
+# command_parser.py
+# Grammar-based fast path: common ERP commands map straight onto TOOL_FUNCTIONS
+# signatures without any LLM call. Anything the grammar does not fully match
+# returns None and goes through the normal agent path.
+import re
+import threading
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "twenty": 20,
+}
+
+# Filler that never changes the meaning of a command
+_FILLER_RE = re.compile(r"^(?:please|kindly|can you|could you|pls)\s+|\s+(?:please|thanks|thank you)$")
+_NUMBER_WORD_RE = re.compile(r"\b(" + "|".join(NUMBER_WORDS) + r")\b")
+
+ORDER_REF = r"(?:the\s+)?(?:sales?\s+)?(?:order|sale)\s*(?:id|no\.?|number)?\s*#?\s*(?P<sale_id>\d+)"
+QTY = r"(?:qty|quantity|units?|pcs|pieces)"
+PRODUCT_REF = r"product\s*(?:id)?\s*#?\s*(?P<product_id>\d+)"
+# Quantities start at 1; "qty 0" is left to the LLM and the tools' validation
+COUNT = r"[1-9]\d*"
+
+COMMAND_GRAMMAR = [
+    ("cancel_order", rf"(?:cancel|void|abort)\s+{ORDER_REF}"),
+    ("schedule_order", rf"(?:schedule|ship|dispatch)\s+{ORDER_REF}"),
+    ("complete_order", rf"(?:complete|finish|fulfill?|close)\s+{ORDER_REF}"),
+    ("complete_order", rf"mark\s+{ORDER_REF}\s+(?:as\s+)?(?:complete|completed|done)"),
+    ("return_order", rf"(?:return|refund)\s+{ORDER_REF}"),
+    ("return_order", rf"process\s+(?:a\s+)?return\s+for\s+{ORDER_REF}"),
+    ("modify_order", rf"(?:change|update|modify|set|edit)\s+(?:the\s+)?(?:{QTY}\s+(?:of|for)\s+)?"
+                     rf"{ORDER_REF}(?:\s+{QTY})?\s+(?:to\s+)?(?P<new_quantity>{COUNT})(?:\s+units?)?"),
+    ("create_order", rf"(?:create|place|add|make|book)\s+(?:a\s+|an\s+)?(?:new\s+)?(?:order|sale)\s+"
+                     rf"(?:for\s+)?{PRODUCT_REF}\s*,?\s*(?:with\s+)?{QTY}\s*(?:of\s+|=\s*|:\s*)?(?P<quantity>{COUNT})"),
+    ("create_order", rf"(?:create|place|add|make|book)\s+(?:a\s+|an\s+)?(?:new\s+)?(?:order|sale)\s+"
+                     rf"(?:for|of)\s+(?P<quantity>{COUNT})\s+(?:units?\s+(?:of\s+)?)?{PRODUCT_REF}"),
+    ("create_order", rf"(?:order|buy)\s+(?P<quantity>{COUNT})\s+(?:units?\s+of\s+)?{PRODUCT_REF}"),
+]
+
+COMPILED_GRAMMAR = [(tool, re.compile(pattern)) for tool, pattern in COMMAND_GRAMMAR]
+
+_stats = {"attempts": 0, "hits": 0, "ambiguous": 0}
+_stats_lock = threading.Lock()
+
+
+def normalize_command(text: str) -> str:
+    text = text.lower().strip().rstrip(".!?")
+    text = re.sub(r"\s+", " ", text)
+    text = _NUMBER_WORD_RE.sub(lambda m: str(NUMBER_WORDS[m.group(1)]), text)
+    previous = None
+    while previous != text:
+        previous, text = text, _FILLER_RE.sub("", text).strip()
+    return text
+
+
+def parse_command(text: str) -> dict | None:
+    """Returns {"tool": ..., "parameters": {...}} for a confident full parse, else None."""
+    command = normalize_command(text)
+    matches = {}
+    for tool, pattern in COMPILED_GRAMMAR:
+        match = pattern.fullmatch(command)
+        if match:
+            params = {k: int(v) for k, v in match.groupdict().items() if v is not None}
+            matches[(tool, tuple(sorted(params.items())))] = (tool, params)
+
+    with _stats_lock:
+        _stats["attempts"] += 1
+        if len(matches) == 1:
+            _stats["hits"] += 1
+        elif len(matches) > 1:
+            _stats["ambiguous"] += 1
+
+    if len(matches) != 1:
+        return None
+    tool, params = next(iter(matches.values()))
+    return {"tool": tool, "parameters": params}
+
+
+def fast_path_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["hit_rate"] = stats["hits"] / stats["attempts"] if stats["attempts"] else 0.0
+    return stats
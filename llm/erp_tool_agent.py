@@ -1,5 +1,6 @@
 import json
-from llm.llm_utils import client
+from llm.llm_call import llm_call_checked, llm_call_checked_async
+from llm.async_runtime import run_db
 from tools.create_order import create_order
 from tools.schedule_order import schedule_order
 from tools.complete_order import complete_order
@@ -31,7 +32,34 @@ def extract_json_block(text: str) -> str | None:
                 return text[start:i+1]
     return None
 
-def call_tool_agent(user_query: str) -> dict:
+def execute_tool(tool: str, params: dict) -> dict:
+    # Optional: convert parameter types if you want here, e.g. int()
+    # Just pass params as is for now
+    result = TOOL_FUNCTIONS[tool](**params)
+
+    # Normalize result: if result is string, wrap in dict for consistency
+    if isinstance(result, str):
+        return {
+            "type": "tool_response",
+            "tool": tool,
+            "status": "success",
+            "message": result
+        }
+    elif isinstance(result, dict):
+        # Assume tool returns a dict with its own status/message structure
+        result.setdefault("type", "tool_response")
+        result.setdefault("tool", tool)
+        result.setdefault("status", "success")
+        return result
+    else:
+        return {
+            "type": "tool_response",
+            "tool": tool,
+            "status": "success",
+            "message": str(result)
+        }
+
+def _tool_agent_request(user_query: str) -> dict:
     prompt = f"""
 You are an ERP assistant with the following tools:
 
@@ -52,69 +80,77 @@ Given a user's query, respond only with JSON (no explanation):
 }}
 User Query: {user_query}
 """
+    return dict(
+        messages=[
+            {"role": "system", "content": "You are a helpful ERP assistant."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.4,
+    )
+
+def _parse_tool_choice(response) -> tuple[str | None, dict]:
+    """(tool, parameters) from the model response, or (None, error dict)."""
+    output = response.choices[0].message.content.strip()
+    json_block = extract_json_block(output)
+    if not json_block:
+        return None, {
+            "type": "error",
+            "status": "failed",
+            "message": "❌ No valid JSON found in model response."
+        }
+
+    parsed = json.loads(json_block)
+    tool = parsed.get("tool")
+    params = parsed.get("parameters", {})
+
+    if not tool:
+        return None, {
+            "type": "error",
+            "status": "failed",
+            "message": "❌ 'tool' not specified in response JSON."
+        }
+
+    if tool not in TOOL_FUNCTIONS:
+        return None, {
+            "type": "error",
+            "status": "failed",
+            "message": f"❌ Unknown tool requested: {tool}"
+        }
+
+    return tool, params
+
+def _check_tool_choice(choice: tuple[str | None, dict]) -> str | None:
+    # Missing or unknown tools are retried on a stronger model
+    tool, error = choice
+    return error["message"] if tool is None else None
+
+def call_tool_agent(user_query: str) -> dict:
+    try:
+        tool, params = llm_call_checked("tool_plan", _tool_agent_request(user_query), _parse_tool_choice, _check_tool_choice)
+        if tool is None:
+            return params
+        return execute_tool(tool, params)
+
+    except Exception as e:
+        return {
+            "type": "error",
+            "status": "failed",
+            "message": f"❌ Tool agent execution error: {str(e)}"
+        }
+
+async def plan_tool_call_async(user_query: str) -> tuple[str | None, dict]:
+    """LLM planning step only: (tool, parameters) or (None, error dict); nothing is executed,
+    so it is safe to start before the route is known."""
+    return await llm_call_checked_async("tool_plan", _tool_agent_request(user_query), _parse_tool_choice, _check_tool_choice)
 
+async def call_tool_agent_async(user_query: str, planned=None) -> dict:
+    # planned: an already started plan_tool_call_async (e.g. a speculative one)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a helpful ERP assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.4,
-            max_tokens=300,
-        )
-        output = response.choices[0].message.content.strip()
-        json_block = extract_json_block(output)
-        if not json_block:
-            return {
-                "type": "error",
-                "status": "failed",
-                "message": "❌ No valid JSON found in model response."
-            }
-
-        parsed = json.loads(json_block)
-        tool = parsed.get("tool")
-        params = parsed.get("parameters", {})
-
-        if not tool:
-            return {
-                "type": "error",
-                "status": "failed",
-                "message": "❌ 'tool' not specified in response JSON."
-            }
-
-        if tool not in TOOL_FUNCTIONS:
-            return {
-                "type": "error",
-                "status": "failed",
-                "message": f"❌ Unknown tool requested: {tool}"
-            }
-
-        # Optional: convert parameter types if you want here, e.g. int()
-        # Just pass params as is for now
-        result = TOOL_FUNCTIONS[tool](**params)
-        
-        # Normalize result: if result is string, wrap in dict for consistency
-        if isinstance(result, str):
-            return {
-                "type": "tool_response",
-                "tool": tool,
-                "status": "success",
-                "message": result
-            }
-        elif isinstance(result, dict):
-            # Assume tool returns a dict with its own status/message structure
-            result.setdefault("type", "tool_response")
-            result.setdefault("tool", tool)
-            result.setdefault("status", "success")
-            return result
-        else:
-            return {
-                "type": "tool_response",
-                "tool": tool,
-                "status": "success",
-                "message": str(result)
-            }
+        tool, params = await (planned or plan_tool_call_async(user_query))
+        if tool is None:
+            return params
+        # Tools write to both databases; they run on the DB pool, off the event loop
+        return await run_db(execute_tool, tool, params)
 
     except Exception as e:
         return {
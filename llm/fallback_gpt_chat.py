@@ -1,18 +1,45 @@
-from llm.llm_utils import client
+from llm.llm_call import LLMUnavailable, llm_call, llm_call_async, llm_stream
 
-def fallback_gpt_chat(user_input: str) -> str:
+def _chat_request(user_input: str) -> dict:
     system_prompt = (
         "You are a friendly ERP assistant. If the user greets you or asks non-technical questions, "
         "respond in a helpful and conversational manner."
     )
-
-    completion = client.chat.completions.create(
-        model="gpt-4",  # Or gpt-3.5-turbo if using that
+    return dict(
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_input}
         ],
         temperature=0.7,
     )
+
+# Local reply while the chat stage is unavailable (see llm/llm_call.py)
+UNAVAILABLE_REPLY = (
+    "I can't reach the assistant right now. Order commands such as 'cancel order 12' "
+    "or 'schedule order 7' still work."
+)
+
+def fallback_gpt_chat(user_input: str) -> str:
+    try:
+        completion = llm_call("chat", _chat_request(user_input))
+    except LLMUnavailable as e:
+        print(f"[WARN] {e}")
+        return UNAVAILABLE_REPLY
+    return completion.choices[0].message.content.strip()
+
+async def fallback_gpt_chat_async(user_input: str) -> str:
+    try:
+        completion = await llm_call_async("chat", _chat_request(user_input))
+    except LLMUnavailable as e:
+        print(f"[WARN] {e}")
+        return UNAVAILABLE_REPLY
     return completion.choices[0].message.content.strip()
 
+async def fallback_gpt_chat_stream(user_input: str):
+    """Async generator of the reply's text as it is generated."""
+    try:
+        async for delta in llm_stream("chat", _chat_request(user_input)):
+            yield delta
+    except LLMUnavailable as e:
+        print(f"[WARN] {e}")
+        yield UNAVAILABLE_REPLY
@@ -0,0 +1,65 @@
+# federated_query.py
+# Executes the two-query (SQLite + DuckDB) plans from generate_sql_from_nl_agent and
+# joins the results inside DuckDB. The SQLite result is registered as a pandas
+# relation (scanned in place, no copy into DuckDB tables).
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from database.result_handle import ResultHandle
+from llm.sql_guard import GuardError, open_guarded_duckdb, run_guarded_duckdb, run_guarded_sqlite
+
+SQLITE_RELATION = "sqlite_result"
+DUCKDB_RELATION = "duckdb_result"
+
+# Intermediate results feed the join, so they are never cut short; larger ones are rejected
+MAX_INTERMEDIATE_ROWS = int(os.getenv("FEDERATED_MAX_INTERMEDIATE_ROWS", "100000"))
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="federated")
+
+
+def _intermediate(frame: pd.DataFrame, store: str) -> pd.DataFrame:
+    if len(frame) > MAX_INTERMEDIATE_ROWS:
+        raise GuardError(f"The {store} part of the query returns more than {MAX_INTERMEDIATE_ROWS:,} rows to join; narrow it with a filter or aggregate.")
+    return frame
+
+
+def run_sqlite(sql: str) -> pd.DataFrame:
+    return _intermediate(run_guarded_sqlite(sql, max_rows=MAX_INTERMEDIATE_ROWS), "SQLite")
+
+
+def run_duckdb(sql: str) -> pd.DataFrame:
+    return _intermediate(run_guarded_duckdb(sql, max_rows=MAX_INTERMEDIATE_ROWS), "DuckDB")
+
+
+def _references(sql: str, relation: str) -> bool:
+    return re.search(rf"\b{relation}\b", sql, re.IGNORECASE) is not None
+
+
+def default_join_sql(left: pd.DataFrame, right: pd.DataFrame) -> str:
+    shared = [c for c in left.columns if c in right.columns]
+    if not shared:
+        raise ValueError("SQLite and DuckDB results share no columns to join on.")
+    columns = ", ".join(f'"{c}"' for c in shared)
+    return f"SELECT * FROM {SQLITE_RELATION} JOIN {DUCKDB_RELATION} USING ({columns})"
+
+
+def execute_federated(sqlite_sql: str, duckdb_sql: str, join_sql: str | None = None) -> tuple[ResultHandle, dict]:
+    """Run a cross-store plan; returns a handle on the combined result (guarded and
+    paged like any insight query) and the SQL that was executed."""
+    executed = {"sqlite": sqlite_sql, "duckdb": duckdb_sql}
+
+    if _references(duckdb_sql, SQLITE_RELATION):
+        # The DuckDB query consumes the SQLite result directly, so it has to wait for it
+        sqlite_df = run_sqlite(sqlite_sql)
+        return open_guarded_duckdb(duckdb_sql, {SQLITE_RELATION: sqlite_df}), executed
+
+    # Independent queries: run both stores at the same time, then join in DuckDB
+    sqlite_future = _executor.submit(run_sqlite, sqlite_sql)
+    duckdb_future = _executor.submit(run_duckdb, duckdb_sql)
+    sqlite_df, duckdb_df = sqlite_future.result(), duckdb_future.result()
+
+    join_sql = join_sql or default_join_sql(sqlite_df, duckdb_df)
+    executed["join"] = join_sql
+    joined = open_guarded_duckdb(join_sql, {SQLITE_RELATION: sqlite_df, DUCKDB_RELATION: duckdb_df})
+    return joined, executed
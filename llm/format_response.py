@@ -1,10 +1,83 @@
 # format_response.py
-from openai import OpenAI
 from typing import Union
-from llm.llm_utils import client
+from llm.llm_call import LLMUnavailable, llm_call, llm_stream
 
+# One-line UI templates per tool action, mirroring the few-shot examples below.
+# Keys are (action, data status) for special cases, or the bare action.
+RESPONSE_TEMPLATES = {
+    "create_order": "Order {sale_id} created successfully. Details: {product_id} (Qty: {quantity}) — "
+                    "Revenue: ${revenue:.2f}, Committed: {committed}, Backorder: {backorder}",
+    "schedule_order": "Order {sale_id} scheduled successfully. Details: Qty: {scheduled_qty}, "
+                      "Remaining: {remaining_schedulable}",
+    "complete_order": "Order {sale_id} completed. Details: Total: {total}, Committed: {committed}, "
+                      "Scheduled: {scheduled}",
+    ("complete_order", "already_complete"): "Order {sale_id} is already complete.",
+    "cancel_order": "Order {sale_id} cancelled. Details: Qty: {cancelled_qty}, Available: {available}, "
+                    "Committed: {committed}, Backorder: {backorder}",
+    ("cancel_order", "already_cancelled"): "Order {sale_id} is already cancelled.",
+    "return_order": "Order {sale_id} returned successfully. Details: Qty: {quantity_returned}, "
+                    "Total: {total_qty}, Available: {available_qty}",
+    "change_order": "Order {sale_id} modified. Details: Qty: {new_quantity}, Revenue: ${new_revenue:.2f}, "
+                    "Backorder: {backorder_qty}",
+}
 
-def format_response_with_gpt(raw_response: Union[str, dict]) -> str:
+
+def _template_fields(raw_response: dict) -> dict:
+    # Flatten top-level, "data" and nested inventory dicts into one namespace
+    fields = dict(raw_response)
+    data = raw_response.get("data")
+    if isinstance(data, dict):
+        fields.update(data)
+    for key in ("inventory", "inventory_update"):
+        nested = fields.get(key)
+        if isinstance(nested, dict):
+            fields.update(nested)
+    return fields
+
+
+def render_tool_response(raw_response: dict) -> str | None:
+    """Render a tool result locally, or None if its shape has no template."""
+    action = raw_response.get("action") or raw_response.get("tool")
+    data = raw_response.get("data")
+    status = data.get("status") if isinstance(data, dict) else None
+
+    template = RESPONSE_TEMPLATES.get((action, status)) or RESPONSE_TEMPLATES.get(action)
+    if template is None:
+        return None
+    try:
+        return template.format_map(_template_fields(raw_response))
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def format_tool_response(raw_response: Union[str, dict]) -> str:
+    # Templates cover every known tool shape; the LLM is only used for anything else
+    if isinstance(raw_response, dict):
+        rendered = render_tool_response(raw_response)
+        if rendered is not None:
+            return rendered
+        raw_response = raw_response.get("message") or raw_response.get("result") or raw_response
+    return format_response_with_gpt(raw_response)
+
+
+async def format_tool_response_stream(raw_response: Union[str, dict]):
+    """format_tool_response as an async generator of text; templates arrive in one piece."""
+    if isinstance(raw_response, dict):
+        rendered = render_tool_response(raw_response)
+        if rendered is not None:
+            yield rendered
+            return
+        raw_response = raw_response.get("message") or raw_response.get("result") or raw_response
+    try:
+        async for delta in llm_stream("format", _format_request(raw_response)):
+            yield delta
+    except LLMUnavailable as e:
+        # The raw tool message is shown as is
+        print(f"[WARN] {e}")
+        yield str(raw_response)
+
+
+def _format_request(raw_response: Union[str, dict]) -> dict:
     content = str(raw_response) if isinstance(raw_response, dict) else raw_response
 
     FORMAT_RESPONSE_PROMPT = """
@@ -43,8 +116,7 @@ Now format this:
 
     prompt = FORMAT_RESPONSE_PROMPT.format(tool_output=raw_response)
 
-    completion = client.chat.completions.create(
-        model="gpt-4",  # Or "gpt-3.5-turbo"
+    return dict(
         messages=[
             {"role": "system", "content": "You are a concise ERP assistant."},
             {"role": "user", "content": prompt}
@@ -52,4 +124,12 @@ Now format this:
         temperature=0.5
     )
 
+
+def format_response_with_gpt(raw_response: Union[str, dict]) -> str:
+    try:
+        completion = llm_call("format", _format_request(raw_response))
+    except LLMUnavailable as e:
+        # The raw tool message is shown as is
+        print(f"[WARN] {e}")
+        return str(raw_response)
     return completion.choices[0].message.content.strip()
@@ -0,0 +1,114 @@
+# function_router.py
+# Single-call routing: the model picks the route and the tool arguments in one response
+# using native function calling instead of classify → JSON prompt → extract_json_block.
+import inspect
+import json
+from llm.llm_call import llm_call_checked, llm_call_checked_async
+from llm.erp_tool_agent import TOOL_FUNCTIONS
+
+INSIGHT_TOOL = "run_insight_query"
+CHAT_TOOL = "reply_to_user"
+
+_JSON_TYPES = {int: "integer", float: "number", str: "string", bool: "boolean"}
+
+TOOL_DESCRIPTIONS = {
+    "create_order": "Create a new sales order for a product.",
+    "schedule_order": "Schedule an existing committed sale for fulfilment.",
+    "complete_order": "Mark a sale as complete and invoice it.",
+    "cancel_order": "Cancel an existing sale and release its inventory.",
+    "return_order": "Process a return for a completed sale.",
+    "modify_order": "Change the quantity of an existing open or committed sale.",
+}
+
+
+def build_tool_schema(name: str, func) -> dict:
+    """OpenAI function schema generated from the tool's Python signature."""
+    properties, required = {}, []
+    for param in inspect.signature(func).parameters.values():
+        properties[param.name] = {"type": _JSON_TYPES.get(param.annotation, "string")}
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": TOOL_DESCRIPTIONS.get(name, inspect.getdoc(func) or name),
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        },
+    }
+
+
+ROUTING_TOOLS = [build_tool_schema(name, func) for name, func in TOOL_FUNCTIONS.items()] + [
+    {
+        "type": "function",
+        "function": {
+            "name": INSIGHT_TOOL,
+            "description": "Answer a data analysis, reporting or summary question over sales, inventory or products.",
+            "parameters": {
+                "type": "object",
+                "properties": {"question": {"type": "string"}},
+                "required": ["question"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": CHAT_TOOL,
+            "description": "Reply conversationally to greetings or non-technical questions.",
+            "parameters": {
+                "type": "object",
+                "properties": {"message": {"type": "string", "description": "The reply shown to the user."}},
+                "required": ["message"],
+            },
+        },
+    },
+]
+
+
+def _routing_request(query: str) -> dict:
+    return dict(
+        messages=[
+            {"role": "system", "content": (
+                "You are an ERP assistant. Always answer by calling exactly one function: an order tool "
+                f"for order operations, {INSIGHT_TOOL} for data questions, or {CHAT_TOOL} for anything else."
+            )},
+            {"role": "user", "content": query},
+        ],
+        tools=ROUTING_TOOLS,
+        tool_choice="required",
+        temperature=0,
+    )
+
+
+def _parse_route(response) -> dict:
+    tool_calls = response.choices[0].message.tool_calls or []
+    if not tool_calls:
+        return {"route": "other", "tool": None, "parameters": {}}
+
+    call = tool_calls[0].function
+    parameters = json.loads(call.arguments or "{}")
+
+    if call.name == INSIGHT_TOOL:
+        route = "insight"
+    elif call.name == CHAT_TOOL:
+        route = "other"
+    else:
+        route = "action"
+    return {"route": route, "tool": call.name, "parameters": parameters}
+
+
+def _check_route(routed: dict) -> str | None:
+    if routed["route"] == "action" and routed["tool"] not in TOOL_FUNCTIONS:
+        return f"unknown tool '{routed['tool']}'"
+    return None
+
+
+def route_with_function_calling(query: str) -> dict:
+    """Returns {"route": "action"|"insight"|"other", "tool": ..., "parameters": {...}}."""
+    return llm_call_checked("route", _routing_request(query), _parse_route, _check_route)
+
+
+async def route_with_function_calling_async(query: str) -> dict:
+    return await llm_call_checked_async("route", _routing_request(query), _parse_route, _check_route)
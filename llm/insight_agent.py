@@ -1,23 +1,55 @@
 # llm_agents/handle_insight_query.py
 import json
-import pandas as pd
-from llm.llm_utils import client
-from database.db_utils import get_duckdb_conn, sqlite_engine
+from contextlib import aclosing
+from llm.llm_call import llm_call_checked, llm_call_checked_async
+from llm.async_runtime import run_db
+from llm.single_flight import normalize_query, single_flight
+from llm.federated_query import execute_federated, SQLITE_RELATION, DUCKDB_RELATION
+from database import data_version
+from database.sales_mirror import ensure_fresh, is_mirrorable_aggregate
+from database.result_cache import result_cache
+from database.result_handle import ResultHandle
+from database.schema_catalog import get_schema_catalog
+from llm.sql_reuse_index import get_sql_reuse_index
+from llm.sql_guard import GuardError, check_read_only, open_guarded_duckdb, open_guarded_sqlite, validate_sql
 from tools.debug_logger import debug_log  # your decorator
 
-def generate_sql_from_nl_agent(query: str) -> dict:
+
+def _open_on_mirror(sql: str) -> ResultHandle:
+    ensure_fresh()
+    return open_guarded_duckdb(sql)
+
+
+# Openers per result reference {"engine", "sqls"}; a reference is stored with each
+# conversation turn so its result can be re-opened (or served from cache) later
+RESULT_OPENERS = {
+    "sqlite": open_guarded_sqlite,
+    "duckdb": open_guarded_duckdb,
+    "sales_mirror": _open_on_mirror,
+    "federated": lambda sqlite_sql, duckdb_sql, join_sql: execute_federated(sqlite_sql, duckdb_sql, join_sql or None)[0],
+}
+
+
+def open_result(engine: str, sqls) -> ResultHandle:
+    sqls = tuple(sqls)
+    return result_cache.get_or_open(engine, sqls, lambda: RESULT_OPENERS[engine](*sqls))
+
+
+def _schema_for(query: str) -> str:
+    # Only the tables relevant to this question, from the introspected schemas
+    return get_schema_catalog().prompt_for(query)
+
+
+def _sql_request(query: str, schema: str) -> dict:
     prompt = f"""
 You are a SQL assistant. Translate the user's request into a SQL query that may use both the DuckDB and SQLite schemas.
 
-DuckDB Tables:
-- inventory (product_id (int), total_qty (int), committed_qty (int), available_qty (int), backorder_qty (int), scheduled_qty (int))
-- product (product_id (int), name (string), category (string), status (string), price (float)) 
-
-SQLite Tables:
-- sales (sale_id (int), product_id (int), quantity (int), sale_date (date), revenue (float), order_status (string))
+{schema}
 
 For complex queries, show how you'd join them or simulate if not directly joinable.
 If the data is only available in one DB (like sales in SQLite), do not query the other. Only include a second query if it's truly needed (e.g., getting backorder from DuckDB after fetching top product from SQLite).
+When both queries are needed, the results are combined inside DuckDB: the DuckDB query may read the SQLite result as the table "{SQLITE_RELATION}",
+or you may set "join" to a SQL query that combines "{SQLITE_RELATION}" and "{DUCKDB_RELATION}". Otherwise "join" is null.
 
 User Query: {query}
 
@@ -27,24 +59,194 @@ Respond with JSON like:
   "sqls": {{
     "sqlite": "...",
     "duckdb": "..."
-  }}
+  }},
+  "join": null
 }}
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4",
+    return dict(
         messages=[{"role": "system", "content": "You generate SQL from user questions."},
                   {"role": "user", "content": prompt}],
         temperature=0.2,
-        max_tokens=400,
     )
+
+
+def _parse_sql_plan(response) -> dict:
     output = response.choices[0].message.content.strip()
     return json.loads(output)
 
+
+def _check_sql_plan(sql_obj: dict) -> str | None:
+    """What keeps the plan from running as written, or None. Each query is EXPLAINed on
+    its engine; a DuckDB query reading the SQLite result can only be checked once that
+    result exists, so it is left to execution."""
+    sqls = sql_obj.get("sqls") if isinstance(sql_obj, dict) else None
+    if not isinstance(sqls, dict) or not sql_obj.get("dbs") or not any(sqls.values()):
+        return "no SQL in the plan"
+    try:
+        if sqls.get("sqlite"):
+            validate_sql("sqlite", sqls["sqlite"])
+        if sqls.get("duckdb") and SQLITE_RELATION not in sqls["duckdb"]:
+            validate_sql("duckdb", sqls["duckdb"])
+        if sql_obj.get("join"):
+            # Reads both results, so like the DuckDB query above it can only be EXPLAINed at execution
+            check_read_only(sql_obj["join"])
+    except Exception as e:
+        # The driver's message, without SQLAlchemy's statement and background link
+        return f"SQL fails EXPLAIN: {getattr(e, 'orig', None) or e}"
+    return None
+
+
+def generate_sql_from_nl_agent(query: str) -> dict:
+    return llm_call_checked("sql", _sql_request(query, _schema_for(query)), _parse_sql_plan, _check_sql_plan)
+
+
+async def generate_sql_from_nl_agent_async(query: str) -> dict:
+    schema = await run_db(_schema_for, query)
+    return await llm_call_checked_async(
+        "sql", _sql_request(query, schema), _parse_sql_plan, lambda sql_obj: run_db(_check_sql_plan, sql_obj)
+    )
+
+
+def _reusable_plan(user_query: str) -> dict | None:
+    # Near-paraphrases of answered questions reuse their validated SQL, re-bound to this question's literals
+    reused = get_sql_reuse_index().lookup(user_query)
+    if reused:
+        sql_obj, similarity = reused
+        print(f"[DEBUG] Reusing SQL plan (similarity {similarity:.3f})")
+        return sql_obj
+    return None
+
+
+def _flight_key(step: str, user_query: str, *parts) -> tuple:
+    # Identical questions share one SQL generation and one query run; the data version
+    # keeps a question asked after a write from joining a run that started before it
+    return ("insight", step, normalize_query(user_query), *parts, data_version.snapshot(()))
+
+
+def share_response(response):
+    """A response for another caller of a shared run: its own cursor over the result."""
+    if isinstance(response, dict) and isinstance(response.get("result"), ResultHandle):
+        return {**response, "result": response["result"].fork()}
+    return response
+
+
+def plan_insight_query(user_query: str) -> tuple[dict, bool]:
+    """Planning step only: (SQL plan, reused from the index); no SQL is run."""
+    sql_obj = _reusable_plan(user_query)
+    if sql_obj is not None:
+        return sql_obj, True
+    return generate_sql_from_nl_agent(user_query), False
+
+
+def _reuse_failed(user_query: str, response: dict) -> bool:
+    # A reused plan that fails is dropped from the index and the question goes to the LLM
+    if response.get("type") != "error":
+        return False
+    print(f"[WARN] Reused SQL plan failed ({response.get('message')}); generating a new one")
+    get_sql_reuse_index().discard(user_query)
+    return True
+
+
+def _insight_failed(e: Exception) -> dict:
+    return {
+        "type": "error",
+        "action": "handle_insight_query",
+        "status": "failed",
+        "message": f"Insight query failed: {str(e)}"
+    }
+
+
 @debug_log
 def handle_insight_query(user_query: str) -> dict:
     try:
-        sql_obj = generate_sql_from_nl_agent(user_query)
+        sql_obj, reused = single_flight.do(_flight_key("plan", user_query), plan_insight_query, user_query)
+    except Exception as e:
+        return _insight_failed(e)
+    response = _run_shared(user_query, sql_obj, reused)
+    if reused and _reuse_failed(user_query, response):
+        try:
+            sql_obj = single_flight.do(_flight_key("replan", user_query), generate_sql_from_nl_agent, user_query)
+        except Exception as e:
+            return _insight_failed(e)
+        response = _run_shared(user_query, sql_obj, False)
+    return response
+
+
+def _run_shared(user_query: str, sql_obj: dict, reused: bool) -> dict:
+    return single_flight.do(
+        _flight_key("run", user_query, json.dumps(sql_obj, sort_keys=True)),
+        run_insight_plan, user_query, sql_obj, reused, share=share_response,
+    )
+
+
+async def _run_shared_async(user_query: str, sql_obj: dict, reused: bool) -> dict:
+    return await single_flight.do_async(
+        _flight_key("run", user_query, json.dumps(sql_obj, sort_keys=True)),
+        run_db, run_insight_plan, user_query, sql_obj, reused, share=share_response,
+    )
+
+
+@debug_log
+async def handle_insight_query_async(user_query: str) -> dict:
+    async with aclosing(handle_insight_query_stream(user_query)) as events:
+        async for event in events:
+            if event["event"] == "final":
+                return event["response"]
+
+
+async def _plan_insight_query_async(user_query: str) -> tuple[dict, bool]:
+    # Only the SQL generation is awaited on the loop; the index lookup uses the DB pool
+    sql_obj = await run_db(_reusable_plan, user_query)
+    if sql_obj is not None:
+        return sql_obj, True
+    return await generate_sql_from_nl_agent_async(user_query), False
+
+
+async def plan_insight_query_async(user_query: str) -> tuple[dict, bool]:
+    """plan_insight_query on the event loop; joins a sync caller's run of the same question."""
+    return await single_flight.do_async(_flight_key("plan", user_query), _plan_insight_query_async, user_query)
+
+
+async def handle_insight_query_stream(user_query: str, planned=None):
+    """Stream events for an insight question: the summary and SQL as soon as the plan is
+    known ("insight_plan", sent again if a reused plan fails and is regenerated), then the
+    response with the first page of rows ("final").
+
+    planned: an already started plan_insight_query_async (e.g. a speculative one).
+    """
+    try:
+        sql_obj, reused = await (planned or plan_insight_query_async(user_query))
+    except Exception as e:
+        yield {"event": "final", "response": _insight_failed(e)}
+        return
+
+    yield _plan_event(user_query, sql_obj)
+    response = await _run_shared_async(user_query, sql_obj, reused)
+    if reused and await run_db(_reuse_failed, user_query, response):
+        try:
+            sql_obj = await single_flight.do_async(
+                _flight_key("replan", user_query), generate_sql_from_nl_agent_async, user_query
+            )
+        except Exception as e:
+            yield {"event": "final", "response": _insight_failed(e)}
+            return
+        yield _plan_event(user_query, sql_obj)
+        response = await _run_shared_async(user_query, sql_obj, False)
+    yield {"event": "final", "response": response}
+
+
+def _plan_event(user_query: str, sql_obj: dict) -> dict:
+    return {
+        "event": "insight_plan",
+        "summary": f"Insight: {user_query.capitalize()}",
+        "executed_sql": {db: sql for db, sql in sql_obj.get("sqls", {}).items() if sql},
+    }
+
+
+def run_insight_plan(user_query: str, sql_obj: dict, reused: bool) -> dict:
+    """Validate and open the plan's SQL; returns the insight response with the first page."""
+    try:
         dbs = sql_obj.get("dbs", [])
         sqls = sql_obj.get("sqls", {})
 
@@ -56,18 +258,45 @@ def handle_insight_query(user_query: str) -> dict:
                 "message": "No database or SQL queries generated from the input."
             }
 
-        # Pick one DB to query, priority SQLite then DuckDB
-        if "sqlite" in dbs and sqls.get("sqlite"):
+        # Cross-store plan: run both and join in DuckDB; otherwise pick the one DB, SQLite first
+        if "sqlite" in dbs and "duckdb" in dbs and sqls.get("sqlite") and sqls.get("duckdb"):
+            join_sql = sql_obj.get("join") or None
+            executed_sql = {"sqlite": sqls["sqlite"], "duckdb": sqls["duckdb"]}
+
+            def open_federated():
+                handle, executed = execute_federated(sqls["sqlite"], sqls["duckdb"], join_sql)
+                executed_sql.update(executed)
+                return handle
+
+            result_ref = {"engine": "federated", "sqls": [sqls["sqlite"], sqls["duckdb"], join_sql or ""]}
+            result = result_cache.get_or_open("federated", tuple(result_ref["sqls"]), open_federated)
+
+        elif "sqlite" in dbs and sqls.get("sqlite"):
             sql_to_run = sqls["sqlite"]
-            executed_sql = {"sqlite": sql_to_run}
-            with sqlite_engine.connect() as conn:
-                df = pd.read_sql_query(sql_to_run, conn)
+            result = None
+            if is_mirrorable_aggregate(sql_to_run):
+                # Aggregates over sales run on the columnar DuckDB mirror when it can parse them
+                try:
+                    # First page fetched here so a query the mirror cannot run falls back now
+                    result = open_result("sales_mirror", [sql_to_run]).first_page()
+                    result_ref = {"engine": "sales_mirror", "sqls": [sql_to_run]}
+                    executed_sql = {"duckdb (sales mirror)": sql_to_run}
+                except GuardError:
+                    raise
+                except Exception as e:
+                    print(f"[WARN] Sales mirror could not run query, using SQLite: {e}")
+                    result = None
+
+            if result is None:
+                executed_sql = {"sqlite": sql_to_run}
+                result_ref = {"engine": "sqlite", "sqls": [sql_to_run]}
+                result = open_result("sqlite", [sql_to_run])
 
         elif "duckdb" in dbs and sqls.get("duckdb"):
             sql_to_run = sqls["duckdb"]
             executed_sql = {"duckdb": sql_to_run}
-            with get_duckdb_conn() as conn:
-                df = conn.execute(sql_to_run).fetchdf()
+            result_ref = {"engine": "duckdb", "sqls": [sql_to_run]}
+            result = open_result("duckdb", [sql_to_run])
 
         else:
             return {
@@ -77,25 +306,35 @@ def handle_insight_query(user_query: str) -> dict:
                 "message": "No valid SQL query found for either SQLite or DuckDB."
             }
 
-        if df.empty:
+        # Only the first page is read now; the UI pulls further pages from the handle
+        result.first_page()
+
+        if not reused:
+            get_sql_reuse_index().add(user_query, sql_obj)
+
+        if result.num_rows == 0:
             return {
                 "type": "insight",
                 "executed_sql": executed_sql,
-                "result_table": [],
+                "result": result,
+                "result_ref": result_ref,
                 "summary": "No data found for the requested query."
             }
 
         return {
             "type": "insight",
             "executed_sql": executed_sql,
-            "result_table": df.to_dict(orient="records"),
+            "result": result,
+            "result_ref": result_ref,
             "summary": f"Insight: {user_query.capitalize()}"
         }
 
-    except Exception as e:
+    except GuardError as e:
         return {
             "type": "error",
             "action": "handle_insight_query",
-            "status": "failed",
-            "message": f"Insight query failed: {str(e)}"
+            "status": "rejected",
+            "message": f"Insight query was not run: {e}"
         }
+    except Exception as e:
+        return _insight_failed(e)
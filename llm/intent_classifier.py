@@ -0,0 +1,147 @@
+# intent_classifier.py
+# Local routing model used by the orchestrator before falling back to the LLM classifier.
+import json
+import os
+import re
+import threading
+import zlib
+import numpy as np
+from database.db_utils import DATA_DIR
+
+LABELS = ("action", "insight", "other")
+N_FEATURES = 2 ** 16
+
+SEED_EXAMPLES_PATH = os.path.join(DATA_DIR, "intent_examples.jsonl")
+# LLM-labelled queries, added to the seed examples on retraining
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", os.path.join(DATA_DIR, "query_log.jsonl"))
+MODEL_PATH = os.path.join(DATA_DIR, "intent_model.npz")
+
+# Below this probability the orchestrator asks the LLM classifier instead
+CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8")) % N_FEATURES
+
+
+def extract_features(text: str) -> tuple[np.ndarray, np.ndarray]:
+    """Hashed word 1-2 grams plus char 3-grams, L2-normalized, as (indices, values)."""
+    tokens = ["<num>" if t.isdigit() else t for t in _TOKEN_RE.findall(text.lower())]
+    features = [f"w:{t}" for t in tokens]
+    features += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"^{token}$"
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    if not features:
+        features = ["w:<empty>"]
+
+    indices, counts = np.unique([_hash(f) for f in features], return_counts=True)
+    values = counts.astype(np.float32)
+    values /= np.linalg.norm(values)
+    return indices, values
+
+
+class IntentClassifier:
+    """Multinomial logistic regression over hashed n-gram features."""
+
+    def __init__(self, weights: np.ndarray | None = None, bias: np.ndarray | None = None):
+        self.weights = weights if weights is not None else np.zeros((len(LABELS), N_FEATURES), np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(LABELS), np.float32)
+
+    def fit(self, texts: list[str], labels: list[str], epochs: int = 40,
+            learning_rate: float = 0.5, l2: float = 1e-4, seed: int = 0) -> "IntentClassifier":
+        samples = [extract_features(t) for t in texts]
+        targets = [LABELS.index(label) for label in labels]
+        rng = np.random.default_rng(seed)
+
+        for _ in range(epochs):
+            for i in rng.permutation(len(samples)):
+                indices, values = samples[i]
+                probs = self._probabilities(indices, values)
+                probs[targets[i]] -= 1.0
+                self.weights[:, indices] -= learning_rate * (
+                    np.outer(probs, values) + l2 * self.weights[:, indices]
+                )
+                self.bias -= learning_rate * probs
+        return self
+
+    def _probabilities(self, indices: np.ndarray, values: np.ndarray) -> np.ndarray:
+        logits = self.weights[:, indices] @ values + self.bias
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def predict(self, text: str) -> tuple[str, float]:
+        probs = self._probabilities(*extract_features(text))
+        best = int(probs.argmax())
+        return LABELS[best], float(probs[best])
+
+    def probabilities(self, text: str) -> dict[str, float]:
+        probs = self._probabilities(*extract_features(text))
+        return {label: float(p) for label, p in zip(LABELS, probs)}
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        np.savez_compressed(path, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "IntentClassifier":
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"])
+
+
+def _read_jsonl(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_training_examples() -> tuple[list[str], list[str]]:
+    rows = _read_jsonl(SEED_EXAMPLES_PATH) + _read_jsonl(QUERY_LOG_PATH)
+    rows = [r for r in rows if r.get("label") in LABELS]
+    return [r["query"] for r in rows], [r["label"] for r in rows]
+
+
+def train_intent_classifier() -> IntentClassifier:
+    texts, labels = load_training_examples()
+    return IntentClassifier().fit(texts, labels)
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> IntentClassifier:
+    # Loaded (or trained from seed + logged queries) once per process
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                if os.path.exists(MODEL_PATH):
+                    _classifier = IntentClassifier.load(MODEL_PATH)
+                else:
+                    _classifier = train_intent_classifier()
+    return _classifier
+
+
+_log_lock = threading.Lock()
+
+
+def log_query(query: str, label: str, source: str = "llm") -> None:
+    """Append a labelled query so the next retrain can learn from it."""
+    if label not in LABELS:
+        return
+    record = json.dumps({"query": query, "label": label, "source": source})
+    try:
+        with _log_lock, open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(record + "\n")
+    except OSError as e:
+        print(f"[WARN] Could not log query for intent training: {e}")
+
+
+if __name__ == "__main__":
+    texts, labels = load_training_examples()
+    IntentClassifier().fit(texts, labels).save(MODEL_PATH)
+    print(f"Intent model trained on {len(texts)} queries → {MODEL_PATH}")
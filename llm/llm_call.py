@@ -0,0 +1,529 @@
+# llm_call.py
+# The one way every stage calls the LLM, sync or async. Each call gets:
+# - a per-stage deadline covering all attempts
+# - jittered exponential retries on transient errors (tenacity)
+# - a hedged second request once the first has run longer than the stage's recent p95;
+#   the first answer wins and the other is cancelled
+# - a per-stage circuit breaker: after repeated failures the stage fails fast with
+#   LLMUnavailable, so callers degrade to their local fallback without waiting
+# - latency histograms per stage (see latency_stats())
+# The model, deadline and token budget come from the stage's tier in the model policy
+# (llm/model_policy.py); llm_call_checked escalates to the next tier on invalid output.
+# Every request sent waits for admission (llm/admission.py); a shed one raises LLMBusy.
+import asyncio
+import contextvars
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import openai
+from tenacity import AsyncRetrying, Retrying, retry_if_exception_type, stop_after_attempt, stop_after_delay, wait_random_exponential
+from llm.admission import Busy, admission_controller
+from llm.llm_utils import add_usage, async_client, client, estimate_tokens
+from llm.model_policy import get_model_policy
+
+MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SECONDS = 0.25
+RETRY_MAX_SECONDS = 2.0
+
+HEDGING = os.getenv("LLM_HEDGING", "1") == "1"
+# No hedging until a stage has this many samples; the hedge delay never drops below the floor
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.2
+HEDGE_QUANTILE = 0.95
+
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+    openai.InternalServerError, asyncio.TimeoutError, TimeoutError,
+)
+
+# Parse errors that mean the model's answer is unusable (e.g. bad JSON) and worth escalating
+INVALID_OUTPUT_ERRORS = (ValueError, KeyError)
+
+# Histogram bucket upper bounds in seconds (the last bucket is open-ended)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+
+
+class LLMUnavailable(Exception):
+    """The stage's circuit is open or every attempt failed within the deadline."""
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"LLM stage '{stage}' unavailable: {reason}")
+        self.stage = stage
+
+
+class LLMBusy(LLMUnavailable):
+    """Shed by admission control before anything was sent."""
+
+
+class LatencyHistogram:
+    def __init__(self, window: int = 500):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.failures = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        # Answers rejected by validation and retried on the next tier
+        self.escalations = 0
+        self.shed = 0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(BUCKETS, seconds)] += 1
+            self._recent.append(seconds)
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            recent = sorted(self._recent)
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, int(q * len(recent)))]
+
+    def hedge_delay(self) -> float | None:
+        with self._lock:
+            samples = len(self._recent)
+        if not HEDGING or samples < HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.quantile(HEDGE_QUANTILE), HEDGE_MIN_DELAY)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts, samples = list(self.counts), len(self._recent)
+            failures, hedged, hedge_wins = self.failures, self.hedged, self.hedge_wins
+            escalations, shed = self.escalations, self.shed
+        labels = [f"<={b:g}s" for b in BUCKETS] + [f">{BUCKETS[-1]:g}s"]
+        return {
+            "buckets": dict(zip(labels, counts)), "calls": sum(counts), "failures": failures,
+            "hedged": hedged, "hedge_wins": hedge_wins, "escalations": escalations, "shed": shed,
+            "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99),
+            "recent_samples": samples,
+        }
+
+
+class CircuitBreaker:
+    """Opens after BREAKER_FAILURES consecutive failures; after the cooldown one trial
+    call is let through (half-open) and its outcome closes or re-opens the circuit. A trial
+    that ends without an outcome (shed, cancelled, a non-transient error) is given back
+    with end_trial() so the next call can be the trial."""
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> str | None:
+        """"closed", "trial" when this call is the half-open trial, or None when it may not go out."""
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if not self._trial and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN_SECONDS:
+                self._trial = True
+                return "trial"
+            return None
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.failures, self.opened_at = 0, None
+            else:
+                self.failures += 1
+                if self._trial or self.failures >= BREAKER_FAILURES:
+                    self.opened_at = time.monotonic()
+            self._trial = False
+
+    def end_trial(self) -> None:
+        # Leaves the circuit open; a recorded outcome has already cleared the trial
+        with self._lock:
+            self._trial = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if self._trial else "open"
+
+
+_histograms: dict[str, LatencyHistogram] = {}
+_breakers: dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def _stage_state(stage: str) -> tuple[LatencyHistogram, CircuitBreaker]:
+    with _registry_lock:
+        if stage not in _histograms:
+            _histograms[stage] = LatencyHistogram()
+            _breakers[stage] = CircuitBreaker()
+        return _histograms[stage], _breakers[stage]
+
+
+def latency_stats() -> dict:
+    """Per-stage latency histogram, percentiles, hedging and breaker state. Stages on a
+    tier other than their default are listed as "<stage>@<tier>"."""
+    with _registry_lock:
+        stages = list(_histograms)
+    stats = {}
+    for stage in stages:
+        histogram, breaker = _stage_state(stage)
+        stats[stage] = {**histogram.snapshot(), "breaker": breaker.state}
+    return stats
+
+
+def _prepare(stage: str, request: dict, tier: str | None, deadline: float | None):
+    """(request with the tier's model, deadline, histogram, breaker, trial); each tier of a
+    stage has its own latency and breaker state. trial is True when this call is the
+    breaker's half-open trial and must end with breaker.record() or breaker.end_trial()."""
+    policy = get_model_policy()
+    default_tier = policy.stage_tiers(stage)[0]
+    tier = tier or default_tier
+    histogram, breaker = _stage_state(stage if tier == default_tier else f"{stage}@{tier}")
+    passage = breaker.allow()
+    if passage is None:
+        raise LLMUnavailable(stage, "circuit open")
+    deadline = deadline if deadline is not None else policy.deadline(stage)
+    return policy.apply(stage, tier, request), deadline, histogram, breaker, passage == "trial"
+
+
+def _retrying(cls, deadline: float):
+    return cls(
+        stop=stop_after_attempt(MAX_ATTEMPTS) | stop_after_delay(deadline),
+        wait=wait_random_exponential(multiplier=RETRY_BASE_SECONDS, max=RETRY_MAX_SECONDS),
+        retry=retry_if_exception_type(TRANSIENT_ERRORS),
+        reraise=True,
+    )
+
+
+def _record_usage(response) -> None:
+    # Only the winner's usage is known; every prompt sent was counted when it went out
+    used = response.usage.total_tokens if getattr(response, "usage", None) is not None else 0
+    add_usage(0, used)
+
+
+def _budget(request: dict) -> int:
+    # What the provider counts against the token limit: the prompt plus the completion cap
+    return estimate_tokens(request) + request.get("max_tokens", 0)
+
+
+def _rate_limited(e: openai.RateLimitError) -> None:
+    # One 429 pauses every caller for the provider's retry-after, not just this one
+    try:
+        retry_after = float(e.response.headers.get("retry-after", 1))
+    except (AttributeError, TypeError, ValueError):
+        retry_after = 1.0
+    admission_controller.pause(retry_after)
+
+
+# --- sync ---
+
+# Threads for the two requests of a hedged blocking call; the losing request runs to its
+# own timeout in the background (a blocking HTTP call cannot be cancelled)
+HEDGE_THREADS = int(os.getenv("LLM_HEDGE_THREADS", "8"))
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="llm-hedge")
+# A request only goes to the pool with a thread reserved for it: queued behind blocked
+# calls, it would spend its deadline before it was even sent
+_hedge_slots = threading.BoundedSemaphore(HEDGE_THREADS)
+
+
+def _start(fn, *args):
+    # fn on a pool thread reserved with _hedge_slots, in a copy of the caller's context
+    # (its LLM priority, usage counter)
+    future = _hedge_pool.submit(contextvars.copy_context().run, fn, *args)
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    return future
+
+
+def _send_sync(request: dict, deadline_at: float, admitted: bool = False):
+    if not admitted:
+        admission_controller.admit(_budget(request), timeout=deadline_at - time.monotonic())
+    # Counted on sending, so a request whose caller is cancelled still shows up
+    add_usage(estimate_tokens(request))
+    try:
+        return client.chat.completions.create(**request, timeout=max(deadline_at - time.monotonic(), 0.001))
+    except openai.RateLimitError as e:
+        _rate_limited(e)
+        raise
+
+
+def _attempt_sync(stage: str, request: dict, deadline_at: float, histogram: LatencyHistogram):
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError(f"{stage} deadline exceeded")
+    hedge_delay = histogram.hedge_delay()
+    # Every pool thread busy: sent unhedged from the calling thread
+    if hedge_delay is None or hedge_delay >= remaining or not _hedge_slots.acquire(blocking=False):
+        return _send_sync(request, deadline_at)
+
+    primary = _start(_send_sync, request, deadline_at)
+    done, _ = wait([primary], timeout=hedge_delay)
+    if done:
+        return primary.result()
+    pending = {primary}
+    # A hedge is only worth sending if it can go without queueing
+    hedge = None
+    if _hedge_slots.acquire(blocking=False):
+        if admission_controller.try_admit(_budget(request)):
+            histogram.count("hedged")
+            hedge = _start(_send_sync, request, deadline_at, True)
+            pending.add(hedge)
+        else:
+            _hedge_slots.release()
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(deadline_at - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError(f"{stage} deadline exceeded")
+        for future in done:
+            if future.exception() is None:
+                if future is hedge:
+                    histogram.count("hedge_wins")
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def llm_call(stage: str, request: dict, deadline: float | None = None, tier: str | None = None):
+    """Blocking chat completion for `stage` on `tier` (default: the stage's first tier);
+    raises LLMUnavailable when it cannot answer."""
+    request, deadline, histogram, breaker, trial = _prepare(stage, request, tier, deadline)
+    started = time.monotonic()
+    try:
+        for attempt in _retrying(Retrying, deadline):
+            with attempt:
+                response = _attempt_sync(stage, request, started + deadline, histogram)
+    except Busy as e:
+        histogram.count("shed")
+        raise LLMBusy(stage, f"busy, {e}") from e
+    except TRANSIENT_ERRORS as e:
+        histogram.count("failures")
+        breaker.record(ok=False)
+        raise LLMUnavailable(stage, str(e) or type(e).__name__) from e
+    else:
+        breaker.record(ok=True)
+    finally:
+        # A no-op once an outcome was recorded
+        if trial:
+            breaker.end_trial()
+    histogram.observe(time.monotonic() - started)
+    _record_usage(response)
+    return response
+
+
+def _escalate(stage: str, tiers: list[str], index: int, problem: str) -> None:
+    print(f"[WARN] {stage} answer from tier '{tiers[index]}' rejected ({problem}); trying '{tiers[index + 1]}'")
+    _stage_state(stage if index == 0 else f"{stage}@{tiers[index]}")[0].count("escalations")
+
+
+def llm_call_checked(stage: str, request: dict, parse, check=None):
+    """llm_call on the stage's tiers in order until the answer is usable.
+
+    parse(response) returns the stage's result and raises one of INVALID_OUTPUT_ERRORS on
+    unusable output; check(result), if given, returns what is wrong with a parsed result
+    or None. The last tier's result (or parse error) is returned as is.
+    """
+    tiers = get_model_policy().stage_tiers(stage)
+    for index, tier in enumerate(tiers):
+        last = index == len(tiers) - 1
+        response = llm_call(stage, request, tier=tier)
+        try:
+            result = parse(response)
+        except INVALID_OUTPUT_ERRORS as e:
+            if last:
+                raise
+            problem = f"unparseable: {e}"
+        else:
+            problem = check(result) if check is not None else None
+            if problem is None or last:
+                return result
+        _escalate(stage, tiers, index, problem)
+
+
+# --- async ---
+
+async def _race(stage: str, start, budget: int, deadline_at: float, histogram: LatencyHistogram, discard=None):
+    """Run start(admitted=False) and, past the hedge delay, a second start(admitted=True)
+    if admission has room for it right away; first success wins.
+    discard(result) releases a result that lost the race (e.g. closes a stream)."""
+    remaining = deadline_at - time.monotonic()
+    if remaining <= 0:
+        raise asyncio.TimeoutError(f"{stage} deadline exceeded")
+    tasks = [asyncio.ensure_future(start(False))]
+    hedge_delay = histogram.hedge_delay()
+    try:
+        if hedge_delay is not None and hedge_delay < remaining:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and admission_controller.try_admit(budget):
+                histogram.count("hedged")
+                tasks.append(asyncio.ensure_future(start(True)))
+        error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(deadline_at - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                raise asyncio.TimeoutError(f"{stage} deadline exceeded")
+            for task in done:
+                if task.exception() is None:
+                    if len(tasks) > 1 and task is tasks[1]:
+                        histogram.count("hedge_wins")
+                    winner = task
+                    for other in tasks:
+                        if other is not winner and other.done() and not other.cancelled() \
+                                and other.exception() is None and discard is not None:
+                            await discard(other.result())
+                    return winner.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            task.add_done_callback(_retrieve)
+
+
+def _retrieve(task) -> None:
+    # A losing request's error is not reported as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+async def llm_call_async(stage: str, request: dict, deadline: float | None = None, tier: str | None = None):
+    """Async chat completion for `stage`; raises LLMUnavailable when it cannot answer."""
+    request, deadline, histogram, breaker, trial = _prepare(stage, request, tier, deadline)
+    started = time.monotonic()
+    try:
+        async for attempt in _retrying(AsyncRetrying, deadline):
+            with attempt:
+                response = await _race(
+                    stage, lambda admitted: _send_async(request, started + deadline, admitted),
+                    _budget(request), started + deadline, histogram,
+                )
+    except Busy as e:
+        histogram.count("shed")
+        raise LLMBusy(stage, f"busy, {e}") from e
+    except TRANSIENT_ERRORS as e:
+        histogram.count("failures")
+        breaker.record(ok=False)
+        raise LLMUnavailable(stage, str(e) or type(e).__name__) from e
+    else:
+        breaker.record(ok=True)
+    finally:
+        # A no-op once an outcome was recorded
+        if trial:
+            breaker.end_trial()
+    histogram.observe(time.monotonic() - started)
+    _record_usage(response)
+    return response
+
+
+async def llm_call_checked_async(stage: str, request: dict, parse, check=None):
+    """llm_call_checked for the event loop; check may be a coroutine function (e.g. one
+    that EXPLAINs SQL on the DB pool)."""
+    tiers = get_model_policy().stage_tiers(stage)
+    for index, tier in enumerate(tiers):
+        last = index == len(tiers) - 1
+        response = await llm_call_async(stage, request, tier=tier)
+        try:
+            result = parse(response)
+        except INVALID_OUTPUT_ERRORS as e:
+            if last:
+                raise
+            problem = f"unparseable: {e}"
+        else:
+            problem = check(result) if check is not None else None
+            if inspect.isawaitable(problem):
+                problem = await problem
+            if problem is None or last:
+                return result
+        _escalate(stage, tiers, index, problem)
+
+
+async def _send_async(request: dict, deadline_at: float, admitted: bool = False, **kwargs):
+    if not admitted:
+        await admission_controller.admit_async(_budget(request), timeout=deadline_at - time.monotonic())
+    add_usage(estimate_tokens(request))
+    try:
+        # The client closes the request at the deadline, rather than it being left
+        # running once the race has given up on it
+        return await async_client.chat.completions.create(
+            **request, **kwargs, timeout=max(deadline_at - time.monotonic(), 0.001)
+        )
+    except openai.RateLimitError as e:
+        _rate_limited(e)
+        raise
+
+
+async def _open_stream(request: dict, deadline_at: float, admitted: bool):
+    # A stream counts as answered once its first chunk arrives
+    stream = await _send_async(request, deadline_at, admitted, stream=True)
+    chunks = stream.__aiter__()
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    return stream, chunks, first
+
+
+async def _close(stream) -> None:
+    # openai's AsyncStream has close(); plain async generators (test doubles) have aclose()
+    close = getattr(stream, "close", None) or stream.aclose
+    await close()
+
+
+async def _close_stream(opened) -> None:
+    await _close(opened[0])
+
+
+async def llm_stream(stage: str, request: dict, deadline: float | None = None):
+    """Text deltas of a streamed completion. Deadline, retries and hedging apply up to
+    the first token; the histogram records time to first token. Streams run on the
+    stage's first tier (there is nothing to validate before the text is shown)."""
+    request, deadline, histogram, breaker, trial = _prepare(stage, request, None, deadline)
+    started = time.monotonic()
+    try:
+        async for attempt in _retrying(AsyncRetrying, deadline):
+            with attempt:
+                stream, chunks, first = await _race(
+                    stage, lambda admitted: _open_stream(request, started + deadline, admitted),
+                    _budget(request), started + deadline, histogram, discard=_close_stream,
+                )
+    except Busy as e:
+        histogram.count("shed")
+        raise LLMBusy(stage, f"busy, {e}") from e
+    except TRANSIENT_ERRORS as e:
+        histogram.count("failures")
+        breaker.record(ok=False)
+        raise LLMUnavailable(stage, str(e) or type(e).__name__) from e
+    else:
+        breaker.record(ok=True)
+    finally:
+        # A no-op once an outcome was recorded
+        if trial:
+            breaker.end_trial()
+    histogram.observe(time.monotonic() - started)
+    _record_usage(None)
+
+    try:
+        chunk = first
+        while chunk is not None:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                chunk = None
+    finally:
+        await _close(stream)
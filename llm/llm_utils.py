@@ -1,4 +1,34 @@
+import contextvars
+import json
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Retries, timeouts and hedging are handled per stage by llm/llm_call.py.
+# OPENAI_BASE_URL points both clients at any OpenAI-compatible server (e.g. a local stand-in).
+BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=BASE_URL, max_retries=0)
+# Used by the async agents; awaited on one shared event loop (see llm/async_runtime.py)
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=BASE_URL, max_retries=0)
+
+# Token usage of the calls made in the current context (e.g. one speculative branch):
+# {"requested": estimated prompt tokens sent, "used": tokens billed}
+_usage = contextvars.ContextVar("llm_usage", default=None)
+
+
+def track_usage(usage: dict | None = None) -> dict:
+    """Start counting token usage for the calls made in the current task."""
+    usage = usage if usage is not None else {"requested": 0, "used": 0}
+    _usage.set(usage)
+    return usage
+
+
+def add_usage(requested: int, used: int = 0) -> None:
+    usage = _usage.get()
+    if usage is not None:
+        usage["requested"] += requested
+        usage["used"] += used
+
+
+def estimate_tokens(request: dict) -> int:
+    # ~4 characters per token of the prompt
+    return len(json.dumps(request.get("messages", []), ensure_ascii=False)) // 4
@@ -0,0 +1,69 @@
+# model_policy.py
+# Which model answers each LLM stage, and the stage's latency and token budget. A stage
+# runs on its first tier (fast and cheap) and moves to the next only when the answer
+# fails the stage's validation (see llm_call_checked in llm/llm_call.py). The policy is
+# config/model_policy.json; MODEL_POLICY_PATH points at another file, and
+# OPENAI_BASE_URL at an OpenAI-compatible server, e.g. a local stand-in for testing.
+import json
+import os
+import threading
+
+MODEL_POLICY_PATH = os.getenv(
+    "MODEL_POLICY_PATH", os.path.join(os.path.dirname(__file__), "..", "config", "model_policy.json")
+)
+
+
+class ModelPolicy:
+    def __init__(self, policy: dict):
+        self.tiers = policy["tiers"]
+        self.default_stage = policy.get("default_stage", {"tiers": [next(iter(self.tiers))]})
+        self.stages = policy.get("stages", {})
+        for stage, settings in [("default_stage", self.default_stage), *self.stages.items()]:
+            unknown = [tier for tier in settings.get("tiers", []) if tier not in self.tiers]
+            if unknown:
+                raise ValueError(f"Model policy stage '{stage}' uses unknown tiers: {unknown}")
+
+    @classmethod
+    def load(cls, path: str) -> "ModelPolicy":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _settings(self, stage: str) -> dict:
+        return {**self.default_stage, **self.stages.get(stage, {})}
+
+    def stage_tiers(self, stage: str) -> list[str]:
+        """Tiers in escalation order; the first is the default."""
+        return list(self._settings(stage)["tiers"])
+
+    def deadline(self, stage: str) -> float:
+        """Seconds for one call of the stage on one tier, retries included."""
+        return float(self._settings(stage).get("deadline", 20))
+
+    def apply(self, stage: str, tier: str, request: dict) -> dict:
+        # Model from the tier; the stage's token budget unless the call site set its own
+        applied = {**request, "model": self.tiers[tier]["model"]}
+        max_tokens = self._settings(stage).get("max_tokens")
+        if max_tokens is not None:
+            applied.setdefault("max_tokens", max_tokens)
+        return applied
+
+
+_policy = None
+_policy_lock = threading.Lock()
+
+
+def get_model_policy() -> ModelPolicy:
+    # Read once per process
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                _policy = ModelPolicy.load(MODEL_POLICY_PATH)
+    return _policy
+
+
+def set_model_policy(policy: ModelPolicy) -> None:
+    """Replace the active policy, e.g. after editing the config or in a benchmark."""
+    global _policy
+    with _policy_lock:
+        _policy = policy
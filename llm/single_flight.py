@@ -0,0 +1,153 @@
+# single_flight.py
+# Coalescing of identical in-flight work. The first caller for a key runs it; callers
+# arriving with the same key while it runs wait for that run and get its result (or its
+# exception) instead of repeating it. Sync callers block on the shared future and async
+# callers await it, so a thread and an event loop can share one run. Keys are built by
+# the caller: insight work by normalized question plus data version (insight_agent),
+# side-effecting requests only by an explicit idempotency key (orchestrator).
+import asyncio
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+# Replies to an idempotency key are kept this long, so a resubmission arriving after
+# the first run finished gets the same reply instead of running the action again
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600"))
+# 0 runs every caller's work itself (idempotency keys included)
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+
+
+def normalize_query(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip(" ?.!")
+
+
+class Flight:
+    __slots__ = ("future", "waiters", "task")
+
+    def __init__(self):
+        self.future = Future()
+        # Callers waiting on the result; an async run is cancelled when the last one leaves
+        self.waiters = 1
+        self.task = None
+
+
+class Interrupted(Exception):
+    """The run other callers were waiting on stopped without a result."""
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: dict = {}
+        # key -> (expires at, finished flight) for runs completed with a ttl
+        self._recent: dict = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def begin(self, key) -> tuple[Flight, bool]:
+        """(flight, True) when the caller runs the work and must complete() the flight;
+        (flight, False) when it should wait on another caller's run."""
+        if not self.enabled:
+            return Flight(), True
+        with self._lock:
+            now = time.monotonic()
+            recent = self._recent.get(key)
+            if recent is not None and recent[0] > now:
+                self.followers += 1
+                return recent[1], False
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self.leaders += 1
+            return flight, True
+
+    def complete(self, key, flight: Flight, result=None, error: BaseException | None = None,
+                 ttl: float | None = None) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if ttl and error is None and self.enabled:
+                now = time.monotonic()
+                for expired in [k for k, (expires_at, _) in self._recent.items() if expires_at <= now]:
+                    del self._recent[expired]
+                self._recent[key] = (now + ttl, flight)
+        if error is not None:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(result)
+
+    def wait(self, flight: Flight, share=None):
+        """The flight's result; share(result) gives a follower its own copy of anything
+        stateful in it (e.g. a result cursor)."""
+        result = flight.future.result()
+        return share(result) if share is not None else result
+
+    async def wait_async(self, flight: Flight, share=None):
+        shared = asyncio.wrap_future(flight.future)
+        try:
+            # Shielded: one waiter being cancelled must not cancel the shared run
+            result = await asyncio.shield(shared)
+        except asyncio.CancelledError:
+            # The run's outcome is no longer this waiter's to report
+            shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._leave(flight)
+            raise
+        return share(result) if share is not None else result
+
+    def _leave(self, flight: Flight) -> None:
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters > 0 or flight.task is None or flight.task.done():
+                return
+            # Nobody wants the result any more; new callers start a fresh run
+            for key, running in list(self._flights.items()):
+                if running is flight:
+                    del self._flights[key]
+        flight.task.get_loop().call_soon_threadsafe(flight.task.cancel)
+
+    def do(self, key, fn, *args, share=None, ttl: float | None = None, **kwargs):
+        """fn(*args, **kwargs), run once for every concurrent caller with this key."""
+        flight, leader = self.begin(key)
+        if not leader:
+            return self.wait(flight, share)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.complete(key, flight, error=e)
+            raise
+        except BaseException:
+            self.complete(key, flight, error=Interrupted("the shared run was interrupted"))
+            raise
+        self.complete(key, flight, result, ttl=ttl)
+        return result
+
+    async def do_async(self, key, fn, *args, share=None, ttl: float | None = None, **kwargs):
+        """await fn(*args, **kwargs), run once for every concurrent caller with this key."""
+        flight, leader = self.begin(key)
+        if not leader:
+            return await self.wait_async(flight, share)
+        # Its own task, so the leader being cancelled does not end it for the others
+        flight.task = asyncio.ensure_future(fn(*args, **kwargs))
+        flight.task.add_done_callback(lambda task: self._finish(key, flight, task, ttl))
+        return await self.wait_async(flight)
+
+    def _finish(self, key, flight: Flight, task, ttl: float | None) -> None:
+        if task.cancelled():
+            self.complete(key, flight, error=Interrupted("the shared run was cancelled"))
+        elif task.exception() is not None:
+            self.complete(key, flight, error=task.exception())
+        else:
+            self.complete(key, flight, task.result(), ttl=ttl)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"leaders": self.leaders, "coalesced": self.followers, "in_flight": len(self._flights)}
+
+
+single_flight = SingleFlight(enabled=SINGLE_FLIGHT)
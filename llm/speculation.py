@@ -0,0 +1,144 @@
+# speculation.py
+# Speculative routing for the async orchestrator. While the LLM classifier decides the
+# route, the planning steps of the likely routes (tool choice, SQL generation) already
+# run; once the route is known the losing branches are cancelled. Only planning is
+# ever speculative: tools and SQL run after the route is known, on the winner's plan.
+# Branches run at batch priority, so under load they queue behind (or are shed before)
+# interactive LLM requests; a shed winning branch is planned again at full priority.
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from llm.admission import set_priority
+from llm.llm_call import LLMBusy
+from llm.llm_utils import track_usage
+
+SPECULATIVE_ROUTING = os.getenv("SPECULATIVE_ROUTING", "0") == "1"
+# A route is speculated when its blended probability reaches this, up to MAX_BRANCHES routes
+MIN_PROBABILITY = float(os.getenv("SPECULATION_MIN_PROBABILITY", "0.25"))
+MAX_BRANCHES = int(os.getenv("SPECULATION_MAX_BRANCHES", "2"))
+PRIOR_WINDOW = int(os.getenv("SPECULATION_PRIOR_WINDOW", "200"))
+
+
+class RoutePrior:
+    """Route frequencies over the last `window` routed queries (Laplace-smoothed)."""
+
+    def __init__(self, labels: tuple[str, ...], window: int = PRIOR_WINDOW):
+        self.labels = labels
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, route: str) -> None:
+        if route in self.labels:
+            with self._lock:
+                self._recent.append(route)
+
+    def probabilities(self) -> dict[str, float]:
+        with self._lock:
+            recent = list(self._recent)
+        return {label: (recent.count(label) + 1) / (len(recent) + len(self.labels)) for label in self.labels}
+
+    def likely_routes(self, classifier_probs: dict[str, float], candidates) -> list[str]:
+        """Candidate routes worth speculating on for this query, most likely first."""
+        prior = self.probabilities()
+        # Recent traffic and the local classifier's (low-confidence) view, weighted equally
+        blended = {r: (prior.get(r, 0.0) + classifier_probs.get(r, 0.0)) / 2 for r in candidates}
+        ranked = sorted((r for r in blended if blended[r] >= MIN_PROBABILITY), key=lambda r: -blended[r])
+        return ranked[:MAX_BRANCHES]
+
+
+class SpeculationStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.branches = 0
+        self.used = 0
+        self.cancelled = 0
+        self.wasted_tokens = 0
+        self.saved_seconds = 0.0
+
+    def add(self, **deltas) -> None:
+        with self._lock:
+            for name, value in deltas.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = {name: getattr(self, name) for name in
+                     ("queries", "branches", "used", "cancelled", "wasted_tokens", "saved_seconds")}
+        stats["hit_rate"] = stats["used"] / stats["queries"] if stats["queries"] else 0.0
+        return stats
+
+
+speculation_stats = SpeculationStats()
+
+
+class Speculation:
+    """Planning branches started for one query before its route is known."""
+
+    def __init__(self, query: str, planners: dict, routes: list[str]):
+        self.started = time.monotonic()
+        self.query = query
+        self.planners = planners
+        self.branches = {}
+        for route in routes:
+            usage = {"requested": 0, "used": 0}
+            task = asyncio.create_task(self._plan(planners[route], query, usage))
+            self.branches[route] = (task, usage)
+        speculation_stats.add(queries=1, branches=len(routes))
+
+    @staticmethod
+    async def _plan(planner, query: str, usage: dict):
+        # Token usage and priority of this branch only (the task runs in its own context copy)
+        track_usage(usage)
+        set_priority("batch")
+        started = time.monotonic()
+        try:
+            return await planner(query)
+        finally:
+            usage["seconds"] = time.monotonic() - started
+
+    def resolve(self, route: str):
+        """Cancel every branch but `route`'s; returns the winning task, or None."""
+        route_seconds = time.monotonic() - self.started
+        winner = None
+        for branch_route, (task, usage) in self.branches.items():
+            if branch_route == route:
+                task.add_done_callback(lambda t, u=usage: self._count_saving(t, u, route_seconds))
+                winner = asyncio.ensure_future(self._replan_if_shed(task, self.planners[route], self.query))
+                continue
+            if not task.done():
+                task.cancel()
+                speculation_stats.add(cancelled=1)
+            # Billed tokens of the calls that answered, or the prompts sent if more (a call
+            # cut off by the cancel is never billed back to us)
+            task.add_done_callback(lambda t, u=usage: speculation_stats.add(wasted_tokens=max(u["used"], u["requested"])))
+            task.add_done_callback(_discard_result)
+        return winner
+
+    @staticmethod
+    async def _replan_if_shed(task, planner, query: str):
+        try:
+            return await task
+        except LLMBusy:
+            # The route is known now, so this is the user's own request again
+            return await planner(query)
+
+    def cancel(self) -> None:
+        for task, _ in self.branches.values():
+            task.cancel()
+            task.add_done_callback(_discard_result)
+
+    @staticmethod
+    def _count_saving(task, usage: dict, route_seconds: float) -> None:
+        if task.cancelled() or task.exception() is not None:
+            return
+        # Sequentially the plan would have started after routing; in parallel they overlap
+        speculation_stats.add(used=1, saved_seconds=min(route_seconds, usage.get("seconds", 0.0)))
+
+
+def _discard_result(task) -> None:
+    # Retrieve a losing branch's exception so it is not reported as never retrieved
+    if not task.cancelled():
+        task.exception()
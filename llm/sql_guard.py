@@ -0,0 +1,286 @@
+# sql_guard.py
+# Guard stage for LLM-generated SQL. Before anything runs, the SQL is checked to be a
+# single read-only statement and EXPLAINed on its target engine; plans that would
+# explode (cross products, huge row estimates) are rejected. Results are then capped
+# at a row limit and every fetch runs under a wall-clock timeout.
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import duckdb
+import pandas as pd
+import pyarrow as pa
+from database.db_utils import duckdb_manager, get_duckdb_conn, sqlite_engine
+from database.result_handle import PAGE_ROWS, ResultHandle
+
+# Rows returned to the user; one extra row is fetched so callers can tell the result was cut
+MAX_ROWS = int(os.getenv("SQL_GUARD_MAX_ROWS", "1000"))
+TIMEOUT_SECONDS = float(os.getenv("SQL_GUARD_TIMEOUT_SECONDS", "10"))
+# Any operator estimated above this is rejected; cross products have a much lower bound
+MAX_ESTIMATED_ROWS = int(os.getenv("SQL_GUARD_MAX_ESTIMATED_ROWS", "100000000"))
+MAX_CROSS_PRODUCT_ROWS = int(os.getenv("SQL_GUARD_MAX_CROSS_PRODUCT_ROWS", "1000000"))
+
+_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|;", re.DOTALL)
+_WRITE_RE = re.compile(
+    r"\b(?:insert|update|delete|drop|alter|create|attach|detach|copy|pragma|truncate|vacuum|"
+    r"export|import|install|load|call|set|reset|grant|revoke|checkpoint|begin|commit|rollback)\b"
+    r"|\breplace\s+into\b"
+    # File/network readers would let a query reach outside the two databases
+    r"|\b(?:read_\w+|glob|parquet_scan|sqlite_scan|sniff_csv)\s*\(",
+    re.IGNORECASE,
+)
+_ALIAS_RE = re.compile(r"\b(?:from|join)\s+([A-Za-z_]\w*)(?:\s+(?:as\s+)?([A-Za-z_]\w*))?", re.IGNORECASE)
+_NOT_ALIASES = {"where", "join", "on", "using", "group", "order", "limit", "left", "right", "inner",
+                "outer", "cross", "full", "natural", "union", "having", "window", "as"}
+
+
+class GuardError(Exception):
+    """Raised when generated SQL is rejected or stopped; the message is shown to the user."""
+
+
+def clean_sql(sql: str) -> str:
+    """Strip comments and trailing semicolons; reject multiple statements."""
+    parts, pos = [], 0
+    for match in _TOKEN_RE.finditer(sql):
+        token = match.group()
+        parts.append(sql[pos:match.start()])
+        if token == ";":
+            if sql[match.end():].strip(" \t\r\n;"):
+                raise GuardError("Only a single SQL statement is allowed.")
+        elif not token.startswith(("--", "/*")):
+            parts.append(token)
+        pos = match.end()
+    parts.append(sql[pos:])
+    return "".join(parts).strip()
+
+
+def check_read_only(sql: str) -> str:
+    sql = clean_sql(sql)
+    if not sql:
+        raise GuardError("The generated SQL is empty.")
+    without_literals = _TOKEN_RE.sub("''", sql)
+    if not re.match(r"\(*\s*(?:select|with|values)\b", without_literals, re.IGNORECASE):
+        raise GuardError("Only SELECT queries can be run for insights.")
+    match = _WRITE_RE.search(without_literals)
+    if match:
+        raise GuardError(f"The generated SQL contains a disallowed operation ({match.group().strip()}).")
+    return sql
+
+
+def validate_sql(engine: str, sql: str) -> None:
+    """Read-only check and EXPLAIN on "sqlite" or "duckdb" without running the query;
+    raises GuardError or the engine's own error (e.g. an unknown column)."""
+    sql = check_read_only(sql)
+    if engine == "duckdb":
+        with get_duckdb_conn(read_only=True) as conn:
+            explain_duckdb(conn, sql)
+    else:
+        with sqlite_engine.connect() as conn:
+            explain_sqlite(conn, sql)
+
+
+def limit_sql(sql: str, max_rows: int) -> str:
+    return f"SELECT * FROM ({sql}) AS guarded_result LIMIT {max_rows + 1}"
+
+
+def _check_estimate(estimate: int, cross_product: bool) -> None:
+    if cross_product and estimate > MAX_CROSS_PRODUCT_ROWS:
+        raise GuardError(f"The query joins tables without a join condition (~{estimate:,} rows); add a join condition or filter.")
+    if estimate > MAX_ESTIMATED_ROWS:
+        raise GuardError(f"The query would process too many rows (~{estimate:,}); narrow it with a filter or aggregate.")
+
+
+def _duckdb_estimate(node: dict) -> int:
+    # Post-order walk of the JSON plan; operators without an estimate inherit their inputs'
+    children = [_duckdb_estimate(child) for child in node.get("children", [])]
+    estimate = node.get("extra_info", {}).get("Estimated Cardinality")
+    if node["name"].strip() == "CROSS_PRODUCT":
+        product = 1
+        for child in children:
+            product *= child
+        _check_estimate(product, cross_product=True)
+        return product
+    estimate = int(estimate) if estimate and str(estimate).isdigit() else max(children, default=0)
+    _check_estimate(estimate, cross_product=False)
+    return estimate
+
+
+def explain_duckdb(conn, sql: str) -> None:
+    for _, plan in conn.execute(f"EXPLAIN (FORMAT json) {sql}").fetchall():
+        for node in json.loads(plan):
+            _duckdb_estimate(node)
+
+
+def explain_sqlite(conn, sql: str) -> None:
+    # SQLite has no row estimates: full scans that share a parent are nested loops,
+    # so their table sizes multiply
+    aliases = {}
+    for table, alias in _ALIAS_RE.findall(_TOKEN_RE.sub("''", sql)):
+        aliases[table.lower()] = table
+        if alias and alias.lower() not in _NOT_ALIASES:
+            aliases[alias.lower()] = table
+
+    sizes: dict[str, int] = {}
+    loops: dict[int, list[int]] = {}
+    for _, parent, _, detail in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall():
+        match = re.match(r"SCAN (\w+)", detail)
+        if not match:
+            continue
+        table = aliases.get(match.group(1).lower())
+        if table is None:
+            continue
+        if table not in sizes:
+            try:
+                sizes[table] = conn.exec_driver_sql(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table}"').scalar()
+            except Exception:
+                sizes[table] = 0
+        loops.setdefault(parent, []).append(sizes[table])
+
+    for sizes_in_loop in loops.values():
+        estimate = 1
+        for size in sizes_in_loop:
+            estimate *= max(size, 1)
+        _check_estimate(estimate, cross_product=len(sizes_in_loop) > 1)
+
+
+@contextmanager
+def duckdb_deadline(conn, timeout: float):
+    timer = threading.Timer(timeout, conn.interrupt)
+    timer.start()
+    try:
+        yield
+    except duckdb.InterruptException:
+        raise GuardError(f"The query was stopped after {timeout:g}s; try a narrower question.")
+    finally:
+        timer.cancel()
+
+
+@contextmanager
+def sqlite_deadline(conn, timeout: float):
+    raw = conn.connection.dbapi_connection
+    deadline = time.monotonic() + timeout
+    # Called every 10k VM instructions; a non-zero return aborts the statement
+    raw.set_progress_handler(lambda: int(time.monotonic() > deadline), 10_000)
+    try:
+        yield
+    except Exception as e:
+        if isinstance(getattr(e, "orig", e), sqlite3.OperationalError) and "interrupted" in str(e):
+            raise GuardError(f"The query was stopped after {timeout:g}s; try a narrower question.")
+        raise
+    finally:
+        raw.set_progress_handler(None, 0)
+
+
+def run_guarded_duckdb(sql: str, relations: dict[str, pd.DataFrame] | None = None,
+                       max_rows: int = MAX_ROWS, timeout: float = TIMEOUT_SECONDS) -> pd.DataFrame:
+    """Validate, EXPLAIN and run SQL on DuckDB; returns at most max_rows + 1 rows."""
+    sql = check_read_only(sql)
+    relations = relations or {}
+    with get_duckdb_conn(read_only=True) as conn:
+        for name, frame in relations.items():
+            conn.register(name, frame)
+        try:
+            explain_duckdb(conn, sql)
+            with duckdb_deadline(conn, timeout):
+                return conn.execute(limit_sql(sql, max_rows)).fetchdf()
+        finally:
+            for name in relations:
+                conn.unregister(name)
+
+
+def run_guarded_sqlite(sql: str, max_rows: int = MAX_ROWS, timeout: float = TIMEOUT_SECONDS) -> pd.DataFrame:
+    """Validate, EXPLAIN and run SQL on SQLite; returns at most max_rows + 1 rows."""
+    sql = check_read_only(sql)
+    with sqlite_engine.connect() as conn:
+        explain_sqlite(conn, sql)
+        with sqlite_deadline(conn, timeout):
+            return pd.read_sql_query(limit_sql(sql, max_rows), conn)
+
+
+def open_guarded_duckdb(sql: str, relations: dict[str, pd.DataFrame] | None = None,
+                        max_rows: int = MAX_ROWS, timeout: float = TIMEOUT_SECONDS) -> ResultHandle:
+    """Validate and EXPLAIN now; the returned handle streams record batches on demand.
+
+    Each page fetch runs under the timeout on a dedicated snapshot cursor. No LIMIT is
+    wrapped around the SQL (DuckDB's non-streaming LIMIT would buffer up to max_rows
+    rows before the first page); the handle stops reading past max_rows instead.
+    """
+    sql = check_read_only(sql)
+    relations = dict(relations or {})
+    with get_duckdb_conn(read_only=True) as conn:
+        for name, frame in relations.items():
+            conn.register(name, frame)
+        try:
+            explain_duckdb(conn, sql)
+        finally:
+            for name in relations:
+                conn.unregister(name)
+
+    def opener():
+        cursor = duckdb_manager.snapshot_cursor()
+
+        def close():
+            try:
+                cursor.execute("ROLLBACK")
+            finally:
+                cursor.close()
+
+        try:
+            for name, frame in relations.items():
+                cursor.register(name, frame)
+            with duckdb_deadline(cursor, timeout):
+                reader = cursor.execute(sql).fetch_record_batch(PAGE_ROWS)
+        except Exception:
+            close()
+            raise
+
+        def batches():
+            yielded = False
+            while True:
+                try:
+                    with duckdb_deadline(cursor, timeout):
+                        batch = reader.read_next_batch()
+                except StopIteration:
+                    break
+                yielded = True
+                yield batch
+            if not yielded:
+                # Keep the column names of an empty result
+                yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+
+        return batches(), close
+
+    return ResultHandle(opener, max_rows=max_rows)
+
+
+def open_guarded_sqlite(sql: str, max_rows: int = MAX_ROWS, timeout: float = TIMEOUT_SECONDS) -> ResultHandle:
+    """Validate and EXPLAIN now; the returned handle reads the result in chunks on demand
+    and, like the DuckDB one, stops reading past max_rows."""
+    sql = check_read_only(sql)
+    with sqlite_engine.connect() as conn:
+        explain_sqlite(conn, sql)
+
+    def opener():
+        conn = sqlite_engine.connect()
+        try:
+            with sqlite_deadline(conn, timeout):
+                chunks = pd.read_sql_query(sql, conn, chunksize=PAGE_ROWS)
+        except Exception:
+            conn.close()
+            raise
+
+        def batches():
+            while True:
+                try:
+                    with sqlite_deadline(conn, timeout):
+                        chunk = next(chunks)
+                except StopIteration:
+                    return
+                yield pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+
+        return batches(), conn.close
+
+    return ResultHandle(opener, max_rows=max_rows)
@@ -0,0 +1,330 @@
+# sql_reuse_index.py
+# Local index of past (question, validated SQL plan) pairs. Near-paraphrases of an
+# answered question reuse its plan instead of calling generate_sql_from_nl_agent.
+#
+# Questions are embedded with hashed character n-grams after numbers and dates are
+# cut out as parameter slots, so "top 5 products" and "top 10 products" share an
+# embedding and the stored SQL is re-bound with the new values. A close embedding is not
+# enough on its own: the two questions may only differ in filler words, so "ascending"
+# never reuses the plan for "descending". Past COARSE_MIN_ENTRIES
+# the vectors are clustered (spherical k-means) and a lookup only scans the clusters
+# closest to the query, which keeps it sub-millisecond at 100k entries.
+import copy
+import json
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from database.db_utils import DATA_DIR
+
+DIM = 256
+NGRAM_SIZES = (3, 4)
+
+# Minimum cosine similarity for a stored plan to be reused without the LLM
+SIMILARITY_THRESHOLD = float(os.getenv("SQL_REUSE_THRESHOLD", "0.92"))
+# Set to an empty string to keep the index in memory only
+INDEX_PATH = os.getenv("SQL_REUSE_INDEX_PATH", os.path.join(DATA_DIR, "sql_reuse_index.jsonl"))
+
+COARSE_MIN_ENTRIES = 4096
+N_PROBE = 8
+
+_SLOT_RE = re.compile(r"(?P<date>\b\d{4}-\d{2}-\d{2}\b)|(?P<num>(?<![\w.])\d+(?:\.\d+)?(?![\w.]))")
+_SLOT_TOKENS = {"date": "@", "num": "#"}
+# Words a paraphrase may add or drop; any other differing word (ascending/descending,
+# revenue/quantity, month/week) makes it a different question
+FILLER_WORDS = {
+    "a", "an", "the", "me", "us", "i", "we", "you", "please", "can", "could", "would", "show", "list", "give",
+    "get", "tell", "display", "find", "what", "which", "is", "are", "all", "want", "to", "see", "my", "our",
+}
+_QUOTED_SPLIT_RE = re.compile(r"('(?:[^']|'')*')")
+# Outside quoted literals a number is a parameter only after LIMIT/OFFSET, BETWEEN ... AND
+# or a comparison; elsewhere (GROUP BY 1, ORDER BY 2, arithmetic) it is part of the query
+_VALUE_PREFIX = r"(?:\b(?:limit|offset|between|and)\s+|(?:<=|>=|<>|!=|=|<|>)\s*)"
+
+
+def extract_slots(question: str) -> tuple[str, list[tuple[str, str]]]:
+    """Question with dates/numbers replaced by placeholders, plus the (kind, value) slots."""
+    slots = []
+
+    def cut(match):
+        kind = match.lastgroup
+        slots.append((kind, match.group(kind)))
+        return _SLOT_TOKENS[kind]
+
+    template = _SLOT_RE.sub(cut, question.lower())
+    return " ".join(re.findall(r"[a-z0-9#@]+", template)), slots
+
+
+def embed(template: str) -> np.ndarray:
+    """Signed hashed char n-grams of the slot template, L2-normalized."""
+    padded = f" {template} "
+    grams = [padded[i:i + n] for n in NGRAM_SIZES for i in range(len(padded) - n + 1)]
+    hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), np.uint32, len(grams))
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    vector = np.bincount(hashes % DIM, weights=signs, minlength=DIM).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def same_question(words: list[str], other: list[str]) -> bool:
+    return set(words) ^ set(other) <= FILLER_WORDS
+
+
+def _replace_slot(sql: str, kind: str, value: str, placeholder: str) -> tuple[str, int]:
+    """Replace the slot's value where it is a query parameter: inside quoted literals, and
+    for numbers also in value positions of the code. Returns (sql, replacements)."""
+    # Standalone only, never part of an identifier or a longer number
+    standalone = rf"(?<![\w.]){re.escape(value)}(?![\w.])" if kind == "num" else re.escape(value)
+    in_code = re.compile(rf"({_VALUE_PREFIX}){standalone}", re.IGNORECASE)
+    parts, count = _QUOTED_SPLIT_RE.split(sql), 0
+    for i, part in enumerate(parts):
+        if i % 2:
+            parts[i], n = re.subn(standalone, placeholder, part)
+        elif kind == "num":
+            parts[i], n = in_code.subn(lambda m: m.group(1) + placeholder, part)
+        else:
+            n = 0
+        count += n
+    return "".join(parts), count
+
+
+def _map_sqls(plan: dict, fn) -> dict:
+    mapped = copy.deepcopy(plan)
+    mapped["sqls"] = {db: fn(sql) if isinstance(sql, str) else sql for db, sql in plan.get("sqls", {}).items()}
+    if isinstance(plan.get("join"), str):
+        mapped["join"] = fn(plan["join"])
+    return mapped
+
+
+def _sql_strings(plan: dict) -> list[str]:
+    strings = [s for s in plan.get("sqls", {}).values() if isinstance(s, str)]
+    return strings + ([plan["join"]] if isinstance(plan.get("join"), str) else [])
+
+
+def templatize_plan(plan: dict, slots: list[tuple[str, str]]) -> tuple[dict, bool]:
+    """Replace slot literals in the plan's SQL with placeholders.
+
+    Returns (template, bindable). A plan is only bindable when every slot value is
+    distinct and appears in the SQL as a parameter (see _replace_slot); otherwise it may
+    only be reused for questions with exactly the same values.
+    """
+    values = [value for _, value in slots]
+    if len(set(values)) != len(values):
+        return plan, False
+    found = [0] * len(slots)
+
+    def cut(sql: str) -> str:
+        for i, (kind, value) in enumerate(slots):
+            sql, n = _replace_slot(sql, kind, value, f"__slot{i}__")
+            found[i] += n
+        return sql
+
+    template = _map_sqls(plan, cut)
+    if not all(found):
+        return plan, False
+    return template, True
+
+
+def bind_plan(template: dict, slots: list[tuple[str, str]]) -> dict:
+    def fill(sql: str) -> str:
+        for i, (_, value) in enumerate(slots):
+            sql = sql.replace(f"__slot{i}__", value)
+        return sql
+
+    return _map_sqls(template, fill)
+
+
+class _Block:
+    """Growable contiguous block of vectors and their entry ids."""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.vectors = np.zeros((capacity, dim), np.float32)
+        self.ids = np.zeros(capacity, np.int64)
+        self.size = 0
+
+    @classmethod
+    def from_arrays(cls, vectors: np.ndarray, ids: np.ndarray) -> "_Block":
+        block = cls(vectors.shape[1], capacity=max(16, 2 * len(ids)))
+        block.vectors[:len(ids)] = vectors
+        block.ids[:len(ids)] = ids
+        block.size = len(ids)
+        return block
+
+    def append(self, vector: np.ndarray, entry_id: int) -> None:
+        if self.size == len(self.ids):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.ids = np.concatenate([self.ids, np.zeros_like(self.ids)])
+        self.vectors[self.size] = vector
+        self.ids[self.size] = entry_id
+        self.size += 1
+
+    def best(self, query: np.ndarray) -> tuple[int, float]:
+        if not self.size:
+            return -1, -1.0
+        scores = self.vectors[:self.size] @ query
+        i = int(scores.argmax())
+        return int(self.ids[i]), float(scores[i])
+
+
+class SQLReuseIndex:
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, path: str | None = None,
+                 coarse_min_entries: int = COARSE_MIN_ENTRIES, n_probe: int = N_PROBE):
+        self.threshold = threshold
+        self.path = path
+        self.coarse_min_entries = coarse_min_entries
+        self.n_probe = n_probe
+        self._entries: list[dict] = []
+        self._all = _Block(DIM)
+        self._centroids: np.ndarray | None = None
+        self._clusters: list[_Block] = []
+        self._trained_at = 0
+        self._lock = threading.RLock()
+        self.lookups = 0
+        self.hits = 0
+        self.discarded = 0
+        self.lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, question: str, plan: dict, persist: bool = True) -> None:
+        """Index a plan whose SQL ran successfully for this question."""
+        template, slots = extract_slots(question)
+        sql_template, bindable = templatize_plan(plan, slots)
+        vector = embed(template)
+        with self._lock:
+            entry_id = len(self._entries)
+            self._entries.append({
+                "kinds": [kind for kind, _ in slots],
+                "values": [value for _, value in slots],
+                "words": template.split(),
+                "plan": sql_template,
+                "bindable": bindable,
+            })
+            self._all.append(vector, entry_id)
+            if self._centroids is not None:
+                self._clusters[int((self._centroids @ vector).argmax())].append(vector, entry_id)
+            if len(self._entries) >= self.coarse_min_entries and len(self._entries) >= 4 * self._trained_at:
+                self._train()
+        if persist and self.path:
+            self._persist({"question": question, "plan": plan})
+
+    def lookup(self, question: str) -> tuple[dict, float] | None:
+        """Re-bound plan and similarity of the closest reusable entry, or None."""
+        start = time.perf_counter()
+        with self._lock:
+            match = self._match(question)
+            self.lookups += 1
+            self.hits += match is not None
+            self.lookup_seconds += time.perf_counter() - start
+        return match[1:] if match is not None else None
+
+    def discard(self, question: str, persist: bool = True) -> bool:
+        """Stop reusing the entry lookup(question) returns, e.g. after its plan failed."""
+        with self._lock:
+            match = self._match(question)
+            if match is None:
+                return False
+            # A zero vector never reaches the threshold again
+            for block in [self._all, *self._clusters]:
+                block.vectors[:block.size][block.ids[:block.size] == match[0]] = 0
+            self.discarded += 1
+        if persist and self.path:
+            self._persist({"question": question, "discarded": True})
+        return True
+
+    def _match(self, question: str) -> tuple[int, dict, float] | None:
+        template, slots = extract_slots(question)
+        entry_id, score = self._nearest(embed(template))
+        if entry_id < 0 or score < self.threshold:
+            return None
+        entry = self._entries[entry_id]
+        if entry["kinds"] != [k for k, _ in slots] or not same_question(entry["words"], template.split()):
+            return None
+        if entry["bindable"]:
+            return entry_id, bind_plan(entry["plan"], slots), score
+        if entry["values"] == [v for _, v in slots]:
+            return entry_id, copy.deepcopy(entry["plan"]), score
+        return None
+
+    def _nearest(self, query: np.ndarray) -> tuple[int, float]:
+        if self._centroids is None:
+            return self._all.best(query)
+        centroid_scores = self._centroids @ query
+        probes = np.argpartition(-centroid_scores, min(self.n_probe, len(centroid_scores) - 1))[:self.n_probe]
+        return max((self._clusters[c].best(query) for c in probes), key=lambda r: r[1])
+
+    def _train(self, iterations: int = 8, seed: int = 0) -> None:
+        # Spherical k-means on a sample, then every vector is assigned to its closest centroid
+        vectors = self._all.vectors[:self._all.size]
+        n_clusters = int(np.clip(np.sqrt(len(vectors)), 16, 1024))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), n_clusters * 40), replace=False)]
+        centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            moved = norms > 0
+            centroids[moved] = sums[moved] / norms[moved, None]
+
+        assignment = np.concatenate([
+            (vectors[start:start + 16_384] @ centroids.T).argmax(axis=1)
+            for start in range(0, len(vectors), 16_384)
+        ])
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(n_clusters + 1))
+        clusters = [
+            _Block.from_arrays(vectors[order[lo:hi]], order[lo:hi])
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+
+        self._centroids, self._clusters, self._trained_at = centroids, clusters, len(vectors)
+
+    def _persist(self, record: dict) -> None:
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"[WARN] Could not persist SQL reuse entry: {e}")
+
+    def load(self) -> "SQLReuseIndex":
+        if self.path and os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        if record.get("discarded"):
+                            self.discard(record["question"], persist=False)
+                        else:
+                            self.add(record["question"], record["plan"], persist=False)
+        return self
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "discarded": self.discarded,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "avg_lookup_ms": self.lookup_seconds * 1000 / self.lookups if self.lookups else 0.0,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_sql_reuse_index() -> SQLReuseIndex:
+    # Loaded from INDEX_PATH once per process
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SQLReuseIndex(path=INDEX_PATH or None).load()
+    return _index
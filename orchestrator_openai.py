@@ -1,12 +1,23 @@
 import os
-from llm.llm_utils import client
-from llm.erp_tool_agent import call_tool_agent
-from llm.insight_agent import handle_insight_query
-from llm.format_response import format_response_with_gpt
-from llm.fallback_gpt_chat import fallback_gpt_chat
+from contextlib import aclosing
+from llm.llm_call import LLMUnavailable, llm_call_checked, llm_call_checked_async
+from llm.async_runtime import run_db
+from llm.erp_tool_agent import call_tool_agent, call_tool_agent_async, execute_tool, plan_tool_call_async, TOOL_FUNCTIONS
+from llm.insight_agent import handle_insight_query, handle_insight_query_stream, plan_insight_query_async, share_response
+from llm.format_response import format_tool_response, format_tool_response_stream
+from llm.fallback_gpt_chat import fallback_gpt_chat, fallback_gpt_chat_stream
+from llm.intent_classifier import get_intent_classifier, log_query, CONFIDENCE_THRESHOLD, LABELS
+from llm.speculation import RoutePrior, Speculation, SPECULATIVE_ROUTING
+from llm.function_router import route_with_function_calling, route_with_function_calling_async
+from llm.command_parser import parse_command
+from llm.single_flight import IDEMPOTENCY_TTL_SECONDS, Interrupted, single_flight
 # client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def classify_query_type(query: str) -> str:
+# "classifier": local/LLM classification then per-route agents
+# "function_calling": one native function-calling response picks route and tool arguments
+ROUTING_MODE = os.getenv("ROUTING_MODE", "classifier")
+
+def _classify_request(query: str) -> dict:
     system_msg = (
         "You're a classifier for an ERP assistant. Respond with only 'action' if the query "
         "involves an order operation like create, cancel, update, return etc. Respond with 'insight' "
@@ -16,8 +27,7 @@ def classify_query_type(query: str) -> str:
 
     user_msg = f"Query:\n{query}\n\nOnly respond with 'action' or 'insight' or 'other'"
 
-    response = client.chat.completions.create(
-        model="gpt-4",
+    return dict(
         messages=[
             {"role": "system", "content": system_msg},
             {"role": "user", "content": user_msg}
@@ -25,58 +35,362 @@ def classify_query_type(query: str) -> str:
         temperature=0,
     )
 
-    return response.choices[0].message.content.strip().lower()
+
+def _parse_label(response) -> str:
+    return response.choices[0].message.content.strip().strip(".'\"").lower()
+
+
+def _check_label(label: str) -> str | None:
+    return None if label in LABELS else f"unknown label '{label}'"
+
+
+def classify_query_type(query: str) -> str:
+    return llm_call_checked("classify", _classify_request(query), _parse_label, _check_label)
+
+
+async def classify_query_type_async(query: str) -> str:
+    return await llm_call_checked_async("classify", _classify_request(query), _parse_label, _check_label)
+
+
+def predict_intent(query: str) -> tuple[str, float]:
+    return get_intent_classifier().predict(query)
+
+
+def intent_probabilities(query: str) -> dict[str, float]:
+    return get_intent_classifier().probabilities(query)
 
 
-def unified_agent(query: str) -> dict:
+def route_query(query: str) -> str:
+    # Local model first; only low-confidence queries pay for the LLM classifier
+    label, confidence = predict_intent(query)
+    if confidence >= CONFIDENCE_THRESHOLD:
+        return label
+
     try:
         task_type = classify_query_type(query)
+    except LLMUnavailable as e:
+        # Degrade to the local model's best guess
+        print(f"[WARN] {e}; using local route '{label}'")
+        return label
+    log_query(query, task_type)
+    return task_type
+
+
+def handle_tool_response(query: str, raw_response) -> dict:
+    # raw_response should be a dict with keys: type, status, message, etc.
+    if not isinstance(raw_response, dict):
+        # fallback if unexpected format
+        return fallback_gpt_chat(query)
+
+    if raw_response.get("type") == "error" or raw_response.get("status") == "failed":
+        error_msg = raw_response.get("message", "")
+        # fallback for unknown tool or None tool error keywords
+        if "unknown tool" in error_msg.lower() or "no valid json" in error_msg.lower():
+            return fallback_gpt_chat(query)
+        return {
+            "type": "error",
+            "status": "failed",
+            "message": f"❌ Tool agent error: {error_msg}"
+        }
+
+    # Successful tool response
+    # Render locally from the action template; GPT only formats unknown shapes
+    formatted = format_tool_response(raw_response)
+    # return {
+    #     "type": "action_response",
+    #     "status": "success",
+    #     "formatted_response": formatted,
+    #     "raw_response": raw_response
+    # }
+    return formatted
+
+
+def handle_insight_response(query: str, insight_response) -> dict:
+    # If insight_response is a dict, pass through; else fallback
+    if isinstance(insight_response, dict):
+        return insight_response
+    else:
+        # fallback to GPT chat if unexpected
+        return fallback_gpt_chat(query)
+
+
+def function_calling_agent(query: str) -> dict:
+    # One LLM response selects the route and the tool arguments together
+    try:
+        routed = route_with_function_calling(query)
     except Exception as e:
         return {
             "type": "error",
             "status": "failed",
-            "message": f"❌ Failed to classify query: {str(e)}"
+            "message": f"❌ Failed to route query: {str(e)}"
         }
 
-    if task_type == "action":
-        raw_response = call_tool_agent(query)
-        # raw_response should be a dict with keys: type, status, message, etc.
-        if not isinstance(raw_response, dict):
-            # fallback if unexpected format
+    if routed["route"] == "action":
+        tool = routed["tool"]
+        if tool not in TOOL_FUNCTIONS:
             return fallback_gpt_chat(query)
-
-        if raw_response.get("type") == "error" or raw_response.get("status") == "failed":
-            error_msg = raw_response.get("message", "")
-            # fallback for unknown tool or None tool error keywords
-            if "unknown tool" in error_msg.lower() or "no valid json" in error_msg.lower():
-                return fallback_gpt_chat(query)
-            return {
+        try:
+            raw_response = execute_tool(tool, routed["parameters"])
+        except Exception as e:
+            raw_response = {
                 "type": "error",
                 "status": "failed",
-                "message": f"❌ Tool agent error: {error_msg}"
+                "message": f"❌ Tool agent execution error: {str(e)}"
             }
+        return handle_tool_response(query, raw_response)
+
+    elif routed["route"] == "insight":
+        question = routed["parameters"].get("question") or query
+        return handle_insight_response(query, handle_insight_query(question))
+
+    else:
+        # The chat pseudo-tool already carries the reply; no second LLM call
+        return routed["parameters"].get("message") or fallback_gpt_chat(query)
+
+
+def fast_path_agent(query: str) -> dict | None:
+    # Confidently parsed commands dispatch straight to the tool; None means "use the agents"
+    parsed = parse_command(query)
+    if parsed is None:
+        return None
+    try:
+        raw_response = execute_tool(parsed["tool"], parsed["parameters"])
+    except Exception as e:
+        raw_response = {
+            "type": "error",
+            "status": "failed",
+            "message": f"❌ Tool agent execution error: {str(e)}"
+        }
+    return handle_tool_response(query, raw_response)
+
+
+def unified_agent(query: str, idempotency_key: str | None = None) -> dict:
+    """idempotency_key: requests with the same key run once (concurrently or within
+    IDEMPOTENCY_TTL_SECONDS) and get that run's reply, so an action is never repeated.
+    Without one only insight work is shared (see llm/insight_agent.py)."""
+    if idempotency_key is not None:
+        return single_flight.do(("request", idempotency_key), _unified_agent, query,
+                                share=share_response, ttl=IDEMPOTENCY_TTL_SECONDS)
+    return _unified_agent(query)
+
+
+def _unified_agent(query: str) -> dict:
+    fast_response = fast_path_agent(query)
+    if fast_response is not None:
+        return fast_response
+
+    if ROUTING_MODE == "function_calling":
+        return function_calling_agent(query)
+
+    try:
+        task_type = route_query(query)
+    except Exception as e:
+        return {
+            "type": "error",
+            "status": "failed",
+            "message": f"❌ Failed to classify query: {str(e)}"
+        }
 
-        # Successful tool response
-        # Format response with GPT for nice output if possible
-        content = raw_response.get("message") or raw_response.get("result") or raw_response
-        formatted = format_response_with_gpt(content)
-        # return {
-        #     "type": "action_response",
-        #     "status": "success",
-        #     "formatted_response": formatted,
-        #     "raw_response": raw_response
-        # }
-        return formatted
+    if task_type == "action":
+        return handle_tool_response(query, call_tool_agent(query))
 
     elif task_type == "insight":
         # Handle insight queries; returns dict or string depending on your implementation
-        insight_response = handle_insight_query(query)
-        # If insight_response is a dict, pass through; else fallback
-        if isinstance(insight_response, dict):
-            return insight_response
-        else:
-            # fallback to GPT chat if unexpected
-            return fallback_gpt_chat(query)
+        return handle_insight_response(query, handle_insight_query(query))
     else:
         # Unknown task type - fallback
         return fallback_gpt_chat(query)
+
+
+# --- Async orchestrator ---
+# Same routing as above for callers on an event loop (see llm/async_runtime.py): LLM
+# calls are awaited, database and tool work runs on the DB thread pool.
+
+# Planning steps that may start before the route is known; they never execute anything
+PLANNERS = {"action": plan_tool_call_async, "insight": plan_insight_query_async}
+# Routes of recent traffic, the prior for which planners are worth starting early
+route_prior = RoutePrior(LABELS)
+
+
+async def route_query_async(query: str):
+    """(route, the route's speculatively started plan or None)."""
+    # The local model may load from disk on first use, so it runs on the pool too
+    probabilities = await run_db(intent_probabilities, query)
+    label = max(probabilities, key=probabilities.get)
+    if probabilities[label] >= CONFIDENCE_THRESHOLD:
+        route_prior.observe(label)
+        return label, None
+
+    # Low confidence: the LLM classifier decides, while the likely routes already plan
+    speculation = None
+    if SPECULATIVE_ROUTING:
+        routes = route_prior.likely_routes(probabilities, PLANNERS)
+        if routes:
+            speculation = Speculation(query, PLANNERS, routes)
+    planned, returned = None, False
+    try:
+        try:
+            task_type = await classify_query_type_async(query)
+        except LLMUnavailable as e:
+            # Degrade to the local model's best guess; a branch planning it is kept
+            print(f"[WARN] {e}; using local route '{label}'")
+            planned = speculation.resolve(label) if speculation is not None else None
+            returned = True
+            return label, planned
+        route_prior.observe(task_type)
+        planned = speculation.resolve(task_type) if speculation is not None else None
+        await run_db(log_query, query, task_type)
+        returned = True
+        return task_type, planned
+    finally:
+        # Failed or cancelled (a client gone, a single-flight waiter leaving; CancelledError
+        # is not an Exception): no branch may keep spending LLM calls
+        if speculation is not None and not returned:
+            speculation.cancel()
+            if planned is not None:
+                planned.cancel()
+
+
+async def stream_text(deltas):
+    # Text deltas as "delta" events, then the whole text as "final"
+    parts = []
+    async for delta in deltas:
+        parts.append(delta)
+        yield {"event": "delta", "text": delta}
+    yield {"event": "final", "response": "".join(parts).strip()}
+
+
+async def handle_tool_response_stream(query: str, raw_response):
+    if not isinstance(raw_response, dict):
+        async for event in stream_text(fallback_gpt_chat_stream(query)):
+            yield event
+        return
+
+    if raw_response.get("type") == "error" or raw_response.get("status") == "failed":
+        error_msg = raw_response.get("message", "")
+        if "unknown tool" in error_msg.lower() or "no valid json" in error_msg.lower():
+            async for event in stream_text(fallback_gpt_chat_stream(query)):
+                yield event
+            return
+        yield {
+            "event": "final",
+            "response": {
+                "type": "error",
+                "status": "failed",
+                "message": f"❌ Tool agent error: {error_msg}"
+            }
+        }
+        return
+
+    async for event in stream_text(format_tool_response_stream(raw_response)):
+        yield event
+
+
+async def execute_tool_async(tool: str, parameters: dict) -> dict:
+    try:
+        return await run_db(execute_tool, tool, parameters)
+    except Exception as e:
+        return {
+            "type": "error",
+            "status": "failed",
+            "message": f"❌ Tool agent execution error: {str(e)}"
+        }
+
+
+async def function_calling_agent_stream(query: str):
+    try:
+        routed = await route_with_function_calling_async(query)
+    except Exception as e:
+        yield {"event": "final", "response": {
+            "type": "error",
+            "status": "failed",
+            "message": f"❌ Failed to route query: {str(e)}"
+        }}
+        return
+
+    if routed["route"] == "action" and routed["tool"] in TOOL_FUNCTIONS:
+        raw_response = await execute_tool_async(routed["tool"], routed["parameters"])
+        events = handle_tool_response_stream(query, raw_response)
+    elif routed["route"] == "insight":
+        events = handle_insight_query_stream(routed["parameters"].get("question") or query)
+    elif routed["route"] == "other" and routed["parameters"].get("message"):
+        # The chat pseudo-tool already carries the reply; no second LLM call
+        events = stream_text(_once(routed["parameters"]["message"]))
+    else:
+        events = stream_text(fallback_gpt_chat_stream(query))
+    async for event in events:
+        yield event
+
+
+async def _once(text: str):
+    yield text
+
+
+async def unified_agent_stream(query: str, idempotency_key: str | None = None):
+    """Async generator of response events for one query:
+    {"event": "delta", "text"} pieces of a text reply as they are generated,
+    {"event": "insight_plan", "summary", "executed_sql"} before an insight's SQL runs,
+    and finally {"event": "final", "response"} with what unified_agent would return.
+
+    idempotency_key: as for unified_agent; a repeated request gets only the final event.
+    """
+    if idempotency_key is None:
+        async for event in _agent_events(query):
+            yield event
+        return
+
+    key = ("request", idempotency_key)
+    flight, leader = single_flight.begin(key)
+    if not leader:
+        yield {"event": "final", "response": await single_flight.wait_async(flight, share_response)}
+        return
+    completed = False
+    try:
+        async for event in _agent_events(query):
+            if event["event"] == "final":
+                # Released as soon as it is known, not when this stream is closed
+                single_flight.complete(key, flight, event["response"], ttl=IDEMPOTENCY_TTL_SECONDS)
+                completed = True
+            yield event
+    finally:
+        if not completed:
+            single_flight.complete(key, flight, error=Interrupted("the original request stopped before its reply"))
+
+
+async def _agent_events(query: str):
+    parsed = parse_command(query)
+    if parsed is not None:
+        # Fast path: confidently parsed commands dispatch straight to the tool
+        raw_response = await execute_tool_async(parsed["tool"], parsed["parameters"])
+        events = handle_tool_response_stream(query, raw_response)
+    elif ROUTING_MODE == "function_calling":
+        events = function_calling_agent_stream(query)
+    else:
+        try:
+            task_type, planned = await route_query_async(query)
+        except Exception as e:
+            yield {"event": "final", "response": {
+                "type": "error",
+                "status": "failed",
+                "message": f"❌ Failed to classify query: {str(e)}"
+            }}
+            return
+
+        # Tools and SQL only ever run here, on the plan of the route that was chosen
+        if task_type == "action":
+            events = handle_tool_response_stream(query, await call_tool_agent_async(query, planned))
+        elif task_type == "insight":
+            events = handle_insight_query_stream(query, planned)
+        else:
+            events = stream_text(fallback_gpt_chat_stream(query))
+    async for event in events:
+        yield event
+
+
+async def unified_agent_async(query: str, idempotency_key: str | None = None) -> dict:
+    """Async unified_agent; many conversations can await it concurrently on one loop."""
+    # Closed here rather than by the garbage collector, which may run after the loop is gone
+    async with aclosing(unified_agent_stream(query, idempotency_key)) as events:
+        async for event in events:
+            if event["event"] == "final":
+                return event["response"]
@@ -0,0 +1,233 @@
+# bulk_orders.py
+# Batched variants of the order tools for imports: one unit of work per batch, with
+# executemany for the sales rows, per-product inventory deltas aggregated with pandas
+# and applied in a single DuckDB UPDATE ... FROM (VALUES ...). Results come back per item.
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import text, bindparam
+from database.db_utils import get_duckdb_conn, sqlite_engine
+from database.unit_of_work import unit_of_work
+from database.inventory import apply_batch
+
+SELECT_SALES = text(
+    "SELECT sale_id, product_id, quantity, order_status FROM sales WHERE sale_id IN :sale_ids"
+).bindparams(bindparam("sale_ids", expanding=True))
+
+
+def _summary(action: str, results: list[dict]) -> dict:
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    if succeeded == len(results):
+        status = "success"
+    elif succeeded:
+        status = "partial"
+    else:
+        status = "failed"
+    return {
+        "type": "action",
+        "action": action,
+        "status": status,
+        "data": {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded},
+        "message": f"✅ {action}: {succeeded}/{len(results)} orders processed."
+    }
+
+
+def _error(action: str, message: str) -> dict:
+    return {"type": "error", "action": action, "status": "failed", "message": message}
+
+
+def _load_sales(sale_ids: list[int]) -> pd.DataFrame:
+    with sqlite_engine.connect() as conn:
+        rows = conn.execute(SELECT_SALES, {"sale_ids": list(sale_ids)}).fetchall()
+    return pd.DataFrame(rows, columns=["sale_id", "product_id", "quantity", "order_status"])
+
+
+def _per_entry(sale_ids: list[int], results: dict) -> list[dict]:
+    # One result per entry of the request, in its order; a repeated id is processed once
+    seen = set()
+    per_entry = []
+    for sale_id in sale_ids:
+        if sale_id in seen:
+            per_entry.append({"sale_id": sale_id, "status": "failed",
+                              "message": f"Sale ID {sale_id} is repeated in this request; only its first entry was processed."})
+        else:
+            seen.add(sale_id)
+            per_entry.append(results[sale_id])
+    return per_entry
+
+
+def _aggregate(frame: pd.DataFrame, qty_column: str = "quantity") -> dict[int, int]:
+    # Vectorized per-product delta
+    return frame.groupby("product_id")[qty_column].sum().astype(int).to_dict()
+
+
+def _transition_sales(action: str, sale_ids: list[int], transition: str, new_status: str,
+                      skip_message, sales: pd.DataFrame | None = None) -> dict:
+    """Shared flow for schedule/complete/cancel: load, validate, batch DuckDB update, executemany."""
+    unique_ids = list(dict.fromkeys(sale_ids))
+    if sales is None:
+        sales = _load_sales(unique_ids)
+    sales = sales.set_index("sale_id", drop=False)
+    results = {}
+    eligible = []
+    for sale_id in unique_ids:
+        if sale_id not in sales.index:
+            results[sale_id] = {"sale_id": sale_id, "status": "failed", "message": f"Sale ID {sale_id} not found."}
+            continue
+        row = sales.loc[sale_id]
+        reason = skip_message(row)
+        if reason:
+            results[sale_id] = {"sale_id": sale_id, "product_id": int(row.product_id),
+                                "status": "failed", "message": reason}
+        else:
+            eligible.append(sale_id)
+    batch = sales.loc[eligible]
+
+    with unit_of_work() as uow:
+        inventory = apply_batch(uow.duckdb, transition, _aggregate(batch))
+        done = batch[batch["product_id"].isin(list(inventory))]
+        if not done.empty:
+            uow.sqlite.execute(
+                text("UPDATE sales SET order_status = :status WHERE sale_id = :sale_id"),
+                [{"status": new_status, "sale_id": int(s)} for s in done["sale_id"]]
+            )
+
+    for row in batch.itertuples(index=False):
+        product_id = int(row.product_id)
+        if product_id in inventory:
+            results[row.sale_id] = {"sale_id": int(row.sale_id), "product_id": product_id,
+                                    "quantity": int(row.quantity), "status": "success",
+                                    "inventory": inventory[product_id]}
+        else:
+            results[row.sale_id] = {"sale_id": int(row.sale_id), "product_id": product_id,
+                                    "status": "failed",
+                                    "message": f"Inventory update rejected for product {product_id}."}
+    return _summary(action, _per_entry(sale_ids, results))
+
+
+def create_orders(orders: list[dict]) -> dict:
+    """orders: [{"product_id": int, "quantity": int}, ...]"""
+    try:
+        if not orders:
+            return _summary("create_orders", [])
+        frame = pd.DataFrame(orders, columns=["product_id", "quantity"])
+        frame["position"] = range(len(frame))
+        results = [None] * len(frame)
+
+        invalid = frame["quantity"].isna() | (frame["quantity"] <= 0)
+        for pos in frame.loc[invalid, "position"]:
+            results[pos] = {"product_id": orders[pos].get("product_id"), "status": "failed",
+                            "message": "Quantity must be a positive integer."}
+        frame = frame[~invalid].astype({"product_id": int, "quantity": int})
+
+        with unit_of_work() as uow:
+            product_ids = frame["product_id"].unique().tolist()
+            prices = dict(uow.duckdb.execute(
+                "SELECT product_id, price FROM product WHERE product_id IN (SELECT UNNEST(?))",
+                [product_ids]
+            ).fetchall()) if product_ids else {}
+
+            known = frame["product_id"].isin(list(prices))
+            for pos, product_id in frame.loc[~known, ["position", "product_id"]].itertuples(index=False):
+                results[pos] = {"product_id": int(product_id), "status": "failed",
+                                "message": f"Product ID {product_id} not found."}
+            frame = frame[known].copy()
+            frame["revenue"] = (frame["product_id"].map(prices) * frame["quantity"]).round(2)
+
+            inventory = apply_batch(uow.duckdb, "commit", _aggregate(frame))
+            stocked = frame["product_id"].isin(list(inventory))
+            for pos, product_id in frame.loc[~stocked, ["position", "product_id"]].itertuples(index=False):
+                results[pos] = {"product_id": int(product_id), "status": "failed",
+                                "message": f"Inventory for Product ID {product_id} not found."}
+            frame = frame[stocked]
+
+            # Inventory is already committed in the same unit, so rows go straight to 'Committed'
+            sale_date = datetime.now().strftime("%Y-%m-%d")
+            if not frame.empty:
+                uow.sqlite.execute(
+                    text("""
+                        INSERT INTO sales (product_id, quantity, sale_date, revenue, order_status)
+                        VALUES (:product_id, :quantity, :sale_date, :revenue, 'Committed')
+                    """),
+                    [{"product_id": int(p), "quantity": int(q), "sale_date": sale_date, "revenue": float(r)}
+                     for p, q, r in frame[["product_id", "quantity", "revenue"]].itertuples(index=False)]
+                )
+                # AUTOINCREMENT ids are consecutive inside this write transaction
+                last_id = uow.sqlite.execute(
+                    text("SELECT seq FROM sqlite_sequence WHERE name = 'sales'")
+                ).scalar()
+
+        first_id = last_id - len(frame) + 1 if not frame.empty else None
+        for offset, row in enumerate(frame.itertuples(index=False)):
+            results[row.position] = {
+                "sale_id": first_id + offset,
+                "product_id": int(row.product_id),
+                "quantity": int(row.quantity),
+                "revenue": float(row.revenue),
+                "status": "success",
+                "inventory": inventory[row.product_id],
+            }
+        return _summary("create_orders", results)
+
+    except Exception as e:
+        return _error("create_orders", f"Bulk order creation failed: {str(e)}")
+
+
+def schedule_orders(sale_ids: list[int]) -> dict:
+    try:
+        unique_ids = list(dict.fromkeys(sale_ids))
+        sales = _load_sales(unique_ids)
+        committed = sales[sales["order_status"].str.lower() == "committed"]
+
+        # Allocate unscheduled committed stock to sales in request order, per product
+        with get_duckdb_conn(read_only=True) as duck_conn:
+            product_ids = committed["product_id"].unique().tolist()
+            headroom = dict(duck_conn.execute(
+                "SELECT product_id, committed_qty - scheduled_qty FROM inventory "
+                "WHERE product_id IN (SELECT UNNEST(?))",
+                [product_ids]
+            ).fetchall()) if product_ids else {}
+
+        schedulable = set()
+        order = {s: i for i, s in enumerate(unique_ids)}
+        for row in committed.sort_values("sale_id", key=lambda s: s.map(order)).itertuples(index=False):
+            if headroom.get(row.product_id, 0) >= row.quantity:
+                headroom[row.product_id] -= row.quantity
+                schedulable.add(row.sale_id)
+
+        def skip_message(row):
+            if row.order_status.lower() != "committed":
+                return f"Sale ID {row.sale_id} is already '{row.order_status}' and cannot be scheduled again."
+            if row.sale_id not in schedulable:
+                return (f"Insufficient committed quantity to schedule sale {row.sale_id}. "
+                        "Refill backorder to proceed.")
+            return None
+
+        return _transition_sales("schedule_orders", sale_ids, "schedule", "Scheduled", skip_message, sales)
+    except Exception as e:
+        return _error("schedule_orders", f"Bulk scheduling failed: {str(e)}")
+
+
+def complete_orders(sale_ids: list[int]) -> dict:
+    try:
+        def skip_message(row):
+            if row.order_status.lower() == "complete":
+                return f"Sale ID {row.sale_id} is already marked as Complete."
+            return None
+
+        return _transition_sales("complete_orders", sale_ids, "complete", "Complete", skip_message)
+    except Exception as e:
+        return _error("complete_orders", f"Bulk completion failed: {str(e)}")
+
+
+def cancel_orders(sale_ids: list[int]) -> dict:
+    try:
+        def skip_message(row):
+            if row.order_status == "Cancel":
+                return f"Sale ID {row.sale_id} is already cancelled."
+            if row.order_status == "Complete":
+                return f"Sale ID {row.sale_id} is completed and cannot be cancelled."
+            return None
+
+        return _transition_sales("cancel_orders", sale_ids, "release", "Cancel", skip_message)
+    except Exception as e:
+        return _error("cancel_orders", f"Bulk cancellation failed: {str(e)}")
@@ -1,15 +1,16 @@
 from sqlalchemy import text
 from datetime import datetime
-from database.db_utils import get_duckdb_conn, sqlite_engine
+from database.unit_of_work import unit_of_work
+from database.inventory import commit_stock
 from tools.debug_logger import debug_log  # your decorator
 
 @debug_log
 def create_order(product_id: int, quantity: int) -> dict:
     try:
-        # Step 1: Read product price from DuckDB
-        with get_duckdb_conn() as duck_con:
+        with unit_of_work() as uow:
+            # Step 1: Read product price from DuckDB
             product_query = "SELECT price FROM product WHERE product_id = ?"
-            result = duck_con.execute(product_query, (product_id,)).fetchone()
+            result = uow.duckdb.execute(product_query, (product_id,)).fetchone()
 
             if not result:
                 return {
@@ -22,28 +23,11 @@ def create_order(product_id: int, quantity: int) -> dict:
             price = result[0]
             revenue = round(price * quantity, 2)
             sale_date = datetime.now().strftime("%Y-%m-%d")
-            order_status = "Open"
 
-            # Step 2: Insert into sales table (SQLite)
-            with sqlite_engine.begin() as sqlite_conn:
-                insert_sale = text("""
-                    INSERT INTO sales (product_id, quantity, sale_date, revenue, order_status)
-                    VALUES (:product_id, :quantity, :sale_date, :revenue, :order_status)
-                """)
-                result = sqlite_conn.execute(insert_sale, {
-                    "product_id": product_id,
-                    "quantity": quantity,
-                    "sale_date": sale_date,
-                    "revenue": revenue,
-                    "order_status": order_status
-                })
-                sale_id = result.lastrowid
+            # Step 2: Commit stock in DuckDB (single UPDATE ... RETURNING)
+            inventory = commit_stock(uow.duckdb, product_id, quantity)
 
-            # Step 3: Update inventory in DuckDB
-            inv_query = "SELECT total_qty, committed_qty FROM inventory WHERE product_id = ?"
-            inv_result = duck_con.execute(inv_query, (product_id,)).fetchone()
-
-            if not inv_result:
+            if not inventory:
                 return {
                     "type": "error",
                     "action": "create_order",
@@ -51,21 +35,24 @@ def create_order(product_id: int, quantity: int) -> dict:
                     "message": f"Inventory for Product ID {product_id} not found."
                 }
 
-            total_qty, committed_qty = inv_result
-            new_committed = committed_qty + quantity
-            new_available = max(0, total_qty - new_committed)
-            backorder_qty = max(0, new_committed - total_qty)
-
-            duck_con.execute("""
-                UPDATE inventory
-                SET committed_qty = ?, available_qty = ?, backorder_qty = ?
-                WHERE product_id = ?
-            """, (new_committed, new_available, backorder_qty, product_id))
+            new_committed = inventory["committed_qty"]
+            new_available = inventory["available_qty"]
+            backorder_qty = inventory["backorder_qty"]
 
-        # Step 4: Update order status to "Committed" in SQLite
-        with sqlite_engine.begin() as sqlite_conn:
-            update_status = text("UPDATE sales SET order_status = :status WHERE rowid = :sale_id")
-            sqlite_conn.execute(update_status, {"status": "Committed", "sale_id": sale_id})
+            # Step 3: Insert into sales table (SQLite). Stock is committed in the same
+            # unit of work, so the sale is written as "Committed" straight away.
+            insert_sale = text("""
+                INSERT INTO sales (product_id, quantity, sale_date, revenue, order_status)
+                VALUES (:product_id, :quantity, :sale_date, :revenue, :order_status)
+            """)
+            result = uow.sqlite.execute(insert_sale, {
+                "product_id": product_id,
+                "quantity": quantity,
+                "sale_date": sale_date,
+                "revenue": revenue,
+                "order_status": "Committed"
+            })
+            sale_id = result.lastrowid
 
         return {
             "type": "action",
@@ -1,7 +1,30 @@
 import functools
+import inspect
 import traceback
 
 def debug_log(func):
+    def on_error(e):
+        print(f"[ERROR] !!! Exception in {func.__name__}: {str(e)}")
+        traceback.print_exc()
+        return {
+            "type": "error",
+            "action": func.__name__,
+            "error": str(e)
+        }
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            print(f"[DEBUG] >>> Calling: {func.__name__}")
+            print(f"[DEBUG] >>> Args: {args}, Kwargs: {kwargs}")
+            try:
+                result = await func(*args, **kwargs)
+                print(f"[DEBUG] <<< Success: {func.__name__} returned: {result}")
+                return result
+            except Exception as e:
+                return on_error(e)
+        return async_wrapper
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         print(f"[DEBUG] >>> Calling: {func.__name__}")
@@ -11,11 +34,5 @@ def debug_log(func):
             print(f"[DEBUG] <<< Success: {func.__name__} returned: {result}")
             return result
         except Exception as e:
-            print(f"[ERROR] !!! Exception in {func.__name__}: {str(e)}")
-            traceback.print_exc()
-            return {
-                "type": "error",
-                "action": func.__name__,
-                "error": str(e)
-            }
+            return on_error(e)
     return wrapper